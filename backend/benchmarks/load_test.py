@@ -0,0 +1,95 @@
+"""
+Concurrency load test for the chat endpoint.
+
+Fires the same batch of questions at increasing concurrency levels and reports
+throughput. With the agent running on the event loop (async nodes, astream),
+throughput should grow with concurrency instead of staying flat.
+
+Usage:
+    python -m benchmarks.load_test --concurrency 1 2 4 8 --requests 16
+"""
+import os
+import time
+import argparse
+import asyncio
+import httpx
+
+
+API_URL = os.getenv("API_URL", "http://localhost:8000/api")
+
+TIMEOUT_SECONDS = 120.0
+USER = "superuser"
+FLEET_ID = "1"
+
+QUESTIONS = [
+    "What is the SOC of vehicle GBM6296G right now?",
+    "How many SRM T3 EVs are in my fleet?",
+    "Did any SRM T3 exceed 33 °C battery temperature in the last 24 h?",
+    "What is the fleet-wide average SOC comfort zone?",
+]
+
+
+async def get_token(client: httpx.AsyncClient) -> str:
+    """Get a JWT for the load test user."""
+    response = await client.post(
+        f"{API_URL}/auth/generate_jwt_token",
+        json={"sub": USER, "fleet_id": FLEET_ID, "exp_hours": 1},
+    )
+    response.raise_for_status()
+    return response.json()["token"]
+
+
+async def ask(client: httpx.AsyncClient, token: str, query: str) -> float:
+    """Send one question and return its latency in seconds."""
+    start = time.perf_counter()
+    response = await client.post(
+        f"{API_URL}/chat/execute_user_query",
+        headers={"Authorization": f"Bearer {token}"},
+        json={"messages": [{"type": "human", "content": query}], "query": query},
+        timeout=httpx.Timeout(TIMEOUT_SECONDS),
+    )
+    response.raise_for_status()
+    return time.perf_counter() - start
+
+
+async def run_level(client: httpx.AsyncClient, token: str, concurrency: int, n_requests: int) -> dict:
+    """Run n_requests questions with at most `concurrency` in flight."""
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def bounded(i: int) -> float:
+        async with semaphore:
+            return await ask(client, token, QUESTIONS[i % len(QUESTIONS)])
+
+    start = time.perf_counter()
+    latencies = await asyncio.gather(*(bounded(i) for i in range(n_requests)))
+    elapsed = time.perf_counter() - start
+
+    latencies = sorted(latencies)
+    return {
+        "concurrency": concurrency,
+        "elapsed_s": elapsed,
+        "throughput_rps": n_requests / elapsed,
+        "p50_s": latencies[len(latencies) // 2],
+        "p95_s": latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))],
+    }
+
+
+async def main(levels: list[int], n_requests: int) -> None:
+    async with httpx.AsyncClient() as client:
+        token = await get_token(client)
+        print(f"{'concurrency':>12} {'elapsed_s':>10} {'req/s':>8} {'p50_s':>8} {'p95_s':>8}")
+        for level in levels:
+            r = await run_level(client, token, level, n_requests)
+            print(
+                f"{r['concurrency']:>12} {r['elapsed_s']:>10.2f} {r['throughput_rps']:>8.3f} "
+                f"{r['p50_s']:>8.2f} {r['p95_s']:>8.2f}"
+            )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load test the chat endpoint at several concurrency levels.")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--requests", type=int, default=16, help="Requests per concurrency level")
+    args = parser.parse_args()
+
+    asyncio.run(main(args.concurrency, args.requests))
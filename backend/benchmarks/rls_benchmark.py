@@ -0,0 +1,119 @@
+"""
+RLS policy benchmark: subquery policies vs denormalized fleet_id equality policies.
+
+Runs the same fleet-scoped aggregates as end_user under both policy styles and
+reports median and p95 latency. The schema must have been set up with
+--denormalize-fleet-id (or DENORMALIZE_FLEET_ID=true) so the fleet_id columns
+exist; the policies in place before the run are restored afterwards.
+
+Usage:
+    python -m benchmarks.rls_benchmark --fleets 1 2 --repeat 20
+"""
+import time
+import argparse
+import asyncio
+import statistics
+from typing import Dict, List
+
+from sqlalchemy import text
+
+from core.db_con import database, engine, tenant_transaction
+from core.setup_database.schema import FLEET_ID_SOURCES, enable_rls
+
+
+ROLE = "end_user"
+
+QUERIES = {
+    "avg_soc": "SELECT AVG(soc_pct) FROM raw_telemetry",
+    "max_temp_per_vehicle": "SELECT vehicle_id, MAX(batt_temp_c) FROM raw_telemetry GROUP BY vehicle_id",
+    "energy_last_month": """
+        SELECT SUM(energy_kwh_15m) FROM processed_metrics
+        WHERE ts >= (SELECT MAX(ts) FROM processed_metrics) - INTERVAL '30 days'
+    """,
+    "trip_distance": "SELECT SUM(distance_km) FROM trips",
+    "open_alerts": "SELECT COUNT(*) FROM alerts WHERE NOT resolved_bool",
+    "driver_trips": "SELECT driver_id, COUNT(*) FROM driver_trip_map GROUP BY driver_id",
+}
+
+
+def uses_denormalized_policies() -> bool:
+    """Whether the vehicle-keyed policies currently compare fleet_id directly."""
+    with engine.connect() as con:
+        qual = con.execute(
+            text("SELECT qual FROM pg_policies WHERE tablename = 'raw_telemetry'")
+        ).scalar()
+    return qual is not None and "vehicle_id" not in qual
+
+
+def has_denormalized_columns() -> bool:
+    with engine.connect() as con:
+        found = con.execute(
+            text("""
+                SELECT COUNT(DISTINCT table_name) FROM information_schema.columns
+                WHERE table_schema = 'public' AND column_name = 'fleet_id'
+                  AND table_name = ANY(:tables)
+            """),
+            {"tables": list(FLEET_ID_SOURCES)}
+        ).scalar()
+    return found == len(FLEET_ID_SOURCES)
+
+
+async def apply_policies(denormalized: bool) -> None:
+    await database.connect()
+    try:
+        for table in FLEET_ID_SOURCES:
+            await enable_rls(database, table, denormalized)
+    finally:
+        await database.disconnect()
+
+
+def time_queries(fleets: List[str], repeat: int) -> Dict[str, List[float]]:
+    """Latency samples in milliseconds per query, over all fleets."""
+    samples = {name: [] for name in QUERIES}
+    for fleet_id in fleets:
+        for name, query in QUERIES.items():
+            # Warm-up run, not timed
+            with tenant_transaction(ROLE, fleet_id) as con:
+                con.execute(text(query)).fetchall()
+            for _ in range(repeat):
+                with tenant_transaction(ROLE, fleet_id) as con:
+                    start = time.perf_counter()
+                    con.execute(text(query)).fetchall()
+                    samples[name].append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def p95(values: List[float]) -> float:
+    return statistics.quantiles(values, n=20)[-1] if len(values) > 1 else values[0]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark RLS-filtered aggregates per policy style.")
+    parser.add_argument("--fleets", nargs="+", default=["1", "2"], help="Fleet ids to query as")
+    parser.add_argument("--repeat", type=int, default=20, help="Timed runs per query and fleet")
+    args = parser.parse_args()
+
+    if not has_denormalized_columns():
+        raise SystemExit(
+            "fleet_id columns missing: run setup_database with --denormalize-fleet-id and re-import first"
+        )
+
+    original = uses_denormalized_policies()
+    results = {}
+    try:
+        for label, denormalized in [("subquery", False), ("equality", True)]:
+            asyncio.run(apply_policies(denormalized))
+            results[label] = time_queries(args.fleets, args.repeat)
+    finally:
+        asyncio.run(apply_policies(original))
+
+    print(f"\n{'query':<22} {'subquery p50':>13} {'p95':>9} {'equality p50':>13} {'p95':>9} {'speedup':>8}")
+    for name in QUERIES:
+        before, after = results["subquery"][name], results["equality"][name]
+        b50, a50 = statistics.median(before), statistics.median(after)
+        print(f"{name:<22} {b50:11.2f}ms {p95(before):7.2f}ms "
+              f"{a50:11.2f}ms {p95(after):7.2f}ms {b50 / a50:7.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+"""
+Offline eval of table selection: local schema retriever vs the LLM.
+
+Each question lists the tables an answer needs; a group like
+("raw_telemetry", "vehicle_latest_state") is satisfied by either table. Recall
+is the share of groups covered by the selected tables. The retriever runs
+locally; --llm also asks the quality model through CallGetSchemaNode (needs
+GROQ_API_KEY and DATABASE_URL) and reports its recall and latency alongside.
+
+Usage:
+    python -m benchmarks.schema_retrieval_eval
+    python -m benchmarks.schema_retrieval_eval --llm
+"""
+import os
+import time
+import argparse
+import asyncio
+import statistics
+from typing import List, Sequence, Tuple
+
+from core.llm_agent.schema_retriever import schema_retriever, SCHEMA_RETRIEVER_MIN_SCORE
+
+
+EVAL_SET: List[Tuple[str, List[Sequence[str]]]] = [
+    ("What is the SOC of vehicle GBM6296G right now?",
+     [("vehicles",), ("vehicle_latest_state", "raw_telemetry")]),
+    ("How many SRM T3 EVs are in my fleet?",
+     [("vehicles",)]),
+    ("Did any SRM T3 exceed 33 °C battery temperature in the last 24 h?",
+     [("vehicles",), ("raw_telemetry", "vehicle_daily_battery_temp")]),
+    ("What is the fleet-wide average SOC comfort zone?",
+     [("fleet_daily_summary", "processed_metrics")]),
+    ("Which vehicles spent > 20 % time in the 90-100 % SOC band this week?",
+     [("vehicles",), ("vehicle_daily_soc_band", "processed_metrics")]),
+    ("How many vehicles are currently driving with SOC < 30 %?",
+     [("vehicle_latest_state", "raw_telemetry")]),
+    ("What is the total km and driving hours by my fleet over the past 7 days?",
+     [("vehicle_daily_usage", "trips")]),
+    ("Which are the most-used and least-used vehicles this month?",
+     [("vehicles",), ("vehicle_daily_usage", "trips")]),
+    ("Which driver did the most trips last month?",
+     [("drivers",), ("driver_trip_map",), ("trips",)]),
+    ("How much did maintenance cost per vehicle this year?",
+     [("maintenance_logs",), ("vehicles",)]),
+    ("Which alerts are still unresolved?",
+     [("alerts",)]),
+    ("List critical alerts for vehicle LDN8888 in the last week",
+     [("alerts",), ("vehicles",)]),
+    ("How much energy was delivered by charging sessions at each location?",
+     [("charging_sessions",)]),
+    ("What is the average charging session duration per vehicle?",
+     [("charging_sessions",), ("vehicles",)]),
+    ("Which vehicles have a state of health below 90%?",
+     [("vehicles",), ("battery_cycles", "processed_metrics")]),
+    ("What was the average depth of discharge per battery cycle last month?",
+     [("battery_cycles",)]),
+    ("How long did vehicles stay inside each geofence?",
+     [("geofence_events",)]),
+    ("What is the average trip distance and idle time per vehicle?",
+     [("trips", "vehicle_daily_usage"), ("vehicles",)]),
+    ("Where is vehicle BXD1234A right now?",
+     [("vehicles",), ("vehicle_latest_state", "raw_telemetry")]),
+    ("What was the maximum battery temperature per day last week?",
+     [("vehicle_daily_battery_temp", "raw_telemetry")]),
+    ("How many active vehicles did the fleet have each day?",
+     [("fleet_daily_summary",)]),
+    ("When were the drivers in my fleet hired?",
+     [("drivers",)]),
+    ("What is the average speed of each vehicle over the last 15 minutes windows today?",
+     [("processed_metrics", "raw_telemetry")]),
+    ("Which time zone is my fleet in?",
+     [("fleets",)]),
+]
+
+
+def recall(selected: Sequence[str], groups: List[Sequence[str]]) -> float:
+    return sum(1 for group in groups if set(group) & set(selected)) / len(groups)
+
+
+def run_retriever() -> Tuple[List[List[str]], List[float], List[float]]:
+    """Selected tables, confidence and latency (microseconds) per question."""
+    selections, confidences, latencies = [], [], []
+    for question, _ in EVAL_SET:
+        start = time.perf_counter()
+        retrieval = schema_retriever.retrieve(question)
+        latencies.append((time.perf_counter() - start) * 1e6)
+        selections.append(retrieval.tables)
+        confidences.append(retrieval.confidence)
+    return selections, confidences, latencies
+
+
+async def run_llm() -> Tuple[List[List[str]], List[float]]:
+    """Tables picked by the quality model, and latency (milliseconds) per question."""
+    from langchain_groq import ChatGroq
+    from core.llm_agent.nodes import CallGetSchemaNode
+    from core.llm_agent.tools import create_sql_tools
+    from core.llm_agent.schema_catalog import schema_catalog
+    from core.llm_agent.result_cache import result_cache
+    from core.llm_agent.utils import get_model_config, MODELS
+
+    config = get_model_config(MODELS["quality"])
+    llm = ChatGroq(model=config["model"], temperature=config["temperature"],
+                   max_tokens=config["max_tokens"], api_key=os.getenv("GROQ_API_KEY"))
+    _, get_schema_tool, _ = create_sql_tools(schema_catalog, result_cache)
+    node = CallGetSchemaNode(llm, get_schema_tool)
+
+    selections, latencies = [], []
+    for question, _ in EVAL_SET:
+        start = time.perf_counter()
+        result = await node({"messages": [{"role": "user", "content": question}]})
+        latencies.append((time.perf_counter() - start) * 1000)
+        tool_calls = result["messages"][-1].tool_calls
+        table_names = tool_calls[0]["args"].get("table_names", "") if tool_calls else ""
+        selections.append([t.strip() for t in table_names.split(",") if t.strip()])
+    return selections, latencies
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Compare table selection recall: retriever vs LLM.")
+    parser.add_argument("--llm", action="store_true", help="Also query the LLM (network, API key)")
+    args = parser.parse_args()
+
+    local, confidences, local_us = run_retriever()
+    llm, llm_ms = asyncio.run(run_llm()) if args.llm else (None, None)
+
+    print(f"\n{'recall':>6} {'conf':>5}  {'retriever tables':<55} {'llm':>6}  question")
+    for i, (question, groups) in enumerate(EVAL_SET):
+        flag = "" if confidences[i] >= SCHEMA_RETRIEVER_MIN_SCORE else " (llm fallback)"
+        llm_recall = f"{recall(llm[i], groups):6.2f}" if llm else f"{'-':>6}"
+        print(f"{recall(local[i], groups):6.2f} {confidences[i]:5.2f}  "
+              f"{', '.join(local[i]) + flag:<55} {llm_recall}  {question}")
+
+    local_recall = statistics.mean(recall(s, g) for s, (_, g) in zip(local, EVAL_SET))
+    print(f"\nRetriever: recall {local_recall:.3f}, "
+          f"avg {statistics.mean(len(s) for s in local):.1f} tables, "
+          f"median {statistics.median(local_us):.0f}us per question")
+    if llm:
+        llm_recall = statistics.mean(recall(s, g) for s, (_, g) in zip(llm, EVAL_SET))
+        agreement = statistics.mean(
+            len(set(a) & set(b)) / len(set(a) | set(b)) if set(a) | set(b) else 1.0
+            for a, b in zip(local, llm)
+        )
+        print(f"LLM:       recall {llm_recall:.3f}, "
+              f"avg {statistics.mean(len(s) for s in llm):.1f} tables, "
+              f"median {statistics.median(llm_ms):.0f}ms per question")
+        print(f"Table-set agreement (Jaccard): {agreement:.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+"""
+Agent topology benchmark: multi_step vs single_shot on the mandatory query suite.
+
+Runs each question of tests/test_mandatory_queries.py in-process through both
+graphs and reports latency, model calls, tokens (from the providers' usage
+metadata, collected by a callback on every model call) and accuracy, using the same expected-element checks as the tests.
+The template fast path is disabled and the query cache is a throwaway file
+cleared before every run, so each answer goes through the models.
+Needs GROQ_API_KEY and DATABASE_URL.
+
+Usage:
+    python -m benchmarks.topology_benchmark --fleet 2 --repeat 3
+"""
+import os
+import re
+import time
+import argparse
+import asyncio
+import tempfile
+import statistics
+import threading
+from typing import Any, Dict, List
+
+# Measure the model path only; must be set before the agent modules are imported
+os.environ["FAST_PATH_ENABLED"] = "false"
+os.environ["QUERY_CACHE_PATH"] = os.path.join(tempfile.mkdtemp(), "query_cache.sqlite3")
+
+from langchain_core.callbacks import UsageMetadataCallbackHandler
+from langchain_core.outputs import LLMResult
+
+from core.llm_agent.agent import AGENT_TOPOLOGIES
+from core.llm_agent.agent_manager import get_or_create_agent_for_fleet
+from core.llm_agent.query_cache import query_cache
+from core.llm_agent.result_cache import result_cache
+
+
+ROLE = "superuser"
+
+# (question, pattern the lowercased answer must match), as in the mandatory query tests
+SUITE = [
+    ("What is the SOC of vehicle GBM6296G right now?", r"soc|%"),
+    ("How many SRM T3 EVs are in my fleet?", r"no|\d"),
+    ("Did any SRM T3 exceed 33 °C battery temperature in the last 24 h?", r"yes|no"),
+    ("What is the fleet-wide average SOC comfort zone?", r"%|-|to"),
+    ("Which vehicles spent > 20 % time in the 90-100 % SOC band this week?", r"vehicle|gbm|registration"),
+    ("How many vehicles are currently driving with SOC < 30 %?", r"no|\d"),
+    ("What is the total km and driving hours by my fleet over the past 7 days, "
+     "and which are the most-used & least-used vehicles?", r"km|hour|hrs"),
+]
+
+
+class UsageCounter(UsageMetadataCallbackHandler):
+    """
+    Token usage summed over every model call of a run, plus the number of calls.
+    Counted as the calls finish rather than from the final state, where a message
+    replaced under the same id (the checked query in multi_step) takes the
+    usage of the call that wrote it along.
+    """
+
+    def __init__(self) -> None:
+        super().__init__()
+        self._calls_lock = threading.Lock()
+        self.calls = 0
+
+    def on_llm_end(self, response: LLMResult, **kwargs: Any) -> None:
+        super().on_llm_end(response, **kwargs)
+        with self._calls_lock:
+            self.calls += 1
+
+    def total(self, key: str) -> int:
+        return sum(usage.get(key, 0) for usage in self.usage_metadata.values())
+
+
+async def run_question(agent, question: str) -> Dict:
+    """One cold run: latency, model calls and tokens, and the final answer."""
+    query_cache.clear()
+    result_cache.invalidate()
+    usage = UsageCounter()
+    start = time.perf_counter()
+    state = await agent.ainvoke(
+        {"messages": [{"type": "human", "content": question}]},
+        config={"callbacks": [usage]},
+    )
+    elapsed = time.perf_counter() - start
+
+    return {
+        "latency_s": elapsed,
+        "llm_calls": usage.calls,
+        "input_tokens": usage.total("input_tokens"),
+        "output_tokens": usage.total("output_tokens"),
+        "answer": state["messages"][-1].content,
+    }
+
+
+async def run_topology(topology: str, fleet_id: str, repeat: int) -> List[Dict]:
+    agent = await get_or_create_agent_for_fleet(fleet_id, ROLE, topology=topology)
+    runs = []
+    for question, expected in SUITE:
+        for _ in range(repeat):
+            try:
+                run = await run_question(agent, question)
+                run["correct"] = bool(re.search(expected, run["answer"].lower()))
+            except Exception as e:
+                print(f"[{topology}] failed on {question!r}: {e}")
+                run = {"latency_s": float("nan"), "llm_calls": 0, "input_tokens": 0,
+                       "output_tokens": 0, "answer": "", "correct": False}
+            run["question"] = question
+            runs.append(run)
+    return runs
+
+
+def summarize(topology: str, runs: List[Dict]) -> None:
+    latencies = [r["latency_s"] for r in runs if r["latency_s"] == r["latency_s"]]
+    p95 = statistics.quantiles(latencies, n=20)[-1] if len(latencies) > 1 else latencies[0]
+    print(f"{topology:<12} {statistics.median(latencies):8.2f}s {p95:8.2f}s "
+          f"{statistics.mean(r['llm_calls'] for r in runs):7.1f} "
+          f"{statistics.mean(r['input_tokens'] for r in runs):9.0f} "
+          f"{statistics.mean(r['output_tokens'] for r in runs):9.0f} "
+          f"{sum(r['correct'] for r in runs) / len(runs):8.0%}")
+
+
+async def main(fleet_id: str, repeat: int) -> None:
+    results = {topology: await run_topology(topology, fleet_id, repeat) for topology in AGENT_TOPOLOGIES}
+
+    print(f"\n{'question':<60} " + " ".join(f"{t:>12}" for t in AGENT_TOPOLOGIES))
+    for i, (question, _) in enumerate(SUITE):
+        cells = []
+        for topology in AGENT_TOPOLOGIES:
+            runs = results[topology][i * repeat:(i + 1) * repeat]
+            cells.append(f"{statistics.median(r['latency_s'] for r in runs):6.2f}s "
+                         f"{sum(r['correct'] for r in runs)}/{repeat}")
+        print(f"{question[:60]:<60} " + " ".join(f"{c:>12}" for c in cells))
+
+    print(f"\n{'topology':<12} {'p50':>9} {'p95':>9} {'calls':>7} {'in tok':>9} {'out tok':>9} {'accuracy':>8}")
+    for topology, runs in results.items():
+        summarize(topology, runs)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark agent topologies on the mandatory query suite.")
+    parser.add_argument("--fleet", default="2", help="Fleet id to ask as (the tests use 2)")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per question and topology")
+    args = parser.parse_args()
+
+    asyncio.run(main(args.fleet, args.repeat))
@@ -0,0 +1,230 @@
+import os
+import time
+import asyncio
+import threading
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Iterable, List, Optional
+
+
+_MISSING = object()
+
+# Postgres NOTIFY channel on which table triggers announce data changes (payload: table name)
+DATA_CHANGE_CHANNEL = "data_changed"
+DATA_CHANGE_RECONNECT_SEC = float(os.getenv("DATA_CHANGE_RECONNECT_SEC", "5"))
+
+# Callbacks run when table data or schema changes, e.g. after import_data
+_data_change_listeners: List[Callable[[Optional[List[str]]], None]] = []
+
+
+def on_data_change(listener: Callable[[Optional[List[str]]], None]):
+    """Register a listener called with the changed table names (None = everything)."""
+    _data_change_listeners.append(listener)
+    return listener
+
+
+def notify_data_changed(tables: Optional[Iterable[str]] = None) -> None:
+    """Tell in-process caches that the given tables (or all tables) changed."""
+    tables = list(tables) if tables is not None else None
+    for listener in _data_change_listeners:
+        listener(tables)
+
+
+async def _relay_notifications(engine, channel: str) -> None:
+    """LISTEN on one dedicated connection and pass notified tables on until the connection fails."""
+    pooled = engine.raw_connection()
+    con = pooled.driver_connection
+    pooled.detach()  # Held for the process lifetime, so keep it out of the pool
+    loop = asyncio.get_running_loop()
+    lost = loop.create_future()
+
+    def on_readable() -> None:
+        try:
+            con.poll()
+        except Exception as e:
+            if not lost.done():
+                lost.set_exception(e)
+            return
+        # Statements in one transaction notify once per table; a burst of commits arrives together
+        tables = sorted({n.payload for n in con.notifies})
+        con.notifies.clear()
+        if tables:
+            print(f"Data changed in {', '.join(tables)}")
+            notify_data_changed(tables)
+
+    fd = con.fileno()
+    try:
+        con.autocommit = True
+        con.cursor().execute(f"LISTEN {channel}")
+        loop.add_reader(fd, on_readable)
+        try:
+            await lost
+        finally:
+            loop.remove_reader(fd)
+    finally:
+        con.close()
+
+
+async def listen_for_data_changes(engine, channel: str = DATA_CHANGE_CHANNEL,
+                                  reconnect_sec: float = DATA_CHANGE_RECONNECT_SEC) -> None:
+    """
+    Background task for the API process: relay data changes committed by other
+    processes (import_data, the rollups CLI, any ingest writing the tables) to
+    this process's listeners. Table triggers NOTIFY the channel, so nothing is
+    polled and notifications arrive only once their transaction commits.
+    Changes made while the connection was down are unknown, so a reconnect
+    invalidates everything.
+    """
+    while True:
+        try:
+            await _relay_notifications(engine, channel)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"Data change listener disconnected: {e}")
+        await asyncio.sleep(reconnect_sec)
+        notify_data_changed()
+
+
+class TTLCache:
+    """
+    Size-bounded LRU cache with optional per-entry TTL.
+
+    Thread-safe for get/set (tool calls run in executor threads), and offers an
+    async get_or_create() that coalesces concurrent builds of the same key into
+    one, so two requests for a cold key share a single build. With a weigher, it
+    also tracks the total weight of its values and evicts past max_weight.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        maxsize: int = 128,
+        ttl: Optional[float] = None,
+        weigher: Optional[Callable[[Any], int]] = None,
+        max_weight: Optional[int] = None,
+    ):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        # Optional size accounting, e.g. bytes held, with an upper bound
+        self.weigher = weigher
+        self.max_weight = max_weight
+        self.weight = 0
+        self._data: "OrderedDict[Hashable, tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.coalesced = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return self.get(key, _MISSING, count=False) is not _MISSING
+
+    def get(self, key: Hashable, default: Any = None, count: bool = True) -> Any:
+        """Return the cached value (marking it recently used) or default."""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at and expires_at < time.monotonic():
+                    self._remove(key)
+                    self.expirations += 1
+                else:
+                    self._data.move_to_end(key)
+                    if count:
+                        self.hits += 1
+                    return value
+            if count:
+                self.misses += 1
+            return default
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        """Insert or replace a value, evicting least-recently-used entries past maxsize."""
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = time.monotonic() + ttl if ttl else 0.0
+        with self._lock:
+            if key in self._data:
+                self._remove(key)
+            self._data[key] = (expires_at, value)
+            if self.weigher:
+                self.weight += self.weigher(value)
+            while len(self._data) > self.maxsize or (
+                self.max_weight is not None and self.weight > self.max_weight and len(self._data) > 1
+            ):
+                self._remove(next(iter(self._data)))
+                self.evictions += 1
+
+    def _remove(self, key: Hashable) -> Any:
+        """Delete an entry and release its weight. Caller holds the lock."""
+        _, value = self._data.pop(key)
+        if self.weigher:
+            self.weight -= self.weigher(value)
+        return value
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            return self._remove(key) if key in self._data else default
+
+    def invalidate(self, predicate: Callable[[Hashable, Any], bool]) -> int:
+        """Drop every entry for which predicate(key, value) is true. Returns the count dropped."""
+        with self._lock:
+            stale = [k for k, (_, v) in self._data.items() if predicate(k, v)]
+            for k in stale:
+                self._remove(k)
+            return len(stale)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self.weight = 0
+
+    def values(self) -> list:
+        with self._lock:
+            return [v for _, v in self._data.values()]
+
+    async def get_or_create(self, key: Hashable, factory: Callable[[], Awaitable[Any]]) -> Any:
+        """Return the cached value for key, building it with factory() at most once at a time."""
+        value = self.get(key, _MISSING)
+        if value is not _MISSING:
+            return value
+
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            self.coalesced += 1
+            return await asyncio.shield(inflight)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            value = await factory()
+            self.set(key, value)
+            future.set_result(value)
+            return value
+        except BaseException as e:
+            future.set_exception(e)
+            future.exception()  # Mark retrieved when nobody else is waiting
+            raise
+        finally:
+            self._inflight.pop(key, None)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "name": self.name,
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "coalesced": self.coalesced,
+            "weight": self.weight if self.weigher else None,
+            "max_weight": self.max_weight,
+        }
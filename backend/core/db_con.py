@@ -1,10 +1,13 @@
 import os
 import ssl
+from contextlib import contextmanager
 from databases import Database
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, text
 from typing import Optional, Union
 import time
 
+from core.setup_database.roles import APP_ROLES
+
 
 def get_database_url() -> str:
     url = os.getenv("DATABASE_URL")
@@ -62,5 +65,28 @@ def create_connection(
 database, engine = create_connection()
 
 
+def scope_to_tenant(con, role: str, fleet_id: str, statement_timeout_ms: int = 10000) -> None:
+    """Apply a tenant's role, fleet_id and statement timeout to the current transaction only."""
+    if role not in APP_ROLES:
+        raise ValueError(f"Unknown role: {role}")
+
+    con.execute(text(f"SET LOCAL statement_timeout = {int(statement_timeout_ms)}"))
+    con.execute(text(f'SET LOCAL ROLE "{role}"'))
+    con.execute(
+        text("SELECT set_config('app.fleet_id', :fleet_id, true)"),
+        {"fleet_id": str(fleet_id)}
+    )
+
 
+@contextmanager
+def tenant_transaction(role: str, fleet_id: str, statement_timeout_ms: int = 10000):
+    """
+    Open a transaction scoped to a tenant: SET LOCAL ROLE and a transaction-local
+    app.fleet_id, so RLS applies and nothing leaks back to the pooled connection.
+    """
+    if role not in APP_ROLES:
+        raise ValueError(f"Unknown role: {role}")
 
+    with engine.begin() as con:
+        scope_to_tenant(con, role, fleet_id, statement_timeout_ms)
+        yield con
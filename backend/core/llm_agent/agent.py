@@ -1,52 +1,99 @@
 import os
+import asyncio
 from langgraph.graph import START, END, MessagesState, StateGraph
 from langgraph.prebuilt import ToolNode
 from langchain_groq import ChatGroq
-from langchain_community.agent_toolkits import SQLDatabaseToolkit
 from core.llm_agent.nodes import (
+    FastPathNode,
+    LookupCachedQueryNode,
+    StoreCachedQueryNode,
     ListTablesNode,
     CallGetSchemaNode,
+    RetrieveSchemaNode,
     GenerateQueryNode,
     CheckQueryNode,
+    GenerateCheckedQueryNode,
+    AnswerNode,
+    is_query_result,
     should_continue,
+    route_cached_query,
+    route_fast_path,
+    route_generated_query,
+    route_query_result,
 )
-from core.llm_agent.utils import handle_empty_results, get_model_config, MODELS
-from sqlalchemy import text
+from core.llm_agent.tools import create_sql_tools
+from core.llm_agent.schema_catalog import schema_catalog
+from core.llm_agent.query_cache import query_cache
+from core.llm_agent.result_cache import result_cache
+from core.llm_agent.templates import FAST_PATH_ENABLED
+from core.llm_agent.schema_retriever import schema_retriever
+from core.llm_agent.sql_validator import SQLValidator
+from core.llm_agent.utils import get_model_config, MODELS
+from sqlalchemy.engine import Engine
 
 
-async def build_agent(db, llm) -> StateGraph:
+# multi_step: schema selection, generation, check and answer as separate steps
+# single_shot: one structured-output call writes checked SQL, one fast call answers
+AGENT_TOPOLOGIES = ["multi_step", "single_shot"]
+AGENT_TOPOLOGY = os.getenv("AGENT_TOPOLOGY", "multi_step")
+
+
+async def build_agent(engine: Engine, llm, topology: str = AGENT_TOPOLOGY) -> StateGraph:
     """
     Build an SQL agent with langgraph.
+    The compiled graph is tenant-agnostic: invoke it with
+    config={"configurable": {"role": ..., "fleet_id": ...}} and the SQL tools
+    scope their transactions to that role and fleet.
     Nodes flow summary:
+    F. Fast Path (No LLM involved)
+          Questions matching a known template (vehicle SOC, model counts,
+          thresholds over a time window, ...) run prevalidated parameterized
+          SQL and get a templated answer, ending the process.
+    0. Lookup Cached Query (No LLM involved)
+          Repeat questions (same normalized text, fleet and schema version) reuse
+          the stored checked SQL and jump straight to Run Query.
     1. List Tables (No LLM involved)
           Agent lists all tables in the database using the list_tables node. 
-          This step simply queries the database and does not involve the LLM.
+          Served from the in-memory schema catalog; no LLM or database round-trip.
     2. Call Get Schema 
-          LLM decides which table schemas are relevant.
-          Force LLM output to be schemas tool call.
+          A local TF-IDF retriever ranks the tables for the question (no LLM).
+          If it is unsure (or SCHEMA_RETRIEVER_MODE=llm), the LLM decides which
+          table schemas are relevant, forced to output a schemas tool call.
     3. Get Schema (No LLM involved)
-          Simply executes schemas tool, outputs schemas tool message
+          Simply executes schemas tool, outputs schemas tool message.
+          DDL and per-tenant sample rows come from the schema catalog.
     4. Generate Query
           LLM takes in schemas tool message. It either:
           - Generates final NL answer (no tool call), ending the process, or
           - Generates sql_db_query tool call, to be checked.
     5. Check Query 
-          LLM revises query.
-          Force LLM output to be sql_db_query tool call.
+          A local static validator parses the query, resolves tables and columns,
+          enforces read-only and fixes common mistakes (= NULL, NOT IN with NULLs,
+          BETWEEN bounds, literal types) itself. Only problems it cannot fix (or
+          SQL_VALIDATOR_MODE=llm) go to the LLM, which revises the query and is
+          forced to output a sql_db_query tool call.
     6. Run Query 
           Simply executes run_query tool, outputs run_query tool message.
+          Successful SQL is stored in the query cache (store_query).
           Loop back to generate_query node.
-    """
 
-    # Initialize sql prebuilt_tools
-    prebuilt_tools = SQLDatabaseToolkit(db=db, llm=llm).get_tools()
-    list_tables_tool = next(t for t in prebuilt_tools if t.name == "sql_db_list_tables")
-    get_schema_tool = next(t for t in prebuilt_tools if t.name == "sql_db_schema")
-    run_query_tool = next(t for t in prebuilt_tools if t.name == "sql_db_query")
+    With topology="single_shot", steps 1-5 collapse into one call:
+    S1. Generate SQL
+          Tables come from the local schema retriever, and their cached schemas
+          are inlined into one quality-model call that returns checked SQL as
+          structured output. A failed query gets one repair attempt.
+    S2. Run Query, as in step 6.
+    S3. Answer
+          One fast-model call phrases the answer from the question, SQL and rows.
+    """
+    if topology not in AGENT_TOPOLOGIES:
+        raise ValueError(f"Unknown agent topology '{topology}', expected one of {AGENT_TOPOLOGIES}")
 
-    # Patch to gracefully handle empty results 
-    original_run = run_query_tool._run
-    run_query_tool._run = handle_empty_results(original_run)
+    # Initialize tenant-aware sql tools, served from the cached schema catalog and result cache
+    # (table reflection is a blocking engine round-trip, keep it off the event loop)
+    await asyncio.to_thread(schema_catalog.ensure_loaded)
+    list_tables_tool, get_schema_tool, run_query_tool = create_sql_tools(schema_catalog, result_cache)
+    dialect = engine.dialect.name
 
 
     # Use fast LLM for NL answer generation
@@ -60,41 +107,57 @@ async def build_agent(db, llm) -> StateGraph:
 
     # Build state graph
     builder = StateGraph(MessagesState)  #TODO: Human in loop
-    builder.add_node("list_tables", ListTablesNode(list_tables_tool))
-    builder.add_node("call_get_schema", CallGetSchemaNode(llm, get_schema_tool))
-    builder.add_node("get_schema", ToolNode([get_schema_tool], name="get_schema"))
-#     builder.add_node("generate_query", GenerateQueryNode(db, llm, run_query_tool))
-    builder.add_node("generate_query", GenerateQueryNode(db, llm, fast_llm, run_query_tool))
-    builder.add_node("check_query", CheckQueryNode(db, llm, run_query_tool))
+    builder.add_node("fast_path", FastPathNode())
+    builder.add_node("lookup_cached_query", LookupCachedQueryNode(query_cache))
     builder.add_node("run_query", ToolNode([run_query_tool], name="run_query"))
+    builder.add_node("store_query", StoreCachedQueryNode(query_cache))
+
+    if FAST_PATH_ENABLED:
+        builder.add_edge(START, "fast_path")
+        builder.add_conditional_edges("fast_path", route_fast_path)
+    else:
+        builder.add_edge(START, "lookup_cached_query")
+    builder.add_edge("run_query", "store_query")
 
-    builder.add_edge(START, "list_tables")
+    if topology == "single_shot":
+        builder.add_node("generate_sql", GenerateCheckedQueryNode(dialect, llm, schema_catalog, schema_retriever))
+        builder.add_node("answer", AnswerNode(fast_llm))
+
+        builder.add_conditional_edges(
+            "lookup_cached_query", route_cached_query,
+            {"run_query": "run_query", "list_tables": "generate_sql"}
+        )
+        builder.add_conditional_edges("generate_sql", route_generated_query)
+        builder.add_conditional_edges("store_query", route_query_result)
+        builder.add_edge("answer", END)
+        return builder.compile()
+
+    builder.add_node("list_tables", ListTablesNode(list_tables_tool))
+    builder.add_node("call_get_schema", RetrieveSchemaNode(
+        schema_retriever, CallGetSchemaNode(llm, get_schema_tool)
+    ))
+    builder.add_node("get_schema", ToolNode([get_schema_tool], name="get_schema"))
+    builder.add_node("generate_query", GenerateQueryNode(dialect, llm, fast_llm, run_query_tool))
+    builder.add_node("check_query", CheckQueryNode(dialect, llm, run_query_tool, SQLValidator(schema_catalog, dialect)))
+    builder.add_conditional_edges("lookup_cached_query", route_cached_query)
     builder.add_edge("list_tables", "call_get_schema")
     builder.add_edge("call_get_schema", "get_schema")
     builder.add_edge("get_schema", "generate_query")
     builder.add_conditional_edges("generate_query", should_continue)
     builder.add_edge("check_query", "run_query")
     
-    # Add conditional edge from run_query to either END or generate_query
+    # Add conditional edge from run_query (via store_query) to either END or generate_query
     def should_continue_after_query(state: MessagesState):
         """After running a query, check if we should continue or end."""
         last_message = state["messages"][-1]
-        # Check if the last message is a tool result (indicating we need to generate final answer)
-        is_tool_result = (
-            hasattr(last_message, 'content') and 
-            last_message.content and 
-            isinstance(last_message.content, str) and
-            ('[' in last_message.content and ']' in last_message.content)  # Tool result format
-        )
-        
-        if is_tool_result:
-            # Continue to generate_query to create natural language response
+        # A query result (rows, a sample of them, no data or an error) still needs an answer
+        if is_query_result(last_message):
             return "generate_query"
         else:
             # It's already a natural language response, end
             return END
     
-    builder.add_conditional_edges("run_query", should_continue_after_query)
+    builder.add_conditional_edges("store_query", should_continue_after_query)
 
     agent = builder.compile()
     return agent
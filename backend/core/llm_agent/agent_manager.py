@@ -1,77 +1,68 @@
 import os
 import traceback
-from typing import Dict, Any, Tuple
+from typing import Dict, Any, Optional
 
-from langchain_community.utilities import SQLDatabase
 from langchain_groq import ChatGroq
 # from langchain.chat_models import init_chat_model  # [MISTRAL]
-from sqlalchemy import text
 
-from core.llm_agent.agent import build_agent
-from core.llm_agent.utils import get_model_config, MODELS
+from core.llm_agent.agent import build_agent, AGENT_TOPOLOGY
+from core.llm_agent.utils import get_model_config, DEFAULT_MODEL
 from core.db_con import engine
+from core.setup_database.roles import APP_ROLES
+from core.cache import TTLCache
 
 
-# Global cache for fleet-based agent instances and their databases
-_fleet_agent_cache: Dict[str, Tuple[Any, SQLDatabase]] = {}
+# One compiled graph per model and topology, shared by every fleet and role.
+# Tenant context is bound per request through the run config.
+AGENT_CACHE_MAX_SIZE = int(os.getenv("AGENT_CACHE_MAX_SIZE", "8"))
+
+_agent_cache = TTLCache("agents", maxsize=AGENT_CACHE_MAX_SIZE)
 
 
 def clear_agent_cache():
     """Clear the agent cache to force fresh connections."""
-    global _fleet_agent_cache
-    _fleet_agent_cache.clear()
+    _agent_cache.clear()
     print("Agent cache cleared")
 
 
+def get_agent_cache_stats() -> Dict[str, Any]:
+    """Hit/miss/eviction counters for the agent cache."""
+    return _agent_cache.stats()
+
+
+async def get_agent(model_name: str = DEFAULT_MODEL, topology: str = AGENT_TOPOLOGY):
+    """Get the shared compiled agent graph for a model and topology, building it once."""
+
+    async def build():
+        print(f"Creating new agent: {model_name} ({topology})")
+        try:
+            model_config = get_model_config(model_name)
+            llm = ChatGroq(
+                model=model_config["model"],
+                temperature=model_config["temperature"],
+                max_tokens=model_config["max_tokens"],
+                api_key=os.getenv("GROQ_API_KEY")
+            )
+            return await build_agent(engine, llm, topology)
+
+        except Exception as e:
+            print(f"Error creating agent: {e}")
+            print(f"Traceback: {traceback.format_exc()}")
+            raise e
+
+    return await _agent_cache.get_or_create((model_name, topology), build)
+
+
+def tenant_config(fleet_id: str, user: str) -> Dict[str, Any]:
+    """Run config carrying the tenant context read by the SQL tools."""
+    if user not in APP_ROLES:
+        raise ValueError(f"Unknown role: {user}")
+    return {"configurable": {"role": user, "fleet_id": fleet_id}}
+
+
 async def get_or_create_agent_for_fleet(
-    fleet_id: str, user: str, model_name: str = "llama-3.3-70b-versatile"
+    fleet_id: str, user: str, model_name: str = DEFAULT_MODEL, topology: Optional[str] = None
 ):
-    """Get cached LLM agent for fleet or create new one."""
-    cache_key = f"fleet_{fleet_id}:{user}:{model_name}"
-
-    # Clear cache if this is a different fleet than what's cached
-    cached_fleets = [key.split(':')[0] for key in _fleet_agent_cache.keys()]
-    current_fleet = f"fleet_{fleet_id}"
-
-    if cached_fleets and current_fleet not in cached_fleets:
-        print(f"Fleet changed to {fleet_id}, clearing cache")
-        clear_agent_cache()
-
-    if cache_key in _fleet_agent_cache:
-        print(f"Using cached agent: {cache_key}")
-        return _fleet_agent_cache[cache_key]
-
-    print(f"Creating new agent: {cache_key}")     
-    try:
-        model_config = get_model_config(model_name)        
-        db = create_session_aware_SQLdatabase(engine, user, fleet_id)
-        llm = ChatGroq(
-            model=model_config["model"],
-            temperature=model_config["temperature"],
-            max_tokens=model_config["max_tokens"],
-            api_key=os.getenv("GROQ_API_KEY")
-        )
-
-        agent = await build_agent(db, llm)
-        
-        _fleet_agent_cache[cache_key] = agent
-        return agent
-        
-    except Exception as e:
-        print(f"Error creating agent: {e}")
-        print(f"Traceback: {traceback.format_exc()}")
-        raise e
-
-
-# TODO: Refactor for production
-def create_session_aware_SQLdatabase(engine, user: str, fleet_id: str):
-    """Creates SQLDatabase with specified role and fleet_id."""    
-
-    with engine.connect() as con:
-        con.execute(text("SET statement_timeout = 10000;"))
-        con.execute(text(f"SET ROLE {user};"))
-        con.execute(text(f"SET app.fleet_id = '{fleet_id}';"))
-        con.commit()  
-
-    database = SQLDatabase(engine)
-    return database
+    """Get the shared agent bound to this fleet and role (topology defaults to AGENT_TOPOLOGY)."""
+    agent = await get_agent(model_name, topology or AGENT_TOPOLOGY)
+    return agent.with_config(tenant_config(fleet_id, user))
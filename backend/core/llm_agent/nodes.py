@@ -1,10 +1,22 @@
 import uuid
-from langchain_core.messages import AIMessage
+import asyncio
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+from langchain_core.runnables import RunnableConfig
+from pydantic import BaseModel, Field
+from sqlalchemy.exc import SQLAlchemyError
 from langgraph.graph import MessagesState, END
-from langchain_community.utilities import SQLDatabase
 
-from core.llm_agent.prompts import generate_query_prompt, check_query_prompt, get_schema_prompt
-from core.llm_agent.utils import load_semantic_map
+from core.llm_agent.prompts import prompt_registry
+from core.llm_agent.query_cache import QueryCache, current_schema_version
+from core.llm_agent.templates import match_template, run_template
+from core.llm_agent.schema_retriever import (
+    SchemaRetriever, SCHEMA_RETRIEVER_MODES, SCHEMA_RETRIEVER_MODE, SCHEMA_RETRIEVER_MIN_SCORE
+)
+from core.llm_agent.query_guard import QUERY_ROW_LIMIT
+from core.llm_agent.sql_validator import SQLValidator, SQL_VALIDATOR_MODES, SQL_VALIDATOR_MODE
+from core.llm_agent.tools import get_tenant
+from core.llm_agent.schema_catalog import SchemaCatalog
+from core.llm_agent.utils import FINAL_ANSWER_TAG
 
 
 # from langchain_core.messages import SystemMessage, HumanMessage
@@ -12,6 +24,158 @@ from core.llm_agent.utils import load_semantic_map
 # user_message = HumanMessage(content=...)
 
 
+def get_user_question(state: MessagesState) -> str:
+    """Return the content of the first human message in the state."""
+    for msg in state["messages"]:
+        if isinstance(msg, HumanMessage):
+            return msg.content
+    return ""
+
+
+def detect_multiple_questions(state: MessagesState) -> bool:
+    """Naive detection if user asked multiple questions."""
+    
+    user_question = ""
+    for msg in state["messages"]:
+        if hasattr(msg, 'content') and msg.content and "?" in msg.content:
+            user_question = msg.content
+            break
+    
+    # Keywords for detection of multiple questions
+    has_multiple_questions = user_question.count("?") > 1 or any(
+        phrase in user_question.lower() for phrase in [
+            " what about ", " how about ", " also tell me ", " plus ", 
+            " and which ", " and what ", " and how ", " and when ",
+            " and where ", " and who ", " and why ", " additionally, ", 
+        ]
+    )
+    return has_multiple_questions
+
+
+def is_query_result(message) -> bool:
+    """Whether a message is the output of sql_db_query (rows, a sample of them, no data or an error)."""
+    return isinstance(message, ToolMessage) and message.name == "sql_db_query"
+
+
+MULTIPLE_QUESTIONS_MESSAGE = (
+    "I can help you with that! "
+    "To give you the clearest answer, could you please ask one question at a time?"
+)
+
+
+class FastPathNode:
+    async def __call__(self, state: MessagesState, config: RunnableConfig):
+        """Answers questions matching a known template from prevalidated SQL, with no LLM call.
+        
+        Args:
+            self: The instance of the class containing this method.
+            state (MessagesState): The current state of messages.
+            config (RunnableConfig): Run config carrying the tenant context.
+        
+        Returns:
+            dict: The unchanged messages when no template applies, or the messages plus the final answer.
+        """
+        try:
+            matched = await asyncio.to_thread(match_template, get_user_question(state))
+        except SQLAlchemyError as e:
+            print(f"Fast path unavailable, falling back to the agent: {e}")
+            return {"messages": state["messages"]}
+        if matched is None:
+            return {"messages": state["messages"]}
+
+        template, params = matched
+        role, fleet_id = get_tenant(config)
+        answer = await asyncio.to_thread(run_template, template, params, role, fleet_id)
+        if answer is None:
+            return {"messages": state["messages"]}
+
+        print(f"Fast path hit: {template.name} {params}")
+        message = AIMessage(content=answer, additional_kwargs={"template": template.name, "query": template.sql})
+        return {"messages": state["messages"] + [message]}
+
+
+class LookupCachedQueryNode:
+    def __init__(self, query_cache: QueryCache):
+        """Initialize a new instance of the class.
+        
+        Args:
+            query_cache (QueryCache): Cache of checked SQL keyed by normalized question and fleet.
+        
+        Returns:
+            None: This method doesn't return anything.
+        """
+        self.query_cache = query_cache
+
+    async def __call__(self, state: MessagesState, config: RunnableConfig):
+        """Looks up previously checked SQL for the user question and, on a hit, emits it as a query tool call.
+        
+        Args:
+            self: The instance of the class containing this method.
+            state (MessagesState): The current state of messages.
+            config (RunnableConfig): Run config carrying the tenant context.
+        
+        Returns:
+            dict: The unchanged messages on a miss, or the messages plus an sql_db_query tool call on a hit.
+        """
+        _, fleet_id = get_tenant(config)
+        # SQLite reads, and the schema fingerprint may need a fresh reflection: keep them off the event loop
+        sql = await asyncio.to_thread(
+            lambda: self.query_cache.get(get_user_question(state), fleet_id, current_schema_version())
+        )
+        if sql is None:
+            return {"messages": state["messages"]}
+
+        print(f"Query cache hit: {sql}")
+        tool_call = {
+            "name": "sql_db_query",
+            "args": {"query": sql},
+            "id": str(uuid.uuid4()),
+            "type": "tool_call",
+        }
+        return {"messages": state["messages"] + [AIMessage(content="", tool_calls=[tool_call])]}
+
+
+class StoreCachedQueryNode:
+    def __init__(self, query_cache: QueryCache):
+        """Initialize a new instance of the class.
+        
+        Args:
+            query_cache (QueryCache): Cache of checked SQL keyed by normalized question and fleet.
+        
+        Returns:
+            None: This method doesn't return anything.
+        """
+        self.query_cache = query_cache
+
+    async def __call__(self, state: MessagesState, config: RunnableConfig):
+        """Stores the SQL that just ran successfully against the user question.
+        
+        Args:
+            self: The instance of the class containing this method.
+            state (MessagesState): The current state of messages, ending with the run_query tool message.
+            config (RunnableConfig): Run config carrying the tenant context.
+        
+        Returns:
+            dict: The unchanged messages.
+        """
+        messages = state["messages"]
+        result, query_call = messages[-1], messages[-2]
+        if (
+            isinstance(result, ToolMessage)
+            and not result.content.startswith("Error")
+            and getattr(query_call, "tool_calls", None)
+        ):
+            _, fleet_id = get_tenant(config)
+            # (SQLite writes and the schema fingerprint, off the event loop as in LookupCachedQueryNode)
+            await asyncio.to_thread(
+                lambda: self.query_cache.put(
+                    get_user_question(state), fleet_id, current_schema_version(),
+                    query_call.tool_calls[0]["args"]["query"]
+                )
+            )
+        return {"messages": messages}
+
+
 class ListTablesNode:
     def __init__(self, list_tables_tool):
         """Initialize a new instance of the class.
@@ -24,7 +188,7 @@ class ListTablesNode:
         """
         self.list_tables_tool = list_tables_tool
 
-    def __call__(self, state: MessagesState):
+    async def __call__(self, state: MessagesState):
         """Executes a tool call to list SQL database tables and updates the message state.
         
         Args:
@@ -41,7 +205,7 @@ class ListTablesNode:
             "type": "tool_call",
         }
         tool_call_message = AIMessage(content="", tool_calls=[tool_call])
-        tool_message = self.list_tables_tool.invoke(tool_call)
+        tool_message = await self.list_tables_tool.ainvoke(tool_call)
         # return {"messages": [tool_call_message, tool_message]}
         return {"messages": state["messages"] + [tool_call_message, tool_message]}
 
@@ -60,7 +224,7 @@ class CallGetSchemaNode:
         self.llm = llm
         self.get_schema_tool = get_schema_tool
 
-    def __call__(self, state: MessagesState):
+    async def __call__(self, state: MessagesState):
         """Handles the invocation of a language model with tools based on the current message state.
         
         Args:
@@ -73,20 +237,65 @@ class CallGetSchemaNode:
         """
         system_message = {
             "role": "system",
-            "content": get_schema_prompt(mappings=load_semantic_map())
+            "content": prompt_registry.schema_prompt()
         }
         llm_with_tools = self.llm.bind_tools([self.get_schema_tool], tool_choice="any")
-        response = llm_with_tools.invoke([system_message] + state["messages"])
+        response = await llm_with_tools.ainvoke([system_message] + state["messages"])
         # return {"messages": [response]}
         return {"messages": state["messages"] + [response]}
 
+class RetrieveSchemaNode:
+    def __init__(self, retriever: SchemaRetriever, fallback: CallGetSchemaNode,
+                 mode: str = SCHEMA_RETRIEVER_MODE, min_score: float = SCHEMA_RETRIEVER_MIN_SCORE):
+        """Initialize a new instance of the class.
+        
+        Args:
+            retriever (SchemaRetriever): Local table ranker.
+            fallback (CallGetSchemaNode): LLM-driven table selection, used when the retriever is unsure.
+            mode (str): 'local', 'hybrid' or 'llm' (see SCHEMA_RETRIEVER_MODES).
+            min_score (float): Best table score below which hybrid mode asks the LLM.
+        
+        Returns:
+            None: This method doesn't return anything.
+        """
+        if mode not in SCHEMA_RETRIEVER_MODES:
+            raise ValueError(f"Unknown schema retriever mode '{mode}', expected one of {SCHEMA_RETRIEVER_MODES}")
+        self.retriever = retriever
+        self.fallback = fallback
+        self.mode = mode
+        self.min_score = min_score
+
+    async def __call__(self, state: MessagesState):
+        """Picks the tables for the question locally and emits the schemas tool call, or defers to the LLM.
+        
+        Args:
+            self: The instance of the class containing this method.
+            state (MessagesState): The current state of messages to be processed.
+        
+        Returns:
+            dict: A dictionary containing the updated messages, ending with an sql_db_schema tool call.
+        """
+        if self.mode != "llm":
+            retrieval = self.retriever.retrieve(get_user_question(state))
+            if retrieval.tables and (self.mode == "local" or retrieval.confidence >= self.min_score):
+                print(f"Schema retriever: {retrieval.tables} (confidence {retrieval.confidence:.2f})")
+                tool_call = {
+                    "name": "sql_db_schema",
+                    "args": {"table_names": ", ".join(retrieval.tables)},
+                    "id": str(uuid.uuid4()),
+                    "type": "tool_call",
+                }
+                return {"messages": state["messages"] + [AIMessage(content="", tool_calls=[tool_call])]}
+            print(f"Schema retriever unsure (confidence {retrieval.confidence:.2f}), asking the LLM")
+        return await self.fallback(state)
+
+
 class GenerateQueryNode:
-    # def __init__(self, db: SQLDatabase, llm, run_query_tool):
-    def __init__(self, db: SQLDatabase, llm, fast_llm, run_query_tool):
+    def __init__(self, dialect: str, llm, fast_llm, run_query_tool):
         """Initializes a new instance of the class.
         
         Args:
-            db (SQLDatabase): The SQL database object to be used for database operations.
+            dialect (str): The SQL dialect of the database, e.g. 'postgresql'.
             llm: The language model to be used for SQL generation.
             fast_llm: The fast language model to be used for final answer generation.
             run_query_tool: A tool or function for executing database queries.
@@ -94,31 +303,12 @@ class GenerateQueryNode:
         Returns:
             None: This method doesn't return anything; it initializes instance attributes.
         """
-        self.db = db
+        self.dialect = dialect
         self.quality_llm = llm
         self.fast_llm = fast_llm
         self.run_query_tool = run_query_tool
 
-    def _detect_multiple_questions(self, state: MessagesState) -> bool:
-        """Naive detection if user asked multiple questions."""
-        
-        user_question = ""
-        for msg in state["messages"]:
-            if hasattr(msg, 'content') and msg.content and "?" in msg.content:
-                user_question = msg.content
-                break
-        
-        # Keywords for detection of multiple questions
-        has_multiple_questions = user_question.count("?") > 1 or any(
-            phrase in user_question.lower() for phrase in [
-                " what about ", " how about ", " also tell me ", " plus ", 
-                " and which ", " and what ", " and how ", " and when ",
-                " and where ", " and who ", " and why ", " additionally, ", 
-            ]
-        )
-        return has_multiple_questions
-
-    def __call__(self, state: MessagesState):
+    async def __call__(self, state: MessagesState):
         """Invokes an LLM with tools to process a state of messages.
         
         Args:
@@ -129,59 +319,56 @@ class GenerateQueryNode:
             dict: A dictionary containing the updated messages, including the LLM's response.
         
         """
-        if self._detect_multiple_questions(state):
-            return {"messages": state["messages"] + [AIMessage(content=(
-                "I can help you with that! "
-                "To give you the clearest answer, could you please ask one question at a time?"
-            ))]}
+        if detect_multiple_questions(state):
+            return {"messages": state["messages"] + [AIMessage(content=MULTIPLE_QUESTIONS_MESSAGE)]}
 
         system_message = {
             "role": "system",
-            "content": generate_query_prompt(
-                dialect=self.db.dialect,
-                row_limit=5000,
+            "content": prompt_registry.generate_query_prompt(
+                dialect=self.dialect,
+                row_limit=QUERY_ROW_LIMIT,
                 time_limit_sec=10,
-                mappings=load_semantic_map()
             ),
         }
         
-        # Check if the last message is a tool result (indicating we need to generate final answer)
-        last_message = state["messages"][-1]
-        is_tool_result = (
-            hasattr(last_message, 'content') and 
-            last_message.content and 
-            isinstance(last_message.content, str) and
-            ('[' in last_message.content and ']' in last_message.content)  # Tool result format
-        )
+        # A query result (rows, no data or an error) means the final answer is due
+        is_tool_result = is_query_result(state["messages"][-1])
         
         # Use fast model for NL generation; quality model for SQL generation
+        # (answer calls are tagged so streaming clients can forward their tokens)
         llm_with_tools = (
-            self.fast_llm.bind_tools([self.run_query_tool]) 
+            self.fast_llm.bind_tools([self.run_query_tool]).with_config(tags=[FINAL_ANSWER_TAG])
             if is_tool_result 
             else self.quality_llm.bind_tools([self.run_query_tool])
         )
             
-        response = llm_with_tools.invoke([system_message] + state["messages"])
+        response = await llm_with_tools.ainvoke([system_message] + state["messages"])
         return {"messages": state["messages"] + [response]}
 
 class CheckQueryNode:
-    def __init__(self, db: SQLDatabase, llm, run_query_tool):
+    def __init__(self, dialect: str, llm, run_query_tool, validator: SQLValidator, mode: str = SQL_VALIDATOR_MODE):
         """Initializes a new instance of the class.
         
         Args:
-            db (SQLDatabase): The SQL database object to be used for queries.
+            dialect (str): The SQL dialect of the database, e.g. 'postgresql'.
             llm: The language model to be used for processing.
             run_query_tool: The tool or function used to execute SQL queries.
+            validator (SQLValidator): Local static checker run before (or instead of) the LLM.
+            mode (str): 'local', 'hybrid' or 'llm' (see SQL_VALIDATOR_MODES).
         
         Returns:
             None: This method doesn't return anything.
         """
-        self.db = db
+        if mode not in SQL_VALIDATOR_MODES:
+            raise ValueError(f"Unknown SQL validator mode '{mode}', expected one of {SQL_VALIDATOR_MODES}")
+        self.dialect = dialect
         self.llm = llm
         self.run_query_tool = run_query_tool
+        self.validator = validator
+        self.mode = mode
 
-    def __call__(self, state: MessagesState):
-        """Handles a call to process a query state and generate a response using an LLM with tools.
+    async def __call__(self, state: MessagesState):
+        """Validates the generated query locally, asking the LLM to revise it only for problems the validator cannot fix.
         
         Args:
             self: The instance of the class containing this method.
@@ -191,18 +378,157 @@ class CheckQueryNode:
             dict: A dictionary containing the updated messages state, including the new response.
         
         """
+        tool_call = state["messages"][-1].tool_calls[0]
+        query = tool_call["args"]["query"]
+
+        problems = []
+        if self.mode != "llm":
+            # (the catalog may need to re-reflect the schema, keep it off the event loop)
+            validation = await asyncio.to_thread(self.validator.validate, query)
+            for fix in validation.fixes:
+                print(f"SQL validator fixed: {fix}")
+            if validation.ok or self.mode == "local":
+                # Same message id and tool call id, so this replaces the generated call
+                checked_call = {**tool_call, "args": {**tool_call["args"], "query": validation.sql}}
+                response = AIMessage(content="", tool_calls=[checked_call],
+                                     additional_kwargs={"fixes": validation.fixes})
+                response.id = state["messages"][-1].id
+                return {"messages": state["messages"] + [response]}
+            problems = validation.problems
+            print(f"SQL validator found {len(problems)} problem(s), asking the LLM to revise the query")
+
         system_message = {
             "role": "system",
-            "content": check_query_prompt(dialect=self.db.dialect),
+            "content": prompt_registry.check_query_prompt(dialect=self.dialect),
         }
-        tool_call = state["messages"][-1].tool_calls[0]
-        user_message = {"role": "user", "content": tool_call["args"]["query"]}
+        user_message = {"role": "user", "content": query}
+        if problems:
+            user_message["content"] += "\n\nA static check of this query found:\n" + "\n".join(f"- {p}" for p in problems)
         llm_with_tools = self.llm.bind_tools([self.run_query_tool], tool_choice="any")
-        response = llm_with_tools.invoke([system_message, user_message])
+        response = await llm_with_tools.ainvoke([system_message, user_message])
         response.id = state["messages"][-1].id
         return {"messages": state["messages"] + [response]}
 
 
+class SQLQuery(BaseModel):
+    """A single read-only SQL query that answers the user's question."""
+    sql: str = Field(description="The final, checked SQL query")
+
+
+# Attempts at writing SQL per question in the single-shot topology (first try plus repairs)
+MAX_SQL_ATTEMPTS = 2
+
+
+class GenerateCheckedQueryNode:
+    def __init__(self, dialect: str, llm, catalog: SchemaCatalog, retriever: SchemaRetriever):
+        """Initializes a new instance of the class.
+        
+        Args:
+            dialect (str): The SQL dialect of the database, e.g. 'postgresql'.
+            llm: The language model to be used for SQL generation.
+            catalog (SchemaCatalog): Source of cached table DDL and tenant sample rows.
+            retriever (SchemaRetriever): Local table ranker choosing the schemas to include.
+        
+        Returns:
+            None: This method doesn't return anything.
+        """
+        self.dialect = dialect
+        self.llm = llm.with_structured_output(SQLQuery, include_raw=True)
+        self.catalog = catalog
+        self.retriever = retriever
+
+    async def __call__(self, state: MessagesState, config: RunnableConfig):
+        """Writes checked SQL for the question in one structured-output call, with the relevant schemas inlined.
+        
+        Args:
+            self: The instance of the class containing this method.
+            state (MessagesState): The current state of messages.
+            config (RunnableConfig): Run config carrying the tenant context.
+        
+        Returns:
+            dict: The messages plus an sql_db_query tool call, or a final message if no query can be written.
+        """
+        if detect_multiple_questions(state):
+            return {"messages": state["messages"] + [AIMessage(content=MULTIPLE_QUESTIONS_MESSAGE)]}
+
+        role, fleet_id = get_tenant(config)
+        question = get_user_question(state)
+        tables = self.retriever.retrieve(question).tables or self.catalog.table_names()
+        schemas = await asyncio.to_thread(self.catalog.table_info, tables, role, fleet_id)
+
+        messages = [
+            {"role": "system", "content": prompt_registry.single_shot_query_prompt(
+                dialect=self.dialect, row_limit=QUERY_ROW_LIMIT, time_limit_sec=10,
+            )},
+            {"role": "system", "content": f"Relevant table schemas:\n\n{schemas}"},
+            {"role": "user", "content": question},
+        ]
+        # Repair attempt: show the failed query and its error
+        last_message = state["messages"][-1]
+        if isinstance(last_message, ToolMessage) and last_message.content.startswith("Error"):
+            failed_sql = state["messages"][-2].tool_calls[0]["args"]["query"]
+            messages.append({"role": "user", "content": (
+                f"This query failed:\n{failed_sql}\n\n{last_message.content}\n\nReturn a corrected query."
+            )})
+
+        result = await self.llm.ainvoke(messages)
+        raw, parsed = result["raw"], result["parsed"]
+        if parsed is None:
+            return {"messages": state["messages"] + [AIMessage(
+                content="Sorry, I could not write a query for this question. Could you rephrase it?",
+                usage_metadata=getattr(raw, "usage_metadata", None),
+            )]}
+
+        tool_call = {
+            "name": "sql_db_query",
+            "args": {"query": parsed.sql},
+            "id": str(uuid.uuid4()),
+            "type": "tool_call",
+        }
+        return {"messages": state["messages"] + [AIMessage(
+            content="",
+            tool_calls=[tool_call],
+            additional_kwargs={"tables": tables},
+            usage_metadata=getattr(raw, "usage_metadata", None),
+        )]}
+
+
+class AnswerNode:
+    def __init__(self, fast_llm):
+        """Initializes a new instance of the class.
+        
+        Args:
+            fast_llm: The fast language model to be used for final answer generation.
+        
+        Returns:
+            None: This method doesn't return anything.
+        """
+        # Answer calls are tagged so streaming clients can forward their tokens
+        self.fast_llm = fast_llm.with_config(tags=[FINAL_ANSWER_TAG])
+
+    async def __call__(self, state: MessagesState):
+        """Phrases the final answer from the question, the SQL that ran and its result, without tools.
+        
+        Args:
+            self: The instance of the class containing this method.
+            state (MessagesState): The current state of messages, ending with the run_query tool message.
+        
+        Returns:
+            dict: A dictionary containing the updated messages, ending with the final answer.
+        """
+        result, query_call = state["messages"][-1], state["messages"][-2]
+        messages = [
+            {"role": "system", "content": prompt_registry.answer_prompt()},
+            {"role": "user", "content": (
+                f"Question: {get_user_question(state)}\n\n"
+                f"SQL: {query_call.tool_calls[0]['args']['query']}\n\n"
+                f"Result: {result.content}"
+            )},
+        ]
+        response = await self.fast_llm.ainvoke(messages)
+        return {"messages": state["messages"] + [response]}
+
+
 # Edges (A router basically)
 def should_continue(state: MessagesState):
     """Determines whether to continue processing based on the current state of messages.
@@ -216,3 +542,56 @@ def should_continue(state: MessagesState):
     last_message = state["messages"][-1]
     return "check_query" if last_message.tool_calls else END
 
+def route_fast_path(state: MessagesState):
+    """Determines whether the fast path already answered the question.
+    
+    Args:
+        state (MessagesState): The current state of messages, containing a list of messages.
+    
+    Returns:
+        str: 'END' if the last message is an answer, otherwise 'lookup_cached_query'.
+    """
+    last_message = state["messages"][-1]
+    return END if isinstance(last_message, AIMessage) else "lookup_cached_query"
+
+def route_generated_query(state: MessagesState):
+    """Determines whether single-shot generation produced a query to run.
+    
+    Args:
+        state (MessagesState): The current state of messages, containing a list of messages.
+    
+    Returns:
+        str: 'run_query' if the last message contains tool calls, otherwise 'END'.
+    """
+    last_message = state["messages"][-1]
+    return "run_query" if last_message.tool_calls else END
+
+def route_query_result(state: MessagesState):
+    """Determines whether a failed query gets another single-shot attempt.
+    
+    Args:
+        state (MessagesState): The current state of messages, ending with the run_query tool message.
+    
+    Returns:
+        str: 'generate_sql' after an error while attempts remain, otherwise 'answer'.
+    """
+    last_message = state["messages"][-1]
+    attempts = sum(
+        1 for msg in state["messages"]
+        if isinstance(msg, AIMessage) and msg.tool_calls and msg.tool_calls[0]["name"] == "sql_db_query"
+    )
+    if last_message.content.startswith("Error") and attempts < MAX_SQL_ATTEMPTS:
+        return "generate_sql"
+    return "answer"
+
+def route_cached_query(state: MessagesState):
+    """Determines whether a cached query was found.
+    
+    Args:
+        state (MessagesState): The current state of messages, containing a list of messages.
+    
+    Returns:
+        str: 'run_query' if the cache emitted a query tool call, otherwise 'list_tables'.
+    """
+    last_message = state["messages"][-1]
+    return "run_query" if getattr(last_message, "tool_calls", None) else "list_tables"
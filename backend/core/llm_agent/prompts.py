@@ -1,3 +1,11 @@
+import os
+import hashlib
+import threading
+from typing import Any, Dict, Tuple
+
+from core.llm_agent.utils import load_semantic_map, read_semantic_map, SEMANTIC_MAP_PATH, LATEST_TS
+
+
 def get_schema_prompt(mappings=""):
     """Get a schema prompt for SQL schema discovery.
     
@@ -13,7 +21,9 @@ def get_schema_prompt(mappings=""):
     {mappings}
 
     Important rules for schema discovery:
-    - Only include table names from this list: vehicles, raw_telemetry, charging_sessions, processed_metrics, fleet_daily_summary, drivers, driver_trip_map, fleets, trips, maintenance_logs, geofence_events, battery_cycles, alerts.
+    - Only include table names from this list: vehicles, raw_telemetry, charging_sessions, processed_metrics, fleet_daily_summary, drivers, driver_trip_map, fleets, trips, maintenance_logs, geofence_events, battery_cycles, alerts, vehicle_latest_state, vehicle_daily_usage, vehicle_daily_soc_band, vehicle_daily_battery_temp.
+    - For current, latest or "right now" per-vehicle values (SOC, speed, temperature, position), use vehicle_latest_state instead of raw_telemetry
+    - Prefer the pre-aggregated rollups (vehicle_daily_usage, vehicle_daily_soc_band, vehicle_daily_battery_temp) when they can answer the question on their own; they are much faster than aggregating raw_telemetry, processed_metrics or trips.
     - Never include anything with a dot (.) or terms like SRM T3 in the table_names argument.
     - Deduplicate table names. Intercept the tool call before it is executed, and deduplicate the table_names argument.
     - Request schemas for ALL tables needed to answer the question
@@ -53,6 +63,9 @@ def generate_query_prompt(dialect, row_limit, time_limit_sec, mappings=""):
     - Do not make any DML statements (INSERT, UPDATE, DELETE, DROP, etc.)
     - You may order results by a meaningful column to surface the most relevant data
     - Interpret time-related phrases (e.g., “last 24h”, “currently”, “right now”) accurately and convert them into the correct time filters in the query
+    - Anchor relative time windows (“last 24h”, “this week”, “today”) on the newest telemetry, {LATEST_TS}, never on now() or CURRENT_DATE; e.g. ts >= {LATEST_TS} - INTERVAL '24 hours'
+    - For the current or latest state of vehicles, query vehicle_latest_state (one row per vehicle) rather than sorting raw_telemetry
+    - Results with many rows come with an exact summary (totals, averages, highest/lowest, group totals); answer from its figures as given
     """
 
 def check_query_prompt(dialect):
@@ -84,3 +97,149 @@ def check_query_prompt(dialect):
     You will call the appropriate tool to execute the query after running this check.
     """
 
+
+def single_shot_query_prompt(dialect, row_limit, time_limit_sec, mappings=""):
+    """Generate the prompt for writing checked SQL in a single call (single-shot topology).
+    
+    Args:
+        dialect (str): The SQL dialect to be used in the query.
+        row_limit (int): The maximum number of rows to return in the query result.
+        time_limit_sec (int): The maximum execution time for the query in seconds.
+        mappings (str, optional): User-defined term to column name mappings.
+    
+    Returns:
+        str: A formatted string combining the query generation rules and the query check list.
+             The relevant table schemas are sent in a separate message, so this prefix stays stable.
+    """
+    return f"""
+    You are an agent designed to write a single {dialect} query that answers the user's question.
+    The schemas of the relevant tables, with sample rows, are given in the next message.
+    Unless the user specifies a specific number of examples they wish to obtain, always limit your
+    query to at most {row_limit} rows. Ensure that the query executes within {time_limit_sec} seconds.
+
+    Use the following mappings to translate user terms into the correct column names:
+    {mappings}
+
+    Important rules for query generation:
+    - Only use tables and columns that appear in the given schemas
+    - Always JOIN tables when querying across multiple tables, on the proper columns (e.g., vehicle_id)
+    - Only select columns relevant to the question—never use SELECT *
+    - Only write a single SELECT statement; never INSERT, UPDATE, DELETE, DROP, etc.
+    - Interpret time-related phrases (e.g., “last 24h”, “currently”, “right now”) accurately and convert them into the correct time filters in the query
+    - Anchor relative time windows (“last 24h”, “this week”, “today”) on the newest telemetry, {LATEST_TS}, never on now() or CURRENT_DATE; e.g. ts >= {LATEST_TS} - INTERVAL '24 hours'
+    - For the current or latest state of vehicles, query vehicle_latest_state (one row per vehicle) rather than sorting raw_telemetry
+
+    Before answering, double check the query for common mistakes, including:
+    - Using NOT IN with NULL values
+    - Using UNION when UNION ALL should have been used
+    - Using BETWEEN for exclusive ranges
+    - Data type mismatch in predicates
+    - Properly quoting identifiers
+    - Using the correct number of arguments for functions
+    - Casting to the correct data type
+
+    If a previous attempt failed, the error is included; fix the query accordingly.
+    Return only the final, checked query.
+    """
+
+def answer_prompt():
+    """Generate the prompt for phrasing the final answer from a query result (single-shot topology).
+    
+    Returns:
+        str: A prompt instructing the model to answer concisely from the SQL result only.
+    """
+    return """
+    You answer questions about a vehicle fleet from the result of a SQL query.
+    You are given the question, the SQL that was run and its result rows.
+    Answer the question directly and concisely in natural language, using only the result.
+    Include units (%, km, °C, kWh) and vehicle registration numbers where available.
+    If the result is empty or an error, say that no data is available for the question.
+    Results with many rows come with an exact summary (totals, averages, highest/lowest,
+    group totals); quote its figures as given rather than recomputing them from the rows.
+    """
+
+
+class PromptRegistry:
+    """
+    Parses the semantic map once and renders each system prompt once per argument set.
+
+    The YAML is re-parsed only when its mtime changes, so edits hot-reload without
+    a restart. Rendered prompts are returned as the same string on every call,
+    which keeps the system-message prefix byte-stable for provider prompt caching.
+    """
+
+    def __init__(self, semantic_map_path: str = SEMANTIC_MAP_PATH):
+        self.semantic_map_path = semantic_map_path
+        self._lock = threading.Lock()
+        self._mtime_ns = None
+        self._semantic_map: Dict[str, Any] = {}
+        self._mappings = ""
+        self._version = ""
+        self._rendered: Dict[Tuple, str] = {}
+
+    def _reload_if_changed(self) -> None:
+        mtime_ns = os.stat(self.semantic_map_path).st_mtime_ns
+        if mtime_ns == self._mtime_ns:
+            return
+        with self._lock:
+            if mtime_ns != self._mtime_ns:
+                self._semantic_map = read_semantic_map(self.semantic_map_path)
+                self._mappings = load_semantic_map(m=self._semantic_map)
+                # The SQL-writing rules count too: cached SQL written under older rules is not reused
+                rules = generate_query_prompt("", 0, 0) + single_shot_query_prompt("", 0, 0)
+                self._version = hashlib.sha256((self._mappings + rules).encode()).hexdigest()[:16]
+                self._rendered = {}
+                self._mtime_ns = mtime_ns
+                print(f"Semantic map loaded from {self.semantic_map_path}")
+
+    def _render(self, key: Tuple, render) -> str:
+        self._reload_if_changed()
+        prompt = self._rendered.get(key)
+        if prompt is None:
+            prompt = self._rendered.setdefault(key, render())
+        return prompt
+
+    def mappings(self) -> str:
+        self._reload_if_changed()
+        return self._mappings
+
+    def semantic_map(self) -> Dict[str, Any]:
+        """The parsed semantic map (term -> columns and description), e.g. for the schema retriever."""
+        self._reload_if_changed()
+        return self._semantic_map
+
+    @property
+    def version(self) -> str:
+        """Short hash of the loaded semantic map and SQL-writing rules; changes only when their content does."""
+        self._reload_if_changed()
+        return self._version
+
+    def schema_prompt(self) -> str:
+        return self._render(
+            ("schema",),
+            lambda: get_schema_prompt(mappings=self._mappings),
+        )
+
+    def generate_query_prompt(self, dialect: str, row_limit: int, time_limit_sec: int) -> str:
+        return self._render(
+            ("generate_query", dialect, row_limit, time_limit_sec),
+            lambda: generate_query_prompt(dialect, row_limit, time_limit_sec, mappings=self._mappings),
+        )
+
+    def check_query_prompt(self, dialect: str) -> str:
+        return self._render(
+            ("check_query", dialect),
+            lambda: check_query_prompt(dialect=dialect),
+        )
+
+    def single_shot_query_prompt(self, dialect: str, row_limit: int, time_limit_sec: int) -> str:
+        return self._render(
+            ("single_shot_query", dialect, row_limit, time_limit_sec),
+            lambda: single_shot_query_prompt(dialect, row_limit, time_limit_sec, mappings=self._mappings),
+        )
+
+    def answer_prompt(self) -> str:
+        return self._render(("answer",), answer_prompt)
+
+
+prompt_registry = PromptRegistry()
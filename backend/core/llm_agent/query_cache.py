@@ -0,0 +1,167 @@
+import os
+import re
+import time
+import sqlite3
+import hashlib
+import threading
+import unicodedata
+from typing import Dict, List, Optional
+
+from core.cache import TTLCache, on_data_change
+from core.llm_agent.prompts import prompt_registry
+from core.llm_agent.schema_catalog import schema_catalog
+
+
+QUERY_CACHE_PATH = os.getenv(
+    "QUERY_CACHE_PATH",
+    os.path.join(os.path.dirname(__file__), "..", "..", ".cache", "query_cache.sqlite3"),
+)
+QUERY_CACHE_MAX_SIZE = int(os.getenv("QUERY_CACHE_MAX_SIZE", "5000"))
+QUERY_CACHE_TTL_SEC = float(os.getenv("QUERY_CACHE_TTL_SEC", str(7 * 24 * 3600)))
+
+
+def normalize_question(question: str) -> str:
+    """
+    Canonical form of a question for cache lookups, e.g.
+    "How many vehicles are currently driving with SOC < 30 %?" ->
+    "how many vehicles are currently driving with soc<30%".
+    """
+    q = unicodedata.normalize("NFKC", question).lower()
+    q = re.sub(r"\s+", " ", q).strip()
+    q = re.sub(r"\s*([^\w\s])\s*", r"\1", q)  # No spaces around symbols
+    return q.rstrip("?!. ")
+
+
+def current_schema_version() -> str:
+    """Schema version used in cache keys: DDL fingerprint plus semantic map and prompt rules hash."""
+    return f"{schema_catalog.fingerprint}:{prompt_registry.version}"
+
+
+class QueryCache:
+    """
+    Natural-language question -> checked SQL, per fleet and schema version.
+
+    A bounded in-memory LRU sits in front of a SQLite file so entries survive
+    restarts. The schema version (DDL fingerprint + semantic map hash) is part of
+    the key, so a schema change makes old entries unreachable, and purge_stale()
+    drops them.
+    """
+
+    def __init__(self, path: str = QUERY_CACHE_PATH, maxsize: int = QUERY_CACHE_MAX_SIZE,
+                 ttl: float = QUERY_CACHE_TTL_SEC):
+        self.path = os.path.abspath(path)
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._memory = TTLCache("nl_sql", maxsize=maxsize, ttl=ttl)
+        self._lock = threading.Lock()
+        self._con: Optional[sqlite3.Connection] = None
+        self.stores = 0
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._con is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self._con = sqlite3.connect(self.path, check_same_thread=False)
+            self._con.execute("""
+                CREATE TABLE IF NOT EXISTS nl_sql_cache (
+                    key TEXT PRIMARY KEY,
+                    question TEXT,
+                    fleet_id TEXT,
+                    schema_version TEXT,
+                    sql TEXT,
+                    created_at REAL,
+                    last_used_at REAL
+                )
+            """)
+            self._con.commit()
+        return self._con
+
+    @staticmethod
+    def make_key(question: str, fleet_id: str, schema_version: str) -> str:
+        raw = f"{normalize_question(question)}\x1f{fleet_id}\x1f{schema_version}"
+        return hashlib.sha256(raw.encode()).hexdigest()
+
+    def get(self, question: str, fleet_id: str, schema_version: str) -> Optional[str]:
+        """Return the cached SQL for this question, or None."""
+        key = self.make_key(question, fleet_id, schema_version)
+        sql = self._memory.get(key)
+        if sql is not None:
+            return sql
+
+        now = time.time()
+        with self._lock:
+            con = self._connection()
+            row = con.execute(
+                "SELECT sql, created_at FROM nl_sql_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if self.ttl and row[1] + self.ttl < now:
+                con.execute("DELETE FROM nl_sql_cache WHERE key = ?", (key,))
+                con.commit()
+                return None
+            con.execute("UPDATE nl_sql_cache SET last_used_at = ? WHERE key = ?", (now, key))
+            con.commit()
+
+        self._memory.set(key, row[0])
+        return row[0]
+
+    def put(self, question: str, fleet_id: str, schema_version: str, sql: str) -> None:
+        """Store checked SQL, evicting least-recently-used rows past maxsize."""
+        key = self.make_key(question, fleet_id, schema_version)
+        now = time.time()
+        self._memory.set(key, sql)
+        with self._lock:
+            con = self._connection()
+            con.execute(
+                """
+                INSERT INTO nl_sql_cache (key, question, fleet_id, schema_version, sql, created_at, last_used_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(key) DO UPDATE SET sql = excluded.sql, created_at = excluded.created_at,
+                    last_used_at = excluded.last_used_at
+                """,
+                (key, normalize_question(question), fleet_id, schema_version, sql, now, now),
+            )
+            con.execute(
+                """
+                DELETE FROM nl_sql_cache WHERE key IN (
+                    SELECT key FROM nl_sql_cache ORDER BY last_used_at DESC LIMIT -1 OFFSET ?
+                )
+                """,
+                (self.maxsize,),
+            )
+            con.commit()
+        self.stores += 1
+
+    def purge_stale(self, schema_version: str) -> int:
+        """Drop every entry created under a different schema version."""
+        self._memory.clear()
+        with self._lock:
+            con = self._connection()
+            cur = con.execute("DELETE FROM nl_sql_cache WHERE schema_version != ?", (schema_version,))
+            con.commit()
+            return cur.rowcount
+
+    def invalidate(self, tables: Optional[List[str]] = None) -> None:
+        """
+        Data changes to specific tables keep SQL valid. A full invalidation (also sent
+        when the change listener reconnects) only drops the in-memory layer: persisted
+        entries are keyed by schema version, and purge_stale() removes outdated ones.
+        """
+        if tables is None:
+            self._memory.clear()
+
+    def clear(self) -> None:
+        """Drop every entry, in memory and persisted."""
+        self._memory.clear()
+        with self._lock:
+            self._connection().execute("DELETE FROM nl_sql_cache")
+            self._connection().commit()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            persisted = self._connection().execute("SELECT COUNT(*) FROM nl_sql_cache").fetchone()[0]
+        return {**self._memory.stats(), "persisted": persisted, "stores": self.stores}
+
+
+query_cache = QueryCache()
+on_data_change(query_cache.invalidate)
@@ -0,0 +1,120 @@
+import os
+import json
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import sqlglot
+from sqlglot import exp
+from sqlglot.errors import SqlglotError
+from sqlalchemy import text
+
+from core.setup_database.schema import ALL_TABLE_QUERIES
+
+
+# Most rows a generated query may return; promised to the LLM in the query prompts
+QUERY_ROW_LIMIT = int(os.getenv("QUERY_ROW_LIMIT", "5000"))
+
+# Planner estimates above which a generated query is refused before it runs (0 disables).
+# For reference, a full aggregate over one fleet's telemetry costs ~1e4; a telemetry x
+# vehicles cross join ~7e6 with ~2e8 intermediate rows.
+QUERY_MAX_COST = float(os.getenv("QUERY_MAX_COST", "5e6"))
+QUERY_MAX_PLAN_ROWS = float(os.getenv("QUERY_MAX_PLAN_ROWS", "5e7"))
+
+
+def limit_value(node: Optional[exp.Expression]) -> Optional[int]:
+    """Row count of a LIMIT or FETCH FIRST clause, if it is a plain integer."""
+    if node is None:
+        return None
+    value = node.args.get("count") if isinstance(node, exp.Fetch) else node.expression
+    return int(value.this) if isinstance(value, exp.Literal) and value.is_int else None
+
+
+def apply_row_limit(sql: str, row_limit: int = QUERY_ROW_LIMIT) -> Tuple[str, bool]:
+    """
+    Inject LIMIT row_limit into the outermost query, or tighten a larger one.
+    Returns the SQL to run and whether it was rewritten; SQL that does not parse
+    as a query is returned unchanged.
+    """
+    try:
+        tree = sqlglot.parse_one(sql, read="postgres")
+    except SqlglotError:
+        return sql, False
+    if not isinstance(tree, exp.Query):
+        return sql, False
+
+    current = limit_value(tree.args.get("limit"))
+    if current is not None and current <= row_limit:
+        return sql, False
+    tree.set("limit", exp.Limit(expression=exp.Literal.number(row_limit)))
+    return tree.sql(dialect="postgres"), True
+
+
+def plan_nodes(plan: Dict) -> Iterator[Dict]:
+    yield plan
+    for child in plan.get("Plans", []):
+        yield from plan_nodes(child)
+
+
+def relations(plan: Dict) -> List[str]:
+    """Tables a plan reads, with partitions (raw_telemetry_p202501_h0) named by their parent."""
+    names = set()
+    for node in plan_nodes(plan):
+        name = node.get("Relation Name")
+        if name:
+            parents = [t for t in ALL_TABLE_QUERIES if name.startswith(f"{t}_")]
+            names.add(name if name in ALL_TABLE_QUERIES or not parents else max(parents, key=len))
+    return sorted(names)
+
+
+def explain(con, sql: str) -> Dict:
+    """Root node of the planner's estimate for a query (EXPLAIN, nothing is executed)."""
+    plan = con.execute(text(f"EXPLAIN (FORMAT JSON) {sql}")).scalar()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return plan[0]["Plan"]
+
+
+def check_plan(plan: Dict, max_cost: float = QUERY_MAX_COST, max_rows: float = QUERY_MAX_PLAN_ROWS) -> Optional[str]:
+    """Why a plan is too expensive to run, phrased so the LLM can repair the query; None if it is fine."""
+    cost = float(plan["Total Cost"])
+    largest = max(plan_nodes(plan), key=lambda node: node["Plan Rows"])
+    rows = float(largest["Plan Rows"])
+    over_cost = max_cost > 0 and cost > max_cost
+    over_rows = max_rows > 0 and rows > max_rows
+    if not (over_cost or over_rows):
+        return None
+
+    limits = []
+    if over_cost:
+        limits.append(f"estimated cost {cost:,.0f} exceeds the limit of {max_cost:,.0f}")
+    if over_rows:
+        limits.append(f"an intermediate step produces ~{rows:,.0f} rows (limit {max_rows:,.0f})")
+    tables = relations(largest)
+    step = f"{largest['Node Type']} over {', '.join(tables) or 'a subquery'}"
+
+    hints = ["filter on a time window (ts)", "aggregate in the database"]
+    if largest["Node Type"] == "Nested Loop" and not largest.get("Join Filter"):
+        hints.insert(0, "add the missing join condition (this looks like a cross join)")
+    if "raw_telemetry" in tables:
+        hints.append("use vehicle_latest_state or the vehicle_daily_* rollups instead of raw_telemetry")
+    return (
+        f"Query rejected before execution: {' and '.join(limits)}. "
+        f"Largest step: {step} (~{rows:,.0f} rows). "
+        f"Rewrite it to read less data: {'; '.join(hints)}."
+    )
+
+
+def guard_query(con, sql: str) -> Tuple[str, Optional[str]]:
+    """
+    Prepare a generated query to run on this connection: cap its rows at
+    QUERY_ROW_LIMIT and check the planner's estimate. Returns the SQL to run
+    and, if it must not run, the reason.
+    """
+    sql, limited = apply_row_limit(sql)
+    if limited:
+        print(f"Row limit {QUERY_ROW_LIMIT} applied to generated query")
+    if QUERY_MAX_COST <= 0 and QUERY_MAX_PLAN_ROWS <= 0:
+        return sql, None
+    rejection = check_plan(explain(con, sql))
+    if rejection:
+        print(rejection)
+    return sql, rejection
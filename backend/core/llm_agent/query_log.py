@@ -0,0 +1,67 @@
+import os
+import json
+import time
+import threading
+from typing import Dict, Iterator, Optional
+
+
+QUERY_LOG_PATH = os.getenv(
+    "QUERY_LOG_PATH",
+    os.path.join(os.path.dirname(__file__), "..", "..", ".cache", "query_log.jsonl"),
+)
+QUERY_LOG_ENABLED = os.getenv("QUERY_LOG_ENABLED", "true").lower() in ("1", "true", "yes")
+# The log is rotated to <path>.1 once it grows past this size
+QUERY_LOG_MAX_BYTES = int(os.getenv("QUERY_LOG_MAX_BYTES", str(16 * 1024 * 1024)))
+
+
+class QueryLog:
+    """
+    Append-only JSONL log of the SQL executed by the query tool, one record per
+    run with tenant, duration and outcome. Feeds the index advisor with the real
+    workload.
+    """
+
+    def __init__(self, path: str = QUERY_LOG_PATH, enabled: bool = QUERY_LOG_ENABLED,
+                 max_bytes: int = QUERY_LOG_MAX_BYTES):
+        self.path = os.path.abspath(path)
+        self.enabled = enabled
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+
+    def record(self, sql: str, role: str, fleet_id: str, duration_ms: float,
+               error: Optional[str] = None) -> None:
+        if not self.enabled:
+            return
+        line = json.dumps({
+            "ts": time.time(),
+            "sql": sql,
+            "role": role,
+            "fleet_id": str(fleet_id),
+            "duration_ms": round(duration_ms, 3),
+            "error": error,
+        })
+        try:
+            with self._lock:
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                if os.path.exists(self.path) and os.path.getsize(self.path) > self.max_bytes:
+                    os.replace(self.path, f"{self.path}.1")
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(line + "\n")
+        except OSError as e:
+            print(f"Failed to write query log: {e}")
+
+    def read(self, path: Optional[str] = None) -> Iterator[Dict]:
+        """Yield logged records, oldest first (including the rotated file)."""
+        path = os.path.abspath(path) if path else self.path
+        for candidate in (f"{path}.1", path):
+            if not os.path.exists(candidate):
+                continue
+            with open(candidate, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        yield json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+
+
+query_log = QueryLog()
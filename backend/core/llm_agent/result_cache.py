@@ -0,0 +1,99 @@
+import os
+import re
+import sys
+from typing import Dict, FrozenSet, Iterable, List, Optional
+
+from core.cache import TTLCache, on_data_change
+
+
+RESULT_CACHE_MAX_SIZE = int(os.getenv("RESULT_CACHE_MAX_SIZE", "2000"))
+RESULT_CACHE_MAX_BYTES = int(os.getenv("RESULT_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+RESULT_CACHE_TTL_SEC = float(os.getenv("RESULT_CACHE_TTL_SEC", "600"))
+# Queries relative to the current time drift even without new data
+RELATIVE_TIME_TTL_SEC = float(os.getenv("RESULT_CACHE_RELATIVE_TIME_TTL_SEC", "60"))
+
+RELATIVE_TIME_PATTERN = re.compile(
+    r"\b(now|current_date|current_timestamp|localtimestamp|clock_timestamp|statement_timestamp)\b",
+    re.IGNORECASE,
+)
+
+
+STRING_LITERAL_PATTERN = re.compile(r"('(?:[^']|'')*')")
+
+
+def normalize_sql(sql: str) -> str:
+    """Whitespace- and terminator-insensitive form of a query; string literals are kept as-is."""
+    parts = STRING_LITERAL_PATTERN.split(sql)
+    # Odd indices are the captured literals
+    normalized = "".join(p if i % 2 else re.sub(r"\s+", " ", p) for i, p in enumerate(parts))
+    return normalized.strip().rstrip(";").strip()
+
+
+def referenced_tables(sql: str, known_tables: Iterable[str]) -> FrozenSet[str]:
+    """Known table names that appear as words in the query (over-matching only widens invalidation)."""
+    lowered = sql.lower()
+    return frozenset(t for t in known_tables if re.search(rf"\b{re.escape(t)}\b", lowered))
+
+
+class _Entry:
+    __slots__ = ("result", "tables")
+
+    def __init__(self, result: str, tables: FrozenSet[str]):
+        self.result = result
+        self.tables = tables
+
+
+def _entry_bytes(entry: _Entry) -> int:
+    return sys.getsizeof(entry.result)
+
+
+class ResultCache:
+    """
+    Query result cache keyed by (normalized SQL, role, fleet_id).
+
+    Each entry remembers the tables its query reads, and on_data_change drops
+    exactly the entries touching the changed tables. Size is bounded both by entry
+    count and by the bytes held in result strings.
+    """
+
+    def __init__(self, maxsize: int = RESULT_CACHE_MAX_SIZE, max_bytes: int = RESULT_CACHE_MAX_BYTES,
+                 ttl: float = RESULT_CACHE_TTL_SEC):
+        self._cache = TTLCache(
+            "query_results", maxsize=maxsize, ttl=ttl, weigher=_entry_bytes, max_weight=max_bytes
+        )
+        self.invalidations = 0
+
+    @staticmethod
+    def make_key(sql: str, role: str, fleet_id: str) -> tuple:
+        return (normalize_sql(sql), role, str(fleet_id))
+
+    def get(self, sql: str, role: str, fleet_id: str) -> Optional[str]:
+        entry = self._cache.get(self.make_key(sql, role, fleet_id))
+        return entry.result if entry is not None else None
+
+    def put(self, sql: str, role: str, fleet_id: str, result: str, known_tables: Iterable[str]) -> None:
+        ttl = RELATIVE_TIME_TTL_SEC if RELATIVE_TIME_PATTERN.search(sql) else None
+        entry = _Entry(result, referenced_tables(sql, known_tables))
+        self._cache.set(self.make_key(sql, role, fleet_id), entry, ttl=ttl)
+
+    def invalidate(self, tables: Optional[List[str]] = None) -> int:
+        """Drop entries reading any of the tables (everything if None)."""
+        if tables is None:
+            dropped = len(self._cache)
+            self._cache.clear()
+        else:
+            changed = set(tables)
+            dropped = self._cache.invalidate(lambda _, entry: bool(entry.tables & changed))
+        self.invalidations += dropped
+        return dropped
+
+    def stats(self) -> Dict:
+        stats = self._cache.stats()
+        stats["bytes"] = stats.pop("weight")
+        stats["max_bytes"] = stats.pop("max_weight")
+        stats["invalidated"] = self.invalidations
+        return stats
+
+
+result_cache = ResultCache()
+on_data_change(result_cache.invalidate)
@@ -0,0 +1,163 @@
+import os
+import csv
+import io
+import json
+import hashlib
+from dataclasses import dataclass, field, asdict
+from itertools import islice
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from langchain_community.utilities.sql_database import truncate_word
+from sqlalchemy import text
+
+from core.cache import TTLCache
+from core.db_con import tenant_transaction
+from core.llm_agent.result_cache import normalize_sql
+
+
+# Approximate tokens of result rows shown to the LLM (~4 characters per token)
+RESULT_SAMPLE_TOKENS = int(os.getenv("RESULT_SAMPLE_TOKENS", "1500"))
+MAX_STRING_LENGTH = 300
+
+# Rows fetched per server-side cursor round-trip
+FETCH_BATCH_ROWS = int(os.getenv("RESULT_FETCH_BATCH_ROWS", "500"))
+
+# How long a chat response's download link keeps working
+RESULT_TTL_SEC = float(os.getenv("RESULT_TTL_SEC", "3600"))
+RESULT_REGISTRY_MAX_SIZE = int(os.getenv("RESULT_REGISTRY_MAX_SIZE", "10000"))
+
+RESULT_FORMATS = {"csv": "text/csv", "jsonl": "application/x-ndjson"}
+
+
+@dataclass
+class QueryResult:
+    """Handle on a query result the client can download; only the sample goes to the LLM."""
+    result_id: str
+    sql: str
+    role: str
+    fleet_id: str
+    columns: List[str] = field(default_factory=list)
+    row_count: Optional[int] = None
+    sample_rows: int = 0
+    # The chat answer saw QUERY_ROW_LIMIT rows; the download has more
+    truncated: bool = False
+
+    @property
+    def download_url(self) -> str:
+        return f"/api/chat/results/{self.result_id}"
+
+    def public(self) -> Dict[str, Any]:
+        """What the client sees (no SQL or tenant details)."""
+        data = asdict(self)
+        for key in ("sql", "role", "fleet_id"):
+            data.pop(key)
+        data["download_url"] = self.download_url
+        return data
+
+
+def make_result_id(sql: str, role: str, fleet_id: str) -> str:
+    """Stable per generated query and tenant, so a cached result keeps its download link."""
+    return hashlib.sha256(f"{normalize_sql(sql)}\n{role}\n{fleet_id}".encode()).hexdigest()[:24]
+
+
+def render_row(row) -> str:
+    """One row in the format SQLDatabase.run uses, so prompts stay unchanged."""
+    return repr(tuple(truncate_word(value, length=MAX_STRING_LENGTH) for value in row))
+
+
+def stream_rows(con, sql: str) -> Tuple[List[str], Iterator]:
+    """Column names and a lazy row iterator backed by a server-side cursor."""
+    result = con.execution_options(stream_results=True, max_row_buffer=FETCH_BATCH_ROWS).execute(text(sql))
+    rows = (row for batch in result.partitions(FETCH_BATCH_ROWS) for row in batch)
+    return list(result.keys()), rows
+
+
+def sample_rows(rows: Iterator, token_budget: int = RESULT_SAMPLE_TOKENS) -> Tuple[str, int, int]:
+    """
+    Render rows for the LLM until the token budget is spent, then only count the
+    rest. Memory stays flat however many rows the cursor yields.
+    Returns the rendered rows, how many were rendered and the total row count.
+    """
+    budget = token_budget * 4
+    rendered: List[str] = []
+    used = total = 0
+    full = False
+    for row in rows:
+        total += 1
+        if full:
+            continue
+        line = render_row(row)
+        if rendered and used + len(line) > budget:
+            full = True
+            continue
+        rendered.append(line)
+        used += len(line) + 2
+    return ("[" + ", ".join(rendered) + "]" if rendered else ""), len(rendered), total
+
+
+def sample_note(shown: int, total: int, columns: List[str]) -> str:
+    """Tells the LLM the rows are a sample, so it does not present them as complete."""
+    return (
+        f"\n\nShowing the first {shown} of {total} rows (columns: {', '.join(columns)}). "
+        f"The user can download the full result; describe these rows as a sample "
+        f"and state the total of {total} rows."
+    )
+
+
+class ResultRegistry:
+    """
+    Query results referenced from chat responses, by result id.
+
+    Nothing but the SQL, tenant and shape is kept: a download re-runs the SQL
+    in the same tenant's read-only transaction and streams it from a
+    server-side cursor, so memory stays flat for any result size.
+    """
+
+    def __init__(self, maxsize: int = RESULT_REGISTRY_MAX_SIZE, ttl: float = RESULT_TTL_SEC):
+        self._results = TTLCache("query_result_links", maxsize=maxsize, ttl=ttl)
+
+    def register(self, result_id: str, sql: str, role: str, fleet_id: str, columns: Optional[List[str]] = None,
+                 row_count: Optional[int] = None, sample_rows: int = 0, truncated: bool = False) -> QueryResult:
+        """
+        Remember how to re-run a result; sql is the generated query without the
+        row limit the guard injected, so the download is the full result.
+        """
+        result = QueryResult(result_id, sql, role, str(fleet_id), columns or [], row_count, sample_rows, truncated)
+        self._results.set(result.result_id, result)
+        return result
+
+    def get(self, result_id: str) -> Optional[QueryResult]:
+        return self._results.get(result_id)
+
+    def find(self, query: str, role: str, fleet_id: str) -> Optional[QueryResult]:
+        """The result registered for a generated query (as the LLM wrote it) and tenant."""
+        return self.get(make_result_id(query, role, fleet_id))
+
+    def iter_download(self, result: QueryResult, fmt: str = "csv", offset: int = 0,
+                      limit: Optional[int] = None) -> Iterator[str]:
+        """CSV or JSON-lines chunks of the result rows [offset, offset + limit), in query order."""
+        with tenant_transaction(result.role, result.fleet_id) as con:
+            con.execute(text("SET LOCAL transaction_read_only = on"))
+            columns, rows = stream_rows(con, result.sql)
+            rows = islice(rows, offset, offset + limit if limit is not None else None)
+
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            if fmt == "csv":
+                writer.writerow(columns)
+            for i, row in enumerate(rows, 1):
+                if fmt == "csv":
+                    writer.writerow(row)
+                else:
+                    buffer.write(json.dumps(dict(zip(columns, row)), default=str) + "\n")
+                if i % FETCH_BATCH_ROWS == 0:
+                    yield buffer.getvalue()
+                    buffer.seek(0)
+                    buffer.truncate()
+            yield buffer.getvalue()
+
+    def stats(self) -> Dict:
+        return self._results.stats()
+
+
+result_registry = ResultRegistry()
@@ -0,0 +1,150 @@
+import hashlib
+import threading
+from typing import Dict, List, Optional
+
+from langchain_community.utilities import SQLDatabase
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import SQLAlchemyError
+
+from core.cache import TTLCache, on_data_change
+from core.db_con import engine, tenant_transaction
+from core.setup_database.schema import ALL_TABLE_QUERIES
+from core.setup_database.roles import APP_ROLES
+
+
+SAMPLE_ROWS_IN_TABLE_INFO = 3
+SAMPLE_ROWS_TTL_SEC = 3600
+
+
+class SchemaCatalog:
+    """
+    In-memory snapshot of the agent-visible schema.
+
+    Table names, DDL and column types are reflected once (at startup, or lazily on
+    first use) and served from memory to sql_db_list_tables and sql_db_schema.
+    Sample rows depend on RLS, so they are cached per (role, fleet_id, table).
+    Call invalidate() after imports or schema changes.
+    """
+
+    def __init__(self, engine: Engine, tables: Optional[List[str]] = None):
+        self.engine = engine
+        self.tables = tables or list(ALL_TABLE_QUERIES)
+        self._lock = threading.Lock()
+        self._loaded = False
+        self._table_names: List[str] = []
+        self._ddl: Dict[str, str] = {}
+        self._columns: Dict[str, Dict[str, str]] = {}
+        self._fingerprint = ""
+        self._samples = TTLCache("schema_samples", maxsize=1024, ttl=SAMPLE_ROWS_TTL_SEC)
+
+    def refresh(self) -> None:
+        """Reflect table DDL and column types from the database."""
+        db = SQLDatabase(self.engine, include_tables=self.tables, sample_rows_in_table_info=0)
+        table_names = list(db.get_usable_table_names())
+        ddl = {t: db.get_table_info([t]).strip() for t in table_names}
+        columns = {
+            t: {c.name: str(c.type) for c in db._metadata.tables[t].columns}
+            for t in table_names
+        }
+        with self._lock:
+            self._table_names = table_names
+            self._ddl = ddl
+            self._columns = columns
+            self._fingerprint = hashlib.sha256(
+                "\n".join(ddl[t] for t in table_names).encode()
+            ).hexdigest()[:16]
+            self._loaded = True
+        print(f"Schema catalog loaded: {len(table_names)} tables ({self._fingerprint})")
+
+    def ensure_loaded(self) -> None:
+        if not self._loaded:
+            self.refresh()
+
+    def invalidate(self, tables: Optional[List[str]] = None) -> None:
+        """Drop cached sample rows for the tables (all if None); a full invalidation also re-reflects DDL."""
+        if tables is None:
+            self._samples.clear()
+            with self._lock:
+                self._loaded = False
+        else:
+            changed = set(tables)
+            self._samples.invalidate(lambda key, _: key[2] in changed)
+
+    def table_names(self) -> List[str]:
+        self.ensure_loaded()
+        return list(self._table_names)
+
+    def columns(self, table: str) -> Dict[str, str]:
+        """Column name -> SQL type for a table."""
+        self.ensure_loaded()
+        return dict(self._columns.get(table, {}))
+
+    @property
+    def fingerprint(self) -> str:
+        """Short hash of the reflected DDL; changes whenever the schema does."""
+        self.ensure_loaded()
+        return self._fingerprint
+
+    def _sample_rows(self, con, table: str) -> str:
+        result = con.execute(text(f'SELECT * FROM "{table}" LIMIT {SAMPLE_ROWS_IN_TABLE_INFO}'))
+        columns_str = "\t".join(result.keys())
+        sample_rows_str = "\n".join(
+            "\t".join(str(v)[:100] for v in row) for row in result
+        )
+        return (
+            f"{SAMPLE_ROWS_IN_TABLE_INFO} rows from {table} table:\n"
+            f"{columns_str}\n"
+            f"{sample_rows_str}"
+        )
+
+    def table_info(self, tables: List[str], role: str, fleet_id: str) -> str:
+        """DDL plus tenant-visible sample rows, in the format of SQLDatabase.get_table_info."""
+        self.ensure_loaded()
+        unknown = [t for t in tables if t not in self._ddl]
+        if unknown:
+            raise ValueError(f"table_names {set(unknown)} not found in database")
+
+        samples = {t: self._samples.get((role, fleet_id, t)) for t in tables}
+        missing = [t for t, sample in samples.items() if sample is None]
+        if missing:
+            with tenant_transaction(role, fleet_id) as con:
+                for t in missing:
+                    samples[t] = self._sample_rows(con, t)
+                    self._samples.set((role, fleet_id, t), samples[t])
+
+        return "\n\n".join(
+            f"{self._ddl[t]}\n\n/*\n{samples[t]}\n*/" for t in tables
+        )
+
+    def warm(self, fleet_ids: List[str], roles: List[str]) -> None:
+        """Reflect the schema and prefetch sample rows for the given tenants."""
+        self.refresh()
+        for fleet_id in fleet_ids:
+            for role in roles:
+                try:
+                    self.table_info(self._table_names, role, fleet_id)
+                except (ValueError, SQLAlchemyError) as e:
+                    print(f"Failed to warm schema samples for {role}/{fleet_id}: {e}")
+
+    def stats(self) -> Dict:
+        return {
+            "loaded": self._loaded,
+            "tables": len(self._table_names),
+            "fingerprint": self._fingerprint,
+            "samples": self._samples.stats(),
+        }
+
+
+schema_catalog = SchemaCatalog(engine)
+on_data_change(schema_catalog.invalidate)
+
+
+def warm_schema_catalog() -> None:
+    """Load the schema catalog and sample rows for every known fleet (blocking; run at startup)."""
+    try:
+        with engine.connect() as con:
+            fleet_ids = [str(r[0]) for r in con.execute(text("SELECT fleet_id FROM fleets"))]
+        schema_catalog.warm(fleet_ids, APP_ROLES)
+    except SQLAlchemyError as e:
+        print(f"Schema catalog warm-up failed, will load lazily: {e}")
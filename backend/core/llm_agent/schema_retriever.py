@@ -0,0 +1,217 @@
+import os
+import re
+import math
+import threading
+from collections import Counter
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+
+from core.llm_agent.prompts import PromptRegistry, prompt_registry
+from core.setup_database.schema import get_primary_keys, get_table_columns
+
+
+# local: always use the retriever; hybrid: ask the LLM when the retriever is unsure;
+# llm: always ask the LLM (the original CallGetSchemaNode behaviour)
+SCHEMA_RETRIEVER_MODES = ["local", "hybrid", "llm"]
+SCHEMA_RETRIEVER_MODE = os.getenv("SCHEMA_RETRIEVER_MODE", "hybrid")
+# Best table score below which hybrid mode falls back to the LLM
+SCHEMA_RETRIEVER_MIN_SCORE = float(os.getenv("SCHEMA_RETRIEVER_MIN_SCORE", "0.3"))
+
+# Tables kept relative to the best score, and the most returned before join expansion
+RELATIVE_CUTOFF = 0.5
+MAX_TABLES = 4
+
+# Token weights in a table's document
+TABLE_NAME_WEIGHT = 3.0
+COLUMN_WEIGHT = 1.0
+TERM_WEIGHT = 2.0
+DESCRIPTION_WEIGHT = 0.5
+# A semantic map term appearing verbatim in the question
+PHRASE_WEIGHT = 3.0
+
+STOP_WORDS = {
+    "a", "an", "and", "any", "are", "by", "did", "do", "does", "for", "from", "get",
+    "give", "has", "have", "how", "i", "in", "is", "it", "me", "my", "of", "on", "or",
+    "our", "show", "than", "that", "the", "their", "there", "this", "to", "was", "we",
+    "were", "what", "which", "who", "with", "e", "g", "id",
+}
+
+# Question wording -> the token the schema uses
+SYNONYMS = {
+    "temperature": "temp", "battery": "batt", "kilometer": "km", "kilometre": "km",
+    "ev": "vehicle", "evs": "vehicle", "van": "vehicle", "bus": "vehicle", "car": "vehicle",
+    "charge": "charging", "charged": "charging", "driven": "driving", "drove": "driving",
+    "drive": "driving", "hour": "hours", "currently": "current", "now": "current",
+    "latest": "current", "plate": "registration", "average": "avg", "mean": "avg",
+    "use": "usage", "used": "usage", "utilization": "usage", "utilisation": "usage",
+    "day": "daily",
+}
+
+# Every query is already scoped to the tenant's fleet by RLS, so these say little
+# about which tables are needed; their tokens count for SCOPE_WEIGHT
+SCOPE_WEIGHT = 0.25
+SCOPE_PHRASES = re.compile(r"\b(?:my|our|the|whole|entire) fleet\b|\bfleet[- ]?wide\b")
+
+# Questions naming a specific vehicle or driver, e.g. "GBM6296G", need these columns
+IDENTIFIER_COLUMNS = {"registration_no", "vin", "license_no"}
+IDENTIFIER_TOKEN = "__identifier__"
+
+
+def stem(token: str) -> str:
+    """Crude plural stripping, enough for schema vocabulary (trips -> trip)."""
+    if len(token) > 3 and token.endswith("ies"):
+        return token[:-3] + "y"
+    if len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+        return token[:-1]
+    return token
+
+
+def tokenize(value: str) -> List[str]:
+    """Lowercase word tokens, split on underscores, stop words dropped, synonyms applied."""
+    tokens = []
+    for raw in re.findall(r"[a-z0-9]+", value.lower().replace("_", " ")):
+        if raw in STOP_WORDS:
+            continue
+        token = stem(raw)
+        token = SYNONYMS.get(raw, SYNONYMS.get(token, token))
+        tokens.append(token)
+    return tokens
+
+
+def is_identifier(token: str) -> bool:
+    """Alphanumeric codes such as registration plates (letters and digits mixed)."""
+    return bool(re.fullmatch(r"[a-z]+\d+[a-z0-9]*|\d+[a-z]+[a-z0-9]*", token))
+
+
+@dataclass
+class Retrieval:
+    tables: List[str]
+    scores: Dict[str, float]
+    confidence: float
+
+
+class SchemaRetriever:
+    """
+    Ranks agent-visible tables for a question without an LLM call.
+
+    Each table is a TF-IDF document built from its name, its column names and the
+    semantic map terms and descriptions pointing at its columns. Questions are
+    scored by cosine similarity; the best tables are kept and then expanded along
+    key relationships (e.g. vehicles for a registration plate).
+
+    The semantic map comes from the prompt registry, and the documents are rebuilt
+    whenever its version changes, so map edits hot-reload here as in the prompts.
+    """
+
+    def __init__(self, registry: PromptRegistry = prompt_registry):
+        self.registry = registry
+        self.columns = get_table_columns()
+        self.tables = list(self.columns)
+        self._lock = threading.Lock()
+        self._version: Optional[str] = None
+
+        # Join edges: a column that is another table's primary key (vehicle_id -> vehicles)
+        key_owners = {keys[0]: table for table, keys in get_primary_keys().items() if len(keys) == 1}
+        self.neighbours = {
+            table: sorted({key_owners[c] for c in columns if c in key_owners} - {table})
+            for table, columns in self.columns.items()
+        }
+        self._reload_if_changed()
+
+    def _reload_if_changed(self) -> None:
+        version = self.registry.version
+        if version == self._version:
+            return
+        with self._lock:
+            if version != self._version:
+                self._build(self.registry.semantic_map())
+                self._version = version
+
+    def _build(self, semantic_map: Dict[str, Any]) -> None:
+        documents: Dict[str, Counter] = {t: Counter() for t in self.tables}
+        for table, columns in self.columns.items():
+            for token in tokenize(table):
+                documents[table][token] += TABLE_NAME_WEIGHT
+            for column in columns:
+                for token in tokenize(column):
+                    documents[table][token] += COLUMN_WEIGHT
+            if IDENTIFIER_COLUMNS & set(columns):
+                documents[table][IDENTIFIER_TOKEN] += TABLE_NAME_WEIGHT
+
+        # Verbatim term phrases, e.g. "soc comfort zone", become a token of their own
+        phrases: Dict[str, str] = {}
+        for term, info in semantic_map.items():
+            tables = {c.split(".")[0] for c in info["columns"]} & set(self.tables)
+            term_tokens = tokenize(str(term))
+            phrase_token = "__term__" + "_".join(term_tokens)
+            phrases[" ".join(term_tokens)] = phrase_token
+            for table in tables:
+                for token in term_tokens:
+                    documents[table][token] += TERM_WEIGHT
+                for token in tokenize(info.get("description", "")):
+                    documents[table][token] += DESCRIPTION_WEIGHT
+                documents[table][phrase_token] += PHRASE_WEIGHT
+
+        # Inverse document frequency, smoothed so tokens in every table still count a little
+        n = len(self.tables)
+        df = Counter(token for doc in documents.values() for token in doc)
+        idf = {token: math.log((1 + n) / (1 + count)) + 1 for token, count in df.items()}
+        vectors = {t: self._weigh(doc, idf) for t, doc in documents.items()}
+        # Swapped in together, so concurrent questions never mix old and new documents
+        self.phrases, self.idf, self.vectors = phrases, idf, vectors
+
+    def _weigh(self, counts: Counter, idf: Optional[Dict[str, float]] = None) -> Dict[str, float]:
+        idf = self.idf if idf is None else idf
+        vector = {t: c * idf.get(t, 0.0) for t, c in counts.items()}
+        norm = math.sqrt(sum(v * v for v in vector.values())) or 1.0
+        return {t: v / norm for t, v in vector.items()}
+
+    def _question_counts(self, question: str) -> Counter:
+        question = question.lower()
+        tokens = tokenize(SCOPE_PHRASES.sub(" ", question))
+        counts = Counter(tokens)
+        for phrase in SCOPE_PHRASES.findall(question):
+            for token in tokenize(phrase):
+                counts[token] += SCOPE_WEIGHT
+        if any(is_identifier(t) and t not in self.idf for t in tokens):
+            counts[IDENTIFIER_TOKEN] += 1
+        padded = f" {' '.join(tokens)} "
+        for phrase, phrase_token in self.phrases.items():
+            if phrase and f" {phrase} " in padded:
+                counts[phrase_token] += 1
+        return counts
+
+    def score(self, question: str) -> Dict[str, float]:
+        """Cosine similarity of the question to every table, best first."""
+        self._reload_if_changed()
+        query = self._weigh(self._question_counts(question))
+        scores = {
+            table: sum(weight * vector.get(token, 0.0) for token, weight in query.items())
+            for table, vector in self.vectors.items()
+        }
+        return dict(sorted(scores.items(), key=lambda item: item[1], reverse=True))
+
+    def retrieve(self, question: str) -> Retrieval:
+        """Tables to request schemas for, with their scores and the best score as confidence."""
+        scores = self.score(question)
+        best = next(iter(scores.values()), 0.0)
+        if best <= 0:
+            return Retrieval(tables=[], scores=scores, confidence=0.0)
+
+        selected = [t for t, s in scores.items() if s >= best * RELATIVE_CUTOFF][:MAX_TABLES]
+
+        # Add join partners the question also touches, so their columns can be joined in
+        counts = self._question_counts(question)
+        for table in list(selected):
+            for neighbour in self.neighbours[table]:
+                wanted = scores[neighbour] > 0 and (
+                    IDENTIFIER_TOKEN in counts and IDENTIFIER_TOKEN in self.vectors[neighbour]
+                    or scores[neighbour] >= best * RELATIVE_CUTOFF / 2
+                )
+                if wanted and neighbour not in selected:
+                    selected.append(neighbour)
+
+        return Retrieval(tables=selected, scores=scores, confidence=best)
+
+
+schema_retriever = SchemaRetriever()
@@ -0,0 +1,363 @@
+import os
+from dataclasses import dataclass, field
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Optional
+
+import sqlglot
+from sqlglot import exp
+from sqlglot.errors import ParseError, SqlglotError
+from sqlglot.optimizer.qualify import qualify
+from sqlglot.optimizer.scope import Scope, traverse_scope
+
+from core.llm_agent.schema_catalog import SchemaCatalog
+
+
+# local: never call the LLM checker; hybrid: call it only for problems the validator
+# cannot fix itself; llm: always call it (the original CheckQueryNode behaviour)
+SQL_VALIDATOR_MODES = ["local", "hybrid", "llm"]
+SQL_VALIDATOR_MODE = os.getenv("SQL_VALIDATOR_MODE", "hybrid")
+
+# Functions that change session state, block, or reach outside the database.
+# set_config could rewrite app.fleet_id mid-statement and sidestep RLS.
+UNSAFE_FUNCTIONS = {
+    "set_config", "pg_sleep", "pg_sleep_for", "pg_sleep_until",
+    "pg_terminate_backend", "pg_cancel_backend", "pg_reload_conf", "pg_rotate_logfile",
+    "pg_read_file", "pg_read_binary_file", "pg_ls_dir", "pg_stat_file",
+    "lo_import", "lo_export", "dblink", "dblink_exec", "nextval", "setval",
+    "pg_advisory_lock", "pg_advisory_xact_lock", "txid_current",
+}
+
+# PostgreSQL's special date/time input strings
+SPECIAL_TIME_LITERALS = {"now", "today", "yesterday", "tomorrow", "epoch", "infinity", "-infinity"}
+BOOLEAN_LITERALS = {"t", "f", "true", "false", "y", "n", "yes", "no", "on", "off", "1", "0"}
+
+COMPARISONS = (exp.EQ, exp.NEQ, exp.GT, exp.GTE, exp.LT, exp.LTE)
+
+
+def type_family(sql_type: Optional[str]) -> Optional[str]:
+    """Coarse family of a reflected column type: numeric, text, temporal or boolean."""
+    if not sql_type:
+        return None
+    sql_type = sql_type.upper()
+    if sql_type.startswith(("TIMESTAMP", "DATE")):
+        return "temporal"
+    if sql_type.startswith("BOOL"):
+        return "boolean"
+    if sql_type.startswith(("INT", "BIGINT", "SMALLINT", "DOUBLE", "REAL", "FLOAT", "NUMERIC", "DECIMAL")):
+        return "numeric"
+    if sql_type.startswith(("TEXT", "VARCHAR", "CHAR")):
+        return "text"
+    return None
+
+
+def parse_number(value: str) -> Optional[float]:
+    try:
+        return float(value)
+    except ValueError:
+        return None
+
+
+def parse_time(value: str) -> Optional[datetime]:
+    try:
+        return datetime.fromisoformat(value.strip())
+    except ValueError:
+        return None
+
+
+def describe_error(e: SqlglotError) -> str:
+    """First parse error without sqlglot's highlighted excerpt."""
+    if isinstance(e, ParseError) and e.errors:
+        error = e.errors[0]
+        return f"{error['description']} near '{error['highlight']}' (line {error['line']}, col {error['col']})"
+    return str(e)
+
+
+def is_date_only(value: str) -> bool:
+    try:
+        date.fromisoformat(value.strip())
+        return True
+    except ValueError:
+        return False
+
+
+@dataclass
+class Validation:
+    """Outcome of validating one query: the (possibly auto-fixed) SQL and what was found."""
+    sql: str
+    fixes: List[str] = field(default_factory=list)
+    problems: List[str] = field(default_factory=list)
+
+    @property
+    def ok(self) -> bool:
+        return not self.problems
+
+
+# ============================================================================
+# READ-ONLY
+# ============================================================================
+
+def read_only_problems(tree: exp.Expression) -> List[str]:
+    """Why a parsed statement is not a plain read (empty if it is)."""
+    if not isinstance(tree, exp.Query):
+        return [f"Only SELECT queries are allowed, got {tree.key.upper()}"]
+
+    problems = []
+    for node in tree.find_all(exp.DML, exp.DDL, exp.Command, exp.Into):
+        if isinstance(node, exp.Into):
+            problems.append("SELECT INTO creates a table; only plain SELECT queries are allowed")
+        else:
+            problems.append(f"Data-modifying {node.key.upper()} is not allowed")
+    for func in tree.find_all(exp.Func):
+        name = func.name.lower() if isinstance(func, exp.Anonymous) else func.sql_name().lower()
+        if name in UNSAFE_FUNCTIONS:
+            problems.append(f"Function {name}() is not allowed")
+    return problems
+
+
+def check_read_only(sql: str, dialect: str = "postgres") -> Optional[str]:
+    """The reason a query may not run (multiple statements, writes, unsafe functions), or None."""
+    try:
+        statements = [s for s in sqlglot.parse(sql, read=dialect) if s is not None]
+    except SqlglotError as e:
+        return f"Could not parse the query to verify it is read-only: {describe_error(e)}"
+    if len(statements) != 1:
+        return "Exactly one SQL statement must be given"
+    problems = read_only_problems(statements[0])
+    return "; ".join(problems) if problems else None
+
+
+# ============================================================================
+# VALIDATOR
+# ============================================================================
+
+class SQLValidator:
+    """
+    Static checks for generated SQL, run locally instead of an LLM review.
+
+    Parses the query, enforces a single read-only statement, resolves every table
+    and column against the schema catalog and looks for the mistakes the LLM
+    checker is prompted for. Mechanical ones are fixed in place:
+    - col = NULL / col <> NULL              -> IS NULL / IS NOT NULL
+    - NOT IN (subquery) or with NULL items  -> NULLs filtered out (plain subqueries only)
+    - timestamp BETWEEN 'date' AND 'date'   -> half-open range covering the last day
+    - BETWEEN with reversed bounds          -> bounds swapped
+    - literals of the wrong type            -> cast where unambiguous (soc_pct > '30')
+    - SELECT ... FOR UPDATE/SHARE           -> lock clause dropped
+    Anything else is reported as a problem for the LLM checker.
+    """
+
+    def __init__(self, catalog: SchemaCatalog, dialect: str = "postgres"):
+        self.catalog = catalog
+        self.dialect = "postgres" if dialect == "postgresql" else dialect
+
+    def schema(self) -> Dict[str, Dict[str, str]]:
+        """table -> column -> type, as sqlglot schema input."""
+        return {t: self.catalog.columns(t) for t in self.catalog.table_names()}
+
+    def validate(self, sql: str) -> Validation:
+        result = Validation(sql=sql.strip())
+        try:
+            statements = [s for s in sqlglot.parse(sql, read=self.dialect) if s is not None]
+        except SqlglotError as e:
+            result.problems.append(f"Syntax error: {describe_error(e)}")
+            return result
+        if len(statements) != 1:
+            result.problems.append("Exactly one SQL statement must be given")
+            return result
+
+        tree = statements[0]
+        result.problems += read_only_problems(tree)
+        if result.problems:
+            return result
+
+        schema = self.schema()
+        if not self._resolve(tree, schema, result):
+            return result
+
+        self._fix_locks(tree, result)
+        for scope in traverse_scope(tree):
+            self._check_scope(scope, schema, result)
+
+        if result.fixes:
+            result.sql = tree.sql(dialect=self.dialect)
+        return result
+
+    def _resolve(self, tree: exp.Expression, schema: Dict[str, Dict[str, str]], result: Validation) -> bool:
+        """Report unknown tables and columns; False if the query does not resolve."""
+        cte_names = {cte.alias_or_name for cte in tree.find_all(exp.CTE)}
+        unknown = sorted({
+            table.name for table in tree.find_all(exp.Table)
+            if isinstance(table.this, exp.Identifier)
+            and table.name not in schema and table.name not in cte_names
+        })
+        for table in unknown:
+            result.problems.append(
+                f"Table '{table}' does not exist; available tables: {', '.join(schema)}"
+            )
+        if unknown:
+            return False
+
+        try:
+            qualify(tree.copy(), schema=schema, dialect=self.dialect)
+        except SqlglotError as e:
+            message = str(e).split(". Line:")[0]
+            tables = sorted({t.name for t in tree.find_all(exp.Table) if t.name in schema})
+            columns = "; ".join(f"{t}: {', '.join(schema[t])}" for t in tables)
+            result.problems.append(f"{message}. Columns of the tables used - {columns}")
+            return False
+        return True
+
+    def _fix_locks(self, tree: exp.Expression, result: Validation) -> None:
+        for select in tree.find_all(exp.Select):
+            if select.args.get("locks"):
+                select.set("locks", None)
+                result.fixes.append("Dropped the row-locking clause (FOR UPDATE/SHARE)")
+
+    def _column_type(self, column: exp.Column, scope: Scope, schema: Dict[str, Dict[str, str]]) -> Optional[str]:
+        """Type of a column reading from a base table in this scope, if unambiguous."""
+        name = column.name.lower()
+        if column.table:
+            sources = [scope.sources.get(column.table)]
+        else:
+            sources = list(scope.sources.values())
+        types = [
+            schema[source.name][name] for source in sources
+            if isinstance(source, exp.Table) and name in schema.get(source.name, {})
+        ]
+        return types[0] if len(types) == 1 else None
+
+    def _check_scope(self, scope: Scope, schema: Dict[str, Dict[str, str]], result: Validation) -> None:
+        def own(node: exp.Expression) -> bool:
+            return node.find_ancestor(exp.Select) is scope.expression
+
+        def family(node: exp.Expression) -> Optional[str]:
+            if isinstance(node, exp.Column):
+                return type_family(self._column_type(node, scope, schema))
+            return None
+
+        predicates = [node for node in scope.expression.find_all(*COMPARISONS, exp.In, exp.Between) if own(node)]
+        for node in predicates:
+            if isinstance(node, (exp.EQ, exp.NEQ)) and isinstance(node.expression, exp.Null):
+                self._fix_null_comparison(node, result)
+            elif isinstance(node, COMPARISONS):
+                self._check_literal(node.this, node.expression, family(node.this), result)
+                self._check_literal(node.expression, node.this, family(node.expression), result)
+            elif isinstance(node, exp.In):
+                for item in node.expressions:
+                    self._check_literal(node.this, item, family(node.this), result)
+                if isinstance(node.parent, exp.Not):
+                    self._fix_not_in(node, result)
+            elif isinstance(node, exp.Between):
+                for bound in (node.args["low"], node.args["high"]):
+                    self._check_literal(node.this, bound, family(node.this), result)
+                self._fix_between(node, family(node.this), self._column_type(node.this, scope, schema)
+                                  if isinstance(node.this, exp.Column) else None, result)
+
+    def _fix_null_comparison(self, node: exp.Expression, result: Validation) -> None:
+        operator = "=" if isinstance(node, exp.EQ) else "<>"
+        fixed = exp.Is(this=node.this.copy(), expression=exp.Null())
+        replacement = fixed if isinstance(node, exp.EQ) else exp.Not(this=fixed)
+        node.replace(replacement)
+        result.fixes.append(f"Replaced '{operator} NULL' (never true) with '{replacement.sql(dialect=self.dialect)}'")
+
+    def _fix_not_in(self, node: exp.In, result: Validation) -> None:
+        """NOT IN is never true once a NULL is among the values; filter them out."""
+        nulls = [item for item in node.expressions if isinstance(item, exp.Null)]
+        for item in nulls:
+            item.pop()
+        if nulls:
+            result.fixes.append("Removed NULL from a NOT IN list (it makes NOT IN match nothing)")
+
+        query = node.args.get("query")
+        subquery = query.this if isinstance(query, exp.Subquery) else query
+        if subquery is None:
+            return
+        projection = subquery.expressions[0].unalias() if isinstance(subquery, exp.Select) else None
+        if projection is None or len(subquery.expressions) != 1 or not self._null_filterable(subquery, projection):
+            result.problems.append(
+                "NOT IN over a subquery matches nothing if the subquery returns a NULL; "
+                "use NOT EXISTS instead"
+            )
+            return
+        subquery.where(exp.Not(this=exp.Is(this=projection.copy(), expression=exp.Null())), copy=False)
+        result.fixes.append(
+            f"Filtered NULLs out of the NOT IN subquery ({projection.sql(dialect=self.dialect)} IS NOT NULL)"
+        )
+
+    @staticmethod
+    def _null_filterable(subquery: exp.Select, projection: exp.Expression) -> bool:
+        """
+        Whether 'projection IS NOT NULL' can go into the subquery's WHERE without
+        changing anything but the NULLs: not for aggregates or window functions
+        (not allowed in WHERE), GROUP BY, DISTINCT or LIMIT (the filter would
+        change which rows are grouped or kept), nor set-returning or unknown
+        functions.
+        """
+        if isinstance(projection, exp.Star):
+            return False
+        if any(subquery.args.get(clause) for clause in ("group", "having", "distinct", "limit", "offset", "fetch")):
+            return False
+        return projection.find(exp.AggFunc, exp.Window, exp.Subquery, exp.Unnest, exp.Explode,
+                               exp.GenerateSeries, exp.Anonymous) is None
+
+    def _fix_between(self, node: exp.Between, family: Optional[str], sql_type: Optional[str], result: Validation) -> None:
+        low, high = node.args["low"], node.args["high"]
+        if not (isinstance(low, exp.Literal) and isinstance(high, exp.Literal)):
+            return
+
+        if family == "numeric" or (not low.is_string and not high.is_string):
+            bounds = parse_number(low.this), parse_number(high.this)
+        elif family == "temporal":
+            bounds = parse_time(low.this), parse_time(high.this)
+        else:
+            return
+        if None in bounds:
+            return
+        if bounds[0] > bounds[1]:
+            low, high = high.copy(), low.copy()
+            node.set("low", low)
+            node.set("high", high)
+            bounds = bounds[1], bounds[0]
+            result.fixes.append("Swapped reversed BETWEEN bounds (BETWEEN needs low AND high)")
+
+        # BETWEEN '2024-01-01' AND '2024-01-07' on a timestamp stops at 2024-01-07 00:00
+        if family == "temporal" and sql_type.upper().startswith("TIMESTAMP") and is_date_only(high.this):
+            end = (date.fromisoformat(high.this.strip()) + timedelta(days=1)).isoformat()
+            column = node.this
+            half_open = exp.Paren(this=exp.And(
+                this=exp.GTE(this=column.copy(), expression=low.copy()),
+                expression=exp.LT(this=column.copy(), expression=exp.Literal.string(end)),
+            ))
+            node.replace(half_open)
+            result.fixes.append(
+                f"Rewrote timestamp BETWEEN with a date upper bound as a half-open range "
+                f"(< '{end}') so the whole last day is included"
+            )
+
+    def _check_literal(self, column: exp.Expression, literal: exp.Expression,
+                       family: Optional[str], result: Validation) -> None:
+        """Compare a literal against the column's type family; cast or report mismatches."""
+        if family is None or not isinstance(literal, exp.Literal):
+            return
+        value, name = literal.this, column.sql(dialect=self.dialect)
+
+        if family == "numeric" and literal.is_string:
+            if parse_number(value) is None:
+                result.problems.append(f"Type mismatch: numeric column {name} compared with text '{value}'")
+            else:
+                literal.replace(exp.Literal.number(value.strip()))
+                result.fixes.append(f"Compared numeric column {name} with the number {value.strip()} instead of text")
+        elif family == "text" and not literal.is_string:
+            literal.replace(exp.Literal.string(value))
+            result.fixes.append(f"Compared text column {name} with '{value}' as text")
+        elif family == "temporal":
+            if not literal.is_string:
+                result.problems.append(f"Type mismatch: date/time column {name} compared with the number {value}")
+            elif parse_time(value) is None and value.strip().lower() not in SPECIAL_TIME_LITERALS:
+                result.problems.append(f"Type mismatch: '{value}' is not a valid date/time for column {name}")
+        elif family == "boolean":
+            if not literal.is_string and value in ("0", "1"):
+                literal.replace(exp.Boolean(this=value == "1"))
+                result.fixes.append(f"Compared boolean column {name} with {'TRUE' if value == '1' else 'FALSE'}")
+            elif not literal.is_string or value.strip().lower() not in BOOLEAN_LITERALS:
+                result.problems.append(f"Type mismatch: boolean column {name} compared with {literal.sql()}")
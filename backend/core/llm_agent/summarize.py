@@ -0,0 +1,194 @@
+import os
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+import numpy as np
+
+
+# Results with more rows than this reach the LLM with a digest after the rows (0 disables)
+RESULT_DIGEST_MIN_ROWS = int(os.getenv("RESULT_DIGEST_MIN_ROWS", "20"))
+
+DIGEST_TOP_K = 3
+# Numeric columns ranked in top/bottom lists and grouped in totals
+DIGEST_MAX_RANKED_COLUMNS = 4
+# A text column with at most this many distinct values is used for group totals
+DIGEST_MAX_GROUPS = 12
+DIGEST_CELL_WIDTH = 40
+
+
+def fmt_number(value: float) -> str:
+    """Exact enough for prose: two decimals at most, no trailing zeros, thousands separators."""
+    if np.isnan(value):
+        return "null"
+    if abs(value) < 1e-9:
+        return "0"  # Floating-point noise, e.g. the std of a constant column
+    if abs(value) < 0.01:
+        return f"{value:.3g}"
+    return f"{value:,.2f}".rstrip("0").rstrip(".")
+
+
+def fmt_cell(value: Any) -> str:
+    if value is None:
+        return "null"
+    if isinstance(value, (float, Decimal)):
+        return fmt_number(float(value))
+    text = str(value)
+    return text if len(text) <= DIGEST_CELL_WIDTH else text[:DIGEST_CELL_WIDTH - 3] + "..."
+
+
+def column_kind(values: List[Any]) -> str:
+    """numeric, boolean, temporal, text, or empty (all NULL), from the first non-NULL value."""
+    sample = next((v for v in values if v is not None), None)
+    if sample is None:
+        return "empty"
+    if isinstance(sample, bool):
+        return "boolean"
+    if isinstance(sample, (int, float, Decimal)):
+        return "numeric"
+    if isinstance(sample, (datetime, date)):
+        return "temporal"
+    return "text"
+
+
+class ColumnCollector:
+    """
+    Gathers streamed rows column by column, for vectorized summaries once the
+    cursor is drained. Only results with more than min_rows rows are kept in
+    full; values stays None for smaller ones.
+    """
+
+    def __init__(self, columns: List[str], min_rows: int = RESULT_DIGEST_MIN_ROWS):
+        self.names = columns
+        self.min_rows = min_rows
+        self.values: Optional[List[List[Any]]] = None
+
+    def collect(self, rows: Iterable) -> Iterator:
+        """Pass rows through unchanged while keeping their values."""
+        head = []
+        for row in rows:
+            if self.values is not None:
+                for values, value in zip(self.values, row):
+                    values.append(value)
+            else:
+                head.append(row)
+                if len(head) > self.min_rows:
+                    self.values = [list(col) for col in zip(*head)] or [[] for _ in self.names]
+                    head = None
+            yield row
+
+class ResultDigest:
+    """
+    Exact, compact description of a query result for the answer LLM.
+
+    Arithmetic the model would otherwise do over raw tuples (totals, averages,
+    most/least, group sums) is computed here with NumPy over every row, so the
+    figures are correct even when only a sample of the rows fits the prompt.
+    """
+
+    def __init__(self, columns: List[str], values: List[List[Any]]):
+        self.columns = columns
+        self.values = values
+        self.rows = len(values[0]) if values else 0
+        self.kinds = {name: column_kind(col) for name, col in zip(columns, values)}
+        self.numeric: Dict[str, np.ndarray] = {
+            name: np.array([np.nan if v is None else float(v) for v in col], dtype=float)
+            for name, col in zip(columns, values) if self.kinds[name] == "numeric"
+        }
+        self.labels: Dict[str, np.ndarray] = {
+            name: np.array(["null" if v is None else str(v) for v in col], dtype=object)
+            for name, col in zip(columns, values) if self.kinds[name] in ("text", "boolean")
+        }
+
+    def label_column(self) -> Optional[str]:
+        """The column that names a row, e.g. registration_no: the most distinct text column."""
+        if not self.labels:
+            return None
+        return max(self.labels, key=lambda name: len(np.unique(self.labels[name])))
+
+    def column_stats(self) -> List[str]:
+        lines = []
+        for name, col in zip(self.columns, self.values):
+            kind = self.kinds[name]
+            nulls = sum(1 for v in col if v is None)
+            null_note = f", {nulls} nulls" if nulls else ""
+            if kind == "numeric":
+                arr = self.numeric[name]
+                if np.isnan(arr).all():
+                    lines.append(f"- {name} (numeric): all null")
+                    continue
+                lines.append(
+                    f"- {name} (numeric): sum {fmt_number(np.nansum(arr))}, mean {fmt_number(np.nanmean(arr))}, "
+                    f"min {fmt_number(np.nanmin(arr))}, median {fmt_number(np.nanmedian(arr))}, "
+                    f"max {fmt_number(np.nanmax(arr))}, std {fmt_number(np.nanstd(arr))}{null_note}"
+                )
+            elif kind in ("text", "boolean"):
+                distinct, counts = np.unique(self.labels[name], return_counts=True)
+                order = np.argsort(-counts, kind="stable")[:DIGEST_TOP_K]
+                frequent = ", ".join(f"{fmt_cell(distinct[i])} ({counts[i]})" for i in order)
+                lines.append(f"- {name} ({kind}): {len(distinct)} distinct; most frequent: {frequent}{null_note}")
+            elif kind == "temporal":
+                present = [v for v in col if v is not None]
+                lines.append(f"- {name} (date/time): from {min(present)} to {max(present)}{null_note}")
+            else:
+                lines.append(f"- {name}: all null")
+        return lines
+
+    def rankings(self) -> List[str]:
+        """Top and bottom rows by each numeric column, named by the label column."""
+        label = self.label_column()
+        if label is None or len(np.unique(self.labels[label])) < self.rows:
+            return []  # Rows are not one per entity; rankings would repeat names
+        lines = []
+        for name in list(self.numeric)[:DIGEST_MAX_RANKED_COLUMNS]:
+            arr = self.numeric[name]
+            valid = np.flatnonzero(~np.isnan(arr))
+            if not len(valid):
+                continue
+            order = valid[np.argsort(arr[valid], kind="stable")]
+            top = ", ".join(f"{self.labels[label][i]} ({fmt_number(arr[i])})" for i in order[::-1][:DIGEST_TOP_K])
+            bottom = ", ".join(f"{self.labels[label][i]} ({fmt_number(arr[i])})" for i in order[:DIGEST_TOP_K])
+            lines.append(f"- {name}: highest {top}; lowest {bottom}")
+        return lines
+
+    def group_totals(self) -> List[str]:
+        """Per-group row counts, sums and means of numeric columns, for low-cardinality text columns."""
+        lines = []
+        numeric = list(self.numeric)[:DIGEST_MAX_RANKED_COLUMNS]
+        for name, labels in self.labels.items():
+            groups, inverse = np.unique(labels, return_inverse=True)
+            if not 1 < len(groups) <= DIGEST_MAX_GROUPS or len(groups) == self.rows:
+                continue
+            counts = np.bincount(inverse)
+            sums = {n: np.bincount(inverse, weights=np.nan_to_num(self.numeric[n]), minlength=len(groups))
+                    for n in numeric}
+            present = {n: np.bincount(inverse, weights=~np.isnan(self.numeric[n]), minlength=len(groups))
+                       for n in numeric}
+            lines.append(f"By {name}:")
+            for g, group in enumerate(groups):
+                figures = "".join(
+                    f", {n} sum {fmt_number(sums[n][g])} mean "
+                    f"{fmt_number(sums[n][g] / present[n][g]) if present[n][g] else 'null'}"
+                    for n in numeric
+                )
+                lines.append(f"- {fmt_cell(group)}: {counts[g]} rows{figures}")
+        return lines
+
+    def render(self) -> str:
+        sections = [
+            f"Exact summary over all {self.rows} rows x {len(self.columns)} columns "
+            f"(computed locally; use these figures, do not recompute):",
+            "Columns:", *self.column_stats(),
+        ]
+        rankings = self.rankings()
+        if rankings:
+            sections += ["Highest and lowest:", *rankings]
+        groups = self.group_totals()
+        if groups:
+            sections += ["Group totals:", *groups]
+        return "\n".join(sections)
+
+
+def summarize_result(columns: List[str], values: List[List[Any]]) -> str:
+    """Digest of a query result's columns (as gathered by ColumnCollector)."""
+    return ResultDigest(columns, values).render()
@@ -0,0 +1,266 @@
+import os
+import re
+import time
+from dataclasses import dataclass
+from datetime import timedelta
+from typing import Any, Callable, Dict, FrozenSet, List, Optional, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
+
+from core.cache import TTLCache, on_data_change
+from core.db_con import engine, tenant_transaction
+from core.llm_agent.query_cache import normalize_question
+from core.llm_agent.query_log import query_log
+from core.llm_agent.utils import NO_DATA_MESSAGE, LATEST_TS
+
+
+# Answer recognized question shapes from prevalidated SQL, without any LLM call
+FAST_PATH_ENABLED = os.getenv("FAST_PATH_ENABLED", "true").lower() in ("1", "true", "yes")
+
+KNOWN_MODELS_TTL_SEC = float(os.getenv("KNOWN_MODELS_TTL_SEC", "3600"))
+
+WINDOW_UNITS = {
+    "h": "hours", "hr": "hours", "hrs": "hours", "hour": "hours", "hours": "hours",
+    "d": "days", "day": "days", "days": "days",
+    "w": "weeks", "wk": "weeks", "week": "weeks", "weeks": "weeks",
+}
+
+# Matched against normalize_question() output: lowercase, no spaces around symbols
+WINDOW = r"(?P<window>(?:the )?(?:last|past) \d+ ?\w+|(?:the )?(?:last|past) (?:day|week)|this week|today)"
+VEHICLE_NOUN = r"(?:evs?|vehicles?|vans?|buses|bus|cars?)"
+
+
+def parse_window(phrase: str) -> Optional[timedelta]:
+    """Length of a relative window phrase, e.g. 'last 24 h' -> 24 hours."""
+    phrase = phrase.removeprefix("the ")
+    if phrase in ("today", "last day", "past day"):
+        return timedelta(days=1)
+    if phrase in ("this week", "last week", "past week"):
+        return timedelta(weeks=1)
+    match = re.fullmatch(r"(?:last|past) (\d+) ?(\w+)", phrase)
+    if not match or match.group(2) not in WINDOW_UNITS:
+        return None
+    return timedelta(**{WINDOW_UNITS[match.group(2)]: int(match.group(1))})
+
+
+_known_models = TTLCache("known_vehicle_models", maxsize=1, ttl=KNOWN_MODELS_TTL_SEC)
+
+
+@on_data_change
+def _forget_models(tables: Optional[List[str]]) -> None:
+    if tables is None or "vehicles" in tables:
+        _known_models.clear()
+
+
+def known_models() -> FrozenSet[str]:
+    """Lowercased vehicle models across all fleets, cached until vehicles change."""
+    models = _known_models.get("models")
+    if models is None:
+        with engine.connect() as con:
+            rows = con.execute(text("SELECT DISTINCT LOWER(model) FROM vehicles WHERE model IS NOT NULL"))
+            models = frozenset(row[0] for row in rows)
+        _known_models.set("models", models)
+    return models
+
+
+def model_params(groups: Dict[str, str]) -> Optional[Dict[str, Any]]:
+    """Reject matches whose model is just a word ("active", "electric"), so the LLM handles them."""
+    return groups if groups["model"] in known_models() else None
+
+
+def fmt(value: Any, digits: int = 1) -> str:
+    """Round numbers for display, dropping a trailing .0."""
+    if hasattr(value, "__float__"):
+        return f"{float(value):.{digits}f}".rstrip("0").rstrip(".")
+    return str(value)
+
+
+@dataclass(frozen=True)
+class QueryTemplate:
+    """A recognized question shape and the parameterized SQL that answers it."""
+    name: str
+    pattern: str
+    sql: str
+    # None hands the question to the LLM
+    answer: Callable[[Dict[str, Any], List[Any]], Optional[str]]
+    # Turn regex groups into bind parameters; None rejects the match
+    params: Callable[[Dict[str, str]], Optional[Dict[str, Any]]] = lambda groups: groups
+
+
+def window_params(groups: Dict[str, str]) -> Optional[Dict[str, Any]]:
+    """Bind the window as an interval, keeping its wording for the answer."""
+    window = parse_window(groups["window"])
+    if window is None:
+        return None
+    phrase = groups["window"].removeprefix("the ")
+    if phrase not in ("this week", "today"):
+        phrase = f"in the {phrase}"
+    return {**groups, "window": window, "window_phrase": phrase}
+
+
+def current_soc_answer(params: Dict[str, Any], rows: List[Any]) -> Optional[str]:
+    # No such vehicle ("the soc of vehicles"): let the LLM handle the question
+    if not rows:
+        return None
+    registration, soc, ts = rows[0]
+    return f"The SOC of vehicle {registration} is {fmt(soc)}% (last reading at {ts:%Y-%m-%d %H:%M})."
+
+
+def model_count_answer(params: Dict[str, Any], rows: List[Any]) -> str:
+    count = rows[0][0]
+    noun = "vehicle" if count == 1 else "vehicles"
+    return f"There {'is' if count == 1 else 'are'} {count} {params['model'].upper()} {noun} in your fleet."
+
+
+def temp_threshold_answer(params: Dict[str, Any], rows: List[Any]) -> str:
+    if not rows:
+        return (f"No. None of the {params['model'].upper()} vehicles exceeded {fmt(params['threshold'])} °C "
+                f"battery temperature {params['window_phrase']}.")
+    vehicles = ", ".join(f"{registration} (max {fmt(temp)} °C)" for registration, temp in rows)
+    return f"Yes, {vehicles} exceeded {fmt(params['threshold'])} °C {params['window_phrase']}."
+
+
+def comfort_zone_answer(params: Dict[str, Any], rows: List[Any]) -> str:
+    overall, low, high = rows[0]
+    if overall is None:
+        return NO_DATA_MESSAGE
+    return (f"The fleet-wide average SOC is {fmt(overall)}%, "
+            f"with daily averages ranging from {fmt(low)}% to {fmt(high)}%.")
+
+
+def soc_band_answer(params: Dict[str, Any], rows: List[Any]) -> str:
+    if not rows:
+        return (f"No vehicles spent more than {fmt(params['threshold'])}% of their time "
+                f"in the {params['band']}% SOC band {params['window_phrase']}.")
+    vehicles = ", ".join(f"{registration} ({fmt(share)}%)" for registration, share in rows)
+    return (f"Vehicles with more than {fmt(params['threshold'])}% of their time in the {params['band']}% SOC band "
+            f"{params['window_phrase']}: {vehicles}.")
+
+
+def low_soc_driving_answer(params: Dict[str, Any], rows: List[Any]) -> str:
+    count, registrations = rows[0]
+    noun = "vehicle is" if count == 1 else "vehicles are"
+    answer = f"{count} {noun} currently driving with SOC below {fmt(params['threshold'])}%"
+    return f"{answer}: {registrations}." if count else f"{answer}."
+
+
+TEMPLATES = [
+    QueryTemplate(
+        name="current_soc",
+        pattern=(r"(?:what is|what's|show) the (?:current )?(?:soc|state of charge) of (?:vehicle )?"
+                 r"(?P<vehicle>[a-z0-9]+)(?: right now| now| currently)?"),
+        sql="""
+            SELECT v.registration_no, s.soc_pct, s.ts
+            FROM vehicle_latest_state s
+            JOIN vehicles v ON v.vehicle_id = s.vehicle_id
+            WHERE UPPER(v.registration_no) = UPPER(:vehicle) OR UPPER(v.vin) = UPPER(:vehicle)
+        """,
+        answer=current_soc_answer,
+    ),
+    QueryTemplate(
+        name="model_count",
+        pattern=rf"how many (?P<model>[a-z0-9][a-z0-9 ]*?) {VEHICLE_NOUN} (?:are|do we have|do i have) in (?:my|our|the) fleet",
+        sql="SELECT COUNT(*) FROM vehicles WHERE LOWER(model) = :model",
+        answer=model_count_answer,
+        params=model_params,
+    ),
+    QueryTemplate(
+        name="battery_temp_threshold",
+        pattern=(rf"did any (?P<model>[a-z0-9][a-z0-9 ]*?)(?: {VEHICLE_NOUN})? exceed "
+                 rf"(?P<threshold>\d+(?:\.\d+)?)(?:°c|°| ?c| ?degrees?(?: c)?)? "
+                 rf"(?:battery |batt )?temp(?:erature)? in {WINDOW}"),
+        sql=f"""
+            SELECT v.registration_no, MAX(r.batt_temp_c)
+            FROM raw_telemetry r
+            JOIN vehicles v ON v.vehicle_id = r.vehicle_id
+            WHERE LOWER(v.model) = :model
+              AND r.ts >= {LATEST_TS} - :window
+              AND r.batt_temp_c > :threshold
+            GROUP BY v.registration_no
+            ORDER BY 2 DESC
+        """,
+        answer=temp_threshold_answer,
+        params=lambda groups: model_params(groups) and window_params(
+            {**groups, "threshold": float(groups["threshold"])}
+        ),
+    ),
+    QueryTemplate(
+        name="soc_comfort_zone",
+        pattern=r"what(?: is|'s) (?:the|our|my) (?:fleet-wide |fleet )?average soc comfort zone",
+        sql="SELECT AVG(avg_soc_pct), MIN(avg_soc_pct), MAX(avg_soc_pct) FROM fleet_daily_summary",
+        answer=comfort_zone_answer,
+    ),
+    QueryTemplate(
+        name="soc_band_share",
+        pattern=(rf"which {VEHICLE_NOUN} spent(?:>| more than | over )(?P<threshold>\d+(?:\.\d+)?)% ?(?:of )?(?:the |their )?time "
+                 rf"in the (?P<band>\d+-\d+)% ?soc band (?:in )?{WINDOW}"),
+        sql=f"""
+            SELECT v.registration_no,
+                   100.0 * SUM(b.hours) FILTER (WHERE b.soc_band = :band) / SUM(b.hours) AS share
+            FROM vehicle_daily_soc_band b
+            JOIN vehicles v ON v.vehicle_id = b.vehicle_id
+            WHERE b.date > ({LATEST_TS} - :window)::date
+            GROUP BY v.registration_no
+            HAVING 100.0 * SUM(b.hours) FILTER (WHERE b.soc_band = :band) / SUM(b.hours) > :threshold
+            ORDER BY share DESC
+        """,
+        answer=soc_band_answer,
+        params=lambda groups: window_params({**groups, "threshold": float(groups["threshold"])}),
+    ),
+    QueryTemplate(
+        name="low_soc_driving",
+        pattern=(rf"how many {VEHICLE_NOUN} are (?:currently |now )?driving(?: now| right now)? with soc"
+                 r"(?:<| below | under | less than )(?P<threshold>\d+(?:\.\d+)?)%?"),
+        sql="""
+            SELECT COUNT(*), STRING_AGG(v.registration_no, ', ' ORDER BY v.registration_no)
+            FROM vehicle_latest_state s
+            JOIN vehicles v ON v.vehicle_id = s.vehicle_id
+            WHERE s.speed_kph > 0 AND s.soc_pct < :threshold
+        """,
+        answer=low_soc_driving_answer,
+        params=lambda groups: {"threshold": float(groups["threshold"])},
+    ),
+]
+
+
+def match_template(question: str) -> Optional[Tuple[QueryTemplate, Dict[str, Any]]]:
+    """
+    The template the whole question matches and its bind parameters, if any.
+    Looks up known_models() for model templates, so call it off the event loop.
+    """
+    normalized = normalize_question(question)
+    for template in TEMPLATES:
+        match = re.fullmatch(template.pattern, normalized)
+        if match:
+            params = template.params(match.groupdict())
+            if params is not None:
+                return template, params
+    return None
+
+
+def render_sql(sql: str, binds: Dict[str, Any]) -> str:
+    """The SQL with its bind values inlined, so the logged query can be replayed (e.g. EXPLAINed by the index advisor)."""
+    return str(text(sql).bindparams(**binds).compile(dialect=engine.dialect, compile_kwargs={"literal_binds": True}))
+
+
+def run_template(
+    template: QueryTemplate, params: Dict[str, Any], role: str, fleet_id: str
+) -> Optional[str]:
+    """
+    Run a template's SQL in the tenant's RLS-scoped transaction and phrase the
+    answer. Returns None if the query fails or the template cannot answer from
+    its rows, so the caller can fall back to the LLM.
+    """
+    binds = {k: v for k, v in params.items() if f":{k}" in template.sql}
+    logged_sql = render_sql(template.sql, binds)
+    start = time.perf_counter()
+    try:
+        with tenant_transaction(role, fleet_id) as con:
+            rows = con.execute(text(template.sql), binds).fetchall()
+    except SQLAlchemyError as e:
+        query_log.record(logged_sql, role, fleet_id, (time.perf_counter() - start) * 1000, str(e))
+        print(f"Fast path '{template.name}' failed, falling back to the agent: {e}")
+        return None
+    query_log.record(logged_sql, role, fleet_id, (time.perf_counter() - start) * 1000)
+    return template.answer(params, rows)
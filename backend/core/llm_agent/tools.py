@@ -0,0 +1,130 @@
+import time
+from typing import Any, Dict, Optional, Tuple
+
+from langchain_core.runnables import RunnableConfig
+from langchain_core.tools import BaseTool, tool
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
+
+from core.db_con import tenant_transaction
+from core.llm_agent.schema_catalog import SchemaCatalog
+from core.llm_agent.result_cache import ResultCache
+from core.llm_agent.query_log import query_log
+from core.llm_agent.sql_validator import check_read_only
+from core.llm_agent.query_guard import guard_query, QUERY_ROW_LIMIT
+from core.llm_agent.results import (
+    QueryResult, result_registry, make_result_id, stream_rows, sample_rows, sample_note
+)
+from core.llm_agent.summarize import ColumnCollector, summarize_result, RESULT_DIGEST_MIN_ROWS
+from core.llm_agent.utils import NO_DATA_MESSAGE
+
+
+def get_tenant(config: RunnableConfig) -> Tuple[str, str]:
+    """Read the (role, fleet_id) bound to this graph run via config["configurable"]."""
+    configurable = (config or {}).get("configurable", {})
+    role, fleet_id = configurable.get("role"), configurable.get("fleet_id")
+    if not role or not fleet_id:
+        raise ValueError("Tenant context (role, fleet_id) missing from run config")
+    return role, fleet_id
+
+
+def create_sql_tools(
+    catalog: SchemaCatalog, result_cache: ResultCache
+) -> Tuple[BaseTool, BaseTool, BaseTool]:
+    """
+    Create the list_tables, schema and query tools shared by every tenant.
+    Table names and schemas are served from the in-memory catalog. Tenant context
+    comes from the run config: the query runs inside a read-only transaction
+    scoped with SET LOCAL ROLE and app.fleet_id, unless its result is already
+    cached for that role and fleet. Anything but a single SELECT is refused
+    before it reaches the database; the rest is capped at QUERY_ROW_LIMIT rows
+    and refused if EXPLAIN estimates it above QUERY_MAX_COST/QUERY_MAX_PLAN_ROWS,
+    with the reason returned for the LLM to repair the query.
+    Rows are read through a server-side cursor: the LLM gets a token-budgeted
+    sample and the row count, followed for results over RESULT_DIGEST_MIN_ROWS
+    rows by a NumPy digest over all of them (column stats, rankings, group
+    totals), and the tool message's artifact references the full result for
+    download (see ResultRegistry).
+    """
+
+    def execute_query(query: str, role: str, fleet_id: str) -> Tuple[str, Optional[QueryResult]]:
+        # Refusals end like SQLAlchemy errors, with the statement, so the LLM sees what to fix
+        violation = check_read_only(query)
+        if violation:
+            return f"Error: {violation}\n[SQL: {query}]", None
+        try:
+            with tenant_transaction(role, fleet_id) as con:
+                # Some roles can write; agent queries never need to
+                con.execute(text("SET LOCAL transaction_read_only = on"))
+                sql, rejection = guard_query(con, query)
+                if rejection:
+                    return f"Error: {rejection}\n[SQL: {sql}]", None
+                columns, rows = stream_rows(con, sql)
+                collector = ColumnCollector(columns) if RESULT_DIGEST_MIN_ROWS else None
+                content, shown, total = sample_rows(collector.collect(rows) if collector else rows)
+        except SQLAlchemyError as e:
+            return f"Error: {e}", None
+
+        if total == 0:
+            return NO_DATA_MESSAGE, None
+        if shown < total:
+            content += sample_note(shown, total, columns)
+        if collector and collector.values is not None:
+            # Exact figures over every row, instead of sums the model would work out itself
+            content += "\n\n" + summarize_result(columns, collector.values)
+        truncated = sql != query and total >= QUERY_ROW_LIMIT
+        if truncated:
+            content += (
+                f"\nThe result was cut off at the {QUERY_ROW_LIMIT}-row limit, so figures cover only these rows; "
+                f"aggregate in SQL for complete totals."
+            )
+        # The download serves every row: register the query without the injected row limit
+        result = result_registry.register(
+            make_result_id(query, role, fleet_id), query, role, fleet_id, columns, total, shown, truncated
+        )
+        return content, result
+
+    @tool("sql_db_list_tables")
+    def list_tables_tool(tool_input: str = "") -> str:
+        """Input is an empty string, output is a comma-separated list of tables in the database."""
+        return ", ".join(catalog.table_names())
+
+    @tool("sql_db_schema", parse_docstring=True)
+    def get_schema_tool(table_names: str, config: RunnableConfig) -> str:
+        """Get the schema and sample rows for the specified SQL tables.
+
+        Args:
+            table_names: A comma-separated list of the table names for which to return the schema.
+                Example input: 'table1, table2, table3'
+        """
+        role, fleet_id = get_tenant(config)
+        tables = list(dict.fromkeys(t.strip() for t in table_names.split(",") if t.strip()))
+        try:
+            return catalog.table_info(tables, role, fleet_id)
+        except (ValueError, SQLAlchemyError) as e:
+            return f"Error: {e}"
+
+    @tool("sql_db_query", parse_docstring=True, response_format="content_and_artifact")
+    def run_query_tool(query: str, config: RunnableConfig) -> Tuple[str, Optional[Dict[str, Any]]]:
+        """Execute a SQL query against the database and get back the result..
+        If the query is not correct, an error message will be returned.
+        If an error is returned, rewrite the query, check the query, and try again.
+
+        Args:
+            query: A detailed and correct SQL query.
+        """
+        role, fleet_id = get_tenant(config)
+        content = result_cache.get(query, role, fleet_id)
+        if content is not None:
+            result = result_registry.find(query, role, fleet_id)
+        else:
+            start = time.perf_counter()
+            content, result = execute_query(query, role, fleet_id)
+            error = content if content.startswith("Error") else None
+            query_log.record(query, role, fleet_id, (time.perf_counter() - start) * 1000, error)
+            if not error:
+                result_cache.put(query, role, fleet_id, content, catalog.table_names())
+        # The artifact reaches the client, never the LLM
+        return content, result.public() if result else None
+
+    return list_tables_tool, get_schema_tool, run_query_tool
@@ -1,5 +1,5 @@
 import os, yaml
-from typing import Dict, Any
+from typing import Dict, Any, Optional
 
 MODELS = {
     "fast": "qwen/qwen3-32b",
@@ -25,16 +25,32 @@ MODEL_CONFIGS: Dict[str, Dict[str, Any]] = {
 
 DEFAULT_MODEL = MODELS["quality"]
 
+# Tag carried by the fast-model answer call, so streams can pick out answer tokens
+FINAL_ANSWER_TAG = "final_answer"
+
+NO_DATA_MESSAGE = "No data available for this query."
+
+# Relative windows ("last 24 h", "this week") are anchored on the newest telemetry
+# the tenant can see, so snapshot datasets answer the same way as live ones. Used
+# by the fast-path templates and prescribed to the LLM, so both paths agree.
+LATEST_TS = "(SELECT MAX(ts) FROM vehicle_latest_state)"
+
 def get_model_config(model_name: str = DEFAULT_MODEL) -> Dict[str, Any]:
     """Get API configuration for specified model."""
     return MODEL_CONFIGS.get(model_name, MODEL_CONFIGS[DEFAULT_MODEL])
 
-def load_semantic_map():
-    """Loads and formats semantic term mappings from a YAML."""
+SEMANTIC_MAP_PATH = os.path.join(os.path.dirname(__file__), "semantic_map.yaml")
 
-    file_path = os.path.join(os.path.dirname(__file__), "semantic_map.yaml")
+def read_semantic_map(file_path: str = SEMANTIC_MAP_PATH) -> Dict[str, Any]:
+    """Parses the semantic term mappings YAML: term -> columns and description."""
     with open(file_path) as f:
-        m = yaml.safe_load(f)
+        return yaml.safe_load(f)
+
+def load_semantic_map(file_path: str = SEMANTIC_MAP_PATH, m: Optional[Dict[str, Any]] = None):
+    """Loads and formats semantic term mappings from a YAML (or an already parsed map)."""
+
+    if m is None:
+        m = read_semantic_map(file_path)
 
     mappings_str = []
     for term, info in m.items():
@@ -43,16 +59,34 @@ def load_semantic_map():
 
     return "\n".join(mappings_str)
 
-def handle_empty_results(original_run):
+def count_result_rows(result: str) -> Optional[int]:
     """
-    Wrapper function to handle empty results from database queries.
-    Takes the original run function as a parameter to avoid closure issues.
+    Count the rows in a sql_db_query result string, e.g. "[('a', 1), ('b', 2)]".
+    Returns None when the result is not a row list (e.g. an error message).
     """
-    def wrapper(*args, **kwargs):
-        result = original_run(*args, **kwargs)
-        if not result or (isinstance(result, list) and len(result) == 0):
-            return "No data available for this query."
-        return result
-    return wrapper
+    if not result or result == NO_DATA_MESSAGE:
+        return 0
+    if not result.startswith("["):
+        return None
+
+    # Count tuples opened directly inside the outer list, skipping quoted strings
+    rows, depth, quote, escaped = 0, 0, None, False
+    for ch in result:
+        if quote:
+            if escaped:
+                escaped = False
+            elif ch == "\\":
+                escaped = True
+            elif ch == quote:
+                quote = None
+        elif ch in ("'", '"'):
+            quote = ch
+        elif ch in "([":
+            depth += 1
+            if ch == "(" and depth == 2:
+                rows += 1
+        elif ch in ")]":
+            depth -= 1
+    return rows
 
 
@@ -1,79 +1,105 @@
+import io
 import os
 import csv
+import gzip
 import hmac
+import time
 import argparse
 import asyncio
-from typing import Set, List, Dict, Any, Optional
+from datetime import date
+from typing import Any, Callable, Set, List, Dict, Tuple, Iterable, Iterator, AsyncIterator, Optional, TextIO
 from databases import Database
 
-from core.setup_database.schema import PARTITIONED_TABLES, CREATE_TABLE_QUERIES
-from core.db_con import database
+from core.setup_database.partitions import ensure_partitions, parse_day
+from core.setup_database.schema import (
+    PARTITIONED_TABLES, APPEND_ONLY_TABLES, CREATE_TABLE_QUERIES, FLEET_ID_SOURCES, LATEST_STATE_TABLE_QUERIES,
+    get_table_dependencies, get_primary_keys
+)
+from core.db_con import database, get_connection_config
+from core.cache import notify_data_changed
+from core.setup_database.rollups import refresh_rollups
 
-# Data loading batch size
-IMPORT_DATA_BATCH_SIZE = 1000
+# Define table dependencies (tables that need to be imported first), from the FK graph
+TABLE_DEPENDENCIES = get_table_dependencies()
 
-# Define table dependencies (tables that need to be imported first)
-TABLE_DEPENDENCIES = {
-    'alerts': ['vehicles', 'fleets'],
-    'vehicles': ['fleets'],
-    'trips': ['vehicles', 'fleets']
-}
+PRIMARY_KEYS = get_primary_keys()
 
-# Define the order of table imports
-IMPORT_ORDER = ['fleets', 'vehicles', 'alerts', 'trips']
+# full: truncate and reload every table
+# incremental: upsert keyed tables on their primary key, append rows of keyless
+# append-only tables past each vehicle's watermark, and fully reload the rest
+IMPORT_MODES = ["full", "incremental"]
 
+# Size of each CSV chunk streamed to COPY; bounds importer memory per table
+IMPORT_COPY_CHUNK_BYTES = int(os.getenv("IMPORT_COPY_CHUNK_BYTES", str(1024 * 1024)))
 
-async def create_vehicle_partition(database: Database, vehicle_id: str, table: str) -> None:
-    """Create a partition for a specific vehicle in a partitioned table."""
-    try:
-        partition_name = f"{table}_vehicle_{vehicle_id}"
-        ddl = f"""
-            CREATE TABLE IF NOT EXISTS {partition_name}
-            PARTITION OF {table} FOR VALUES IN ('{vehicle_id}');
-        """
-        await database.execute(query=ddl)
-    except Exception as e:
-        raise RuntimeError(f"Failed to create partition for vehicle {vehicle_id} in table {table}: {e}")
+# Tables loaded concurrently; bounded by the connection pool
+IMPORT_MAX_CONCURRENCY = int(
+    os.getenv("IMPORT_MAX_CONCURRENCY", get_connection_config()["max_connections"])
+)
+
+
+def find_csv_path(csv_dir: str, table: str) -> Optional[str]:
+    """Path of the table's CSV in csv_dir, plain or gzip-compressed."""
+    for name in (f"{table}.csv", f"{table}.csv.gz"):
+        csv_path = os.path.join(csv_dir, name)
+        if os.path.exists(csv_path):
+            return csv_path
+    return None
 
 
-def get_vehicle_ids_from_csv(csv_path: str) -> Set[str]:
+def open_csv(csv_path: str) -> TextIO:
+    """Open a CSV file for streaming, transparently decompressing .gz files."""
+    if csv_path.endswith(".gz"):
+        return gzip.open(csv_path, "rt", newline="")
+    return open(csv_path, "r", newline="")
+
+
+def get_column_index(columns: List[str], column: str, csv_path: str) -> int:
     """
-    Extract unique vehicle IDs from a CSV file. 
+    Position of a required column in a CSV header.
     Uses constant-time comparison when checking for the required column
     """
-    try:
-        with open(csv_path, "r") as csv_file:
-            reader = csv.DictReader(csv_file)
-            if not reader.fieldnames:
-                raise ValueError(f"CSV file {csv_path} has no headers")
-                
-            # Use constant-time comparison to check for vehicle_id column
-            has_vehicle_id = False
-            for field in reader.fieldnames:
-                if hmac.compare_digest(field, "vehicle_id"):
-                    has_vehicle_id = True
-                    break
-                    
-            if not has_vehicle_id:
-                raise ValueError(f"CSV file {csv_path} missing vehicle_id column")
-                
-            return set(row["vehicle_id"] for row in reader)
-    except Exception as e:
-        raise RuntimeError(f"Failed to read vehicle IDs from {csv_path}: {e}")
+    index = None
+    for i, field in enumerate(columns):
+        if hmac.compare_digest(field, column):
+            index = i
+    if index is None:
+        raise ValueError(f"CSV file {csv_path} missing {column} column")
+    return index
+
+
+def collect_keys(
+    rows: Iterable[List[str]], index: int, keys: Set[Any], key: Callable[[str], Any] = str
+) -> Iterator[List[str]]:
+    """Pass rows through unchanged, recording key(value at index) (e.g. partition keys)."""
+    for row in rows:
+        keys.add(key(row[index]))
+        yield row
+
+
+def encode_csv_chunks(rows: Iterable[List[str]], chunk_bytes: int = IMPORT_COPY_CHUNK_BYTES) -> Iterator[bytes]:
+    """Re-encode rows as CSV and yield them in chunks of about chunk_bytes."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow(row)
+        if buffer.tell() >= chunk_bytes:
+            yield buffer.getvalue().encode()
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+
+async def iterate_in_thread(chunks: Iterator[bytes]) -> AsyncIterator[bytes]:
+    """Drive a blocking chunk generator from a worker thread, one chunk at a time."""
+    while True:
+        chunk = await asyncio.to_thread(next, chunks, None)
+        if chunk is None:
+            return
+        yield chunk
 
 
-def read_csv_data(csv_path: str) -> tuple[List[str], List[Dict[str, Any]]]:
-    """Read CSV file and return column names and data rows."""
-    try:
-        with open(csv_path, 'r') as file:
-            reader = csv.DictReader(file)
-            columns = reader.fieldnames or []
-            rows = [row for row in reader]
-            return columns, rows
-    except Exception as e:
-        raise RuntimeError(f"Failed to read CSV file {csv_path}: {e}")
-    
-
 async def create_import_functions(database: Database) -> None:
     """Create helper functions for data import."""
     try:
@@ -90,85 +116,202 @@ async def create_import_functions(database: Database) -> None:
             END;
             $$;
         """)
-
-        # Create functions for each table to insert data
-        for table in CREATE_TABLE_QUERIES:
-            await database.execute(query=f"""
-                CREATE OR REPLACE FUNCTION insert_into_{table}(
-                    column_names text,
-                    values_list text
-                )
-                RETURNS void
-                LANGUAGE plpgsql
-                SECURITY DEFINER
-                SET search_path = public
-                AS $$
-                BEGIN
-                    EXECUTE 'INSERT INTO {table} (' || column_names || ') VALUES (' || values_list || ')';
-                END;
-                $$;
-            """)
     except Exception as e:
         raise RuntimeError(f"Failed to create import functions: {e}")
 
 
-def prepare_value(val: Any) -> str:
-    """Prepare a value for SQL insertion."""
-    if val == '':
-        return 'NULL'
-    elif isinstance(val, (int, float)):
-        return str(val)
-    else:
-        # Escape single quotes and properly quote string values
-        val = str(val).replace("'", "''")
-        return f"'{val}'"
+def supports_incremental(table: str) -> bool:
+    """Whether a table can be loaded without truncating it first."""
+    return table in APPEND_ONLY_TABLES or table in PRIMARY_KEYS
 
 
-async def load_table_data(database: Database, table: str, csv_path: str) -> None:
-    """Load data into a table from a CSV file using security definer functions."""
-    try:
+def build_merge_query(table: str, columns: List[str], source: str, watermark: bool) -> str:
+    """
+    INSERT ... SELECT moving staged rows (from the source relation, aliased s) into
+    the table for an incremental load. With watermark, only rows newer than the
+    latest one already loaded for the same vehicle are taken, so vehicles new to
+    the table get all their rows; keyed tables upsert on the primary key,
+    rewriting rows only when a value actually changed.
+    """
+    column_names_str = ', '.join(f'"{col}"' for col in columns)
+    query = f'INSERT INTO "{table}" AS t ({column_names_str}) SELECT {column_names_str} FROM {source}'
+    if watermark:
+        ts = APPEND_ONLY_TABLES[table]
+        query += (
+            f' WHERE NOT EXISTS (SELECT 1 FROM "{table}" w'
+            f' WHERE w."vehicle_id" = s."vehicle_id" AND w."{ts}" >= s."{ts}")'
+        )
+
+    keys = PRIMARY_KEYS.get(table)
+    if keys:
+        updates = [col for col in columns if col not in keys]
+        conflict = ', '.join(f'"{col}"' for col in keys)
+        if updates:
+            assignments = ', '.join(f'"{col}" = EXCLUDED."{col}"' for col in updates)
+            current = ', '.join(f't."{col}"' for col in updates)
+            excluded = ', '.join(f'EXCLUDED."{col}"' for col in updates)
+            query += (
+                f' ON CONFLICT ({conflict}) DO UPDATE SET {assignments}'
+                f' WHERE ROW({current}) IS DISTINCT FROM ROW({excluded})'
+            )
+        else:
+            query += f' ON CONFLICT ({conflict}) DO NOTHING'
+    return query
+
+
+async def prefill_fleet_id(raw, table: str, columns: List[str], staging: str) -> Tuple[str, List[str]]:
+    """
+    Source relation (aliased s) and columns to move out of staging. When the table
+    carries a denormalized fleet_id, it is joined in set-wise here and the per-row
+    trigger lookup is skipped for the rest of the transaction.
+    """
+    source = f'"{staging}"'
+    if table not in FLEET_ID_SOURCES or "fleet_id" in columns:
+        return f'{source} AS s', columns
+
+    has_fleet_id = await raw.fetchval(
+        """
+        SELECT EXISTS (SELECT 1 FROM information_schema.columns
+                       WHERE table_schema = 'public' AND table_name = $1 AND column_name = 'fleet_id')
+        """,
+        table
+    )
+    if not has_fleet_id:
+        return f'{source} AS s', columns
+
+    parent, key = FLEET_ID_SOURCES[table]
+    selected = ', '.join(f's."{col}"' for col in columns)
+    await raw.execute("SET LOCAL app.fleet_id_prefilled = 'on'")
+    source = (
+        f'(SELECT {selected}, p.fleet_id FROM {source} s '
+        f'LEFT JOIN "{parent}" p ON p."{key}" = s."{key}") AS s'
+    )
+    return source, [*columns, "fleet_id"]
+
+
+async def count_missing_fleet_ids(database: Database, table: str) -> int:
+    """
+    Rows whose denormalized fleet_id is NULL although the key it is filled from is set.
+    Such rows are invisible under the equality RLS policy, so an import leaving any is failed.
+    """
+    if table not in FLEET_ID_SOURCES:
+        return 0
+    has_fleet_id = await database.fetch_val(
+        query="""
+        SELECT EXISTS (SELECT 1 FROM information_schema.columns
+                       WHERE table_schema = 'public' AND table_name = :table AND column_name = 'fleet_id')
+        """,
+        values={"table": table}
+    )
+    if not has_fleet_id:
+        return 0
+    _, key = FLEET_ID_SOURCES[table]
+    return await database.fetch_val(
+        f'SELECT COUNT(*) FROM "{table}" WHERE "{key}" IS NOT NULL AND fleet_id IS NULL'
+    )
+
+
+def parse_command_count(status: str) -> int:
+    """Row count from a command status tag, e.g. 'COPY 1000' or 'INSERT 0 1000'."""
+    return int(status.split()[-1])
+
+
+async def copy_csv_to_table(
+    database: Database, table: str, csv_path: str, incremental: bool = False
+) -> Tuple[int, int]:
+    """
+    Stream a CSV file (optionally gzip-compressed) into a temporary staging table
+    with COPY FROM STDIN, then move the rows into the target table in one
+    INSERT ... SELECT. Rows flow through generators in bounded chunks, so memory
+    stays flat regardless of file size. For partitioned tables, the days seen
+    are collected during the same pass and any missing time-range partitions are
+    created before the insert. With incremental, rows are merged (see build_merge_query)
+    instead of plainly inserted. Returns (rows read, rows written).
+    """
+    staging = f"_staging_{table}"
+    partition_days: Set[date] = set()
+
+    with open_csv(csv_path) as file:
+        rows = csv.reader(file)
+        columns = next(rows, None)
+        if not columns:
+            raise ValueError(f"CSV file {csv_path} is empty")
         if table in PARTITIONED_TABLES:
-            vehicle_ids = get_vehicle_ids_from_csv(csv_path)
-            for vehicle_id in vehicle_ids:
-                await create_vehicle_partition(database, vehicle_id, table)
-        
+            rows = collect_keys(rows, get_column_index(columns, "ts", csv_path), partition_days, parse_day)
+
+        async with database.connection() as connection:
+            async with connection.transaction():
+                raw = connection.raw_connection
+                await raw.execute(
+                    f'CREATE TEMP TABLE "{staging}" (LIKE "{table}" INCLUDING DEFAULTS) ON COMMIT DROP'
+                )
+                status = await raw.copy_to_table(
+                    staging,
+                    source=iterate_in_thread(encode_csv_chunks(rows)),
+                    columns=columns,
+                    format='csv'
+                )
+                copied = parse_command_count(status)
+
+                if partition_days:
+                    created = await ensure_partitions(database, table, partition_days)
+                    if created:
+                        print(f"'{table}': created partitions {created}")
+
+                source, move_columns = await prefill_fleet_id(raw, table, columns, staging)
+                if not incremental:
+                    column_names_str = ', '.join(f'"{col}"' for col in move_columns)
+                    status = await raw.execute(
+                        f'INSERT INTO "{table}" ({column_names_str}) SELECT {column_names_str} FROM {source}'
+                    )
+                else:
+                    query = build_merge_query(table, move_columns, source, table in APPEND_ONLY_TABLES)
+                    status = await raw.execute(query)
+                inserted = parse_command_count(status)
+
+    if not incremental and inserted != copied:
+        raise RuntimeError(f"Copied {copied} rows into staging but inserted {inserted} into {table}")
+    return copied, inserted
+
+
+async def load_table_data(
+    database: Database, table: str, csv_path: str, mode: str = "full"
+) -> int:
+    """
+    Load data into a table from a CSV file using COPY through a staging table.
+    Returns the number of rows written.
+    """
+    incremental = mode == "incremental" and supports_incremental(table)
+    try:
         # Temporarily disable RLS
         await database.execute(query=f"ALTER TABLE {table} DISABLE ROW LEVEL SECURITY")
         
         try:
-            # Truncate the table using the security definer function
-            await database.execute(
-                query="SELECT truncate_table(:table_name)",
-                values={"table_name": table}
-            )
+            if not incremental:
+                # Truncate the table using the security definer function
+                await database.execute(
+                    query="SELECT truncate_table(:table_name)",
+                    values={"table_name": table}
+                )
             
-            # Import data in batches
-            columns, rows = read_csv_data(csv_path)
-
-            for i in range(0, len(rows), IMPORT_DATA_BATCH_SIZE):
-                batch = rows[i:i + IMPORT_DATA_BATCH_SIZE]
-                for row in batch:
-                    try:
-                        # Prepare column names and values
-                        values = [prepare_value(row.get(col, '')) for col in columns]
-                        # Format column names and values as comma-separated strings
-                        column_names_str = ', '.join([f'"{col}"' for col in columns])
-                        values_str = ', '.join(values)
-                        
-                        # Use the security definer function to insert
-                        await database.execute(
-                            query=f"SELECT insert_into_{table}(:column_names, :value_list)",
-                            values={"column_names": column_names_str, "value_list": values_str}
-                        )
-                    except Exception as e:
-                        print(f"Error on row: {row}")
-                        raise
+            # Bulk-load via COPY, creating partitions for new time ranges on the way
+            read, loaded = await copy_csv_to_table(database, table, csv_path, incremental)
             
-            # Verify the number of imported rows
-            result = await database.fetch_one(f"SELECT COUNT(*) FROM {table}")
-            if len(rows) != result[0]:
-                e = f"Imported {result[0]} rows into {table}. Expected: {len(rows)} rows."
-                raise RuntimeError(f"Failed to load data into table {table}: {e}")
+            if incremental:
+                print(f"'{table}': {loaded} of {read} rows new or changed")
+            else:
+                # Verify the number of imported rows
+                result = await database.fetch_one(f"SELECT COUNT(*) FROM {table}")
+                if loaded != result[0]:
+                    e = f"Imported {result[0]} rows into {table}. Expected: {loaded} rows."
+                    raise RuntimeError(f"Failed to load data into table {table}: {e}")
+
+            # Checked while RLS is still off, so every fleet's rows are counted
+            missing = await count_missing_fleet_ids(database, table)
+            if missing:
+                parent, key = FLEET_ID_SOURCES[table]
+                raise RuntimeError(f"{missing} rows have no fleet_id; their {key} is missing from {parent}")
+            return loaded
     
         finally:
             # Re-enable RLS
@@ -178,9 +321,74 @@ async def load_table_data(database: Database, table: str, csv_path: str) -> None
         raise RuntimeError(f"Failed to load data into table {table}: {e}")
 
 
-async def import_data(database: Database, csv_dir: str) -> None:
+async def run_import_schedule(
+    database: Database,
+    available_csvs: Dict[str, str],
+    max_concurrency: int = IMPORT_MAX_CONCURRENCY,
+    mode: str = "full"
+) -> Tuple[Dict[str, float], Dict[str, int]]:
+    """
+    Load tables concurrently in dependency order: each table starts as soon as
+    the tables it references are loaded, with at most max_concurrency in flight.
+    Returns per-table load time in seconds and rows written.
+    """
+    loaded = {table: asyncio.Event() for table in available_csvs}
+    semaphore = asyncio.Semaphore(max_concurrency)
+    timings: Dict[str, float] = {}
+    row_counts: Dict[str, int] = {}
+
+    async def load(table: str) -> None:
+        for dep in TABLE_DEPENDENCIES.get(table, []):
+            if dep in loaded:
+                await loaded[dep].wait()
+        async with semaphore:
+            print(f"Importing '{table}'...")
+            start = time.perf_counter()
+            row_counts[table] = await load_table_data(database, table, available_csvs[table], mode)
+            timings[table] = time.perf_counter() - start
+        loaded[table].set()
+
+    # A failed table cancels the rest
+    async with asyncio.TaskGroup() as tg:
+        for table in available_csvs:
+            tg.create_task(load(table))
+    return timings, row_counts
+
+
+def critical_path_seconds(timings: Dict[str, float]) -> float:
+    """Longest chain of dependent load times: the lower bound on wall-clock import time."""
+    memo: Dict[str, float] = {}
+
+    def finish(table: str) -> float:
+        if table not in memo:
+            deps = [d for d in TABLE_DEPENDENCIES.get(table, []) if d in timings]
+            memo[table] = timings[table] + max((finish(d) for d in deps), default=0.0)
+        return memo[table]
+
+    return max((finish(t) for t in timings), default=0.0)
+
+
+def print_import_report(
+    timings: Dict[str, float], row_counts: Dict[str, int], wall_clock: float
+) -> None:
+    print("\nPer-table import time:")
+    for table, seconds in sorted(timings.items(), key=lambda kv: -kv[1]):
+        print(f"- {table:<22} {seconds:8.3f}s {row_counts[table]:>10} rows")
+    print(f"Sum of tables: {sum(timings.values()):.3f}s | "
+          f"Critical path: {critical_path_seconds(timings):.3f}s | "
+          f"Wall clock: {wall_clock:.3f}s")
+
+
+async def import_data(
+    database: Database,
+    csv_dir: str,
+    max_concurrency: int = IMPORT_MAX_CONCURRENCY,
+    mode: str = "full"
+) -> None:
     """Import data from CSV files into the database."""
-    print(f"Importing data from {csv_dir}...")
+    if mode not in IMPORT_MODES:
+        raise ValueError(f"Unknown import mode '{mode}', expected one of {IMPORT_MODES}")
+    print(f"Importing data from {csv_dir} ({mode})...")
     
     # First create the helper functions
     await create_import_functions(database)
@@ -190,8 +398,8 @@ async def import_data(database: Database, csv_dir: str) -> None:
     missing_csvs = []
 
     for table in CREATE_TABLE_QUERIES:            
-        csv_path = os.path.join(csv_dir, f"{table}.csv")
-        if os.path.exists(csv_path):
+        csv_path = find_csv_path(csv_dir, table)
+        if csv_path:
             available_csvs[table] = csv_path
         else:
             missing_csvs.append(table)
@@ -216,15 +424,30 @@ async def import_data(database: Database, csv_dir: str) -> None:
         return
     
     # If all dependencies are met, proceed with import
-    for table in CREATE_TABLE_QUERIES:
-        if table in available_csvs:
-            print(f"Importing '{table}'...")
-            await load_table_data(database, table, available_csvs[table])
+    start = time.perf_counter()
+    timings, row_counts = await run_import_schedule(database, available_csvs, max_concurrency, mode)
+    print_import_report(timings, row_counts, time.perf_counter() - start)
+
+    # Drop in-process caches derived from the tables that changed; API processes
+    # hear about it from the tables' NOTIFY triggers (see announce_data_changes)
+    changed = [t for t in available_csvs if mode == "full" or row_counts[t] > 0]
+    # vehicle_latest_state is written by a trigger on raw_telemetry inserts
+    if "raw_telemetry" in changed:
+        changed.extend(LATEST_STATE_TABLE_QUERIES)
+    if changed:
+        notify_data_changed(changed)
+        print("\nRefreshing rollups...")
+        await asyncio.to_thread(refresh_rollups, changed)
     
     print("\nImport complete!")
 
 
-async def main(csv_dir: str, database: Database = database) -> None:
+async def main(
+    csv_dir: str,
+    database: Database = database,
+    max_concurrency: int = IMPORT_MAX_CONCURRENCY,
+    mode: str = "full"
+) -> None:
     """Import data from CSV files into the database."""
     if not csv_dir:
         raise ValueError("CSV directory path is required")
@@ -235,7 +458,7 @@ async def main(csv_dir: str, database: Database = database) -> None:
 
     try:
         await database.connect()
-        await import_data(database, csv_dir)
+        await import_data(database, csv_dir, max_concurrency, mode)
         print("Data import complete!")
 
     except Exception as e:
@@ -246,10 +469,15 @@ async def main(csv_dir: str, database: Database = database) -> None:
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Import data from CSV files into database.")
-    parser.add_argument("--csv-dir", required=True, help="Directory containing CSV files")
+    parser.add_argument("--csv-dir", required=True,
+                        help="Directory containing CSV files (<table>.csv or <table>.csv.gz)")
+    parser.add_argument("--max-concurrency", type=int, default=IMPORT_MAX_CONCURRENCY,
+                        help="Maximum number of tables loaded at once")
+    parser.add_argument("--mode", choices=IMPORT_MODES, default="full",
+                        help="full: truncate and reload; incremental: load only new or changed rows")
     args = parser.parse_args()
 
-    asyncio.run(main(args.csv_dir))
+    asyncio.run(main(args.csv_dir, max_concurrency=args.max_concurrency, mode=args.mode))
 
 
 
@@ -0,0 +1,350 @@
+import json
+import hashlib
+import argparse
+from collections import Counter
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+import sqlglot
+from sqlglot import exp
+from sqlglot.errors import SqlglotError
+from sqlglot.optimizer.qualify import qualify
+from sqlglot.optimizer.scope import traverse_scope
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
+
+from core.db_con import engine, scope_to_tenant
+from core.llm_agent.query_log import query_log
+from core.llm_agent.result_cache import normalize_sql
+from core.setup_database.schema import ALL_TABLE_QUERIES
+
+
+# Columns per candidate index; wider indexes rarely pay off for this workload
+MAX_INDEX_COLUMNS = 3
+
+# A candidate must cut the estimated cost of the queries it touches by this fraction
+MIN_IMPROVEMENT = 0.2
+
+RANGE_PREDICATES = (exp.GT, exp.GTE, exp.LT, exp.LTE, exp.Between)
+
+# PostgreSQL truncates longer identifiers, which can make two index names collide
+MAX_IDENTIFIER_LENGTH = 63
+
+
+@dataclass
+class WorkloadQuery:
+    """One distinct logged query, with how often it ran and a tenant to replay it as."""
+    sql: str
+    count: int
+    role: str
+    fleet_id: str
+    tables: Set[str] = field(default_factory=set)
+    base_cost: float = 0.0
+
+
+@dataclass
+class Candidate:
+    table: str
+    columns: Tuple[str, ...]
+    queries: List[WorkloadQuery] = field(default_factory=list)
+    base_cost: float = 0.0
+    new_cost: float = 0.0
+
+    @property
+    def name(self) -> str:
+        """{table}_{columns}_advised_idx, shortened with a hash of the full name past 63 characters."""
+        base, suffix = f"{self.table}_{'_'.join(self.columns)}", "_advised_idx"
+        if len(base) + len(suffix) <= MAX_IDENTIFIER_LENGTH:
+            return base + suffix
+        digest = hashlib.sha256(base.encode()).hexdigest()[:8]
+        return f"{base[:MAX_IDENTIFIER_LENGTH - len(suffix) - len(digest) - 1]}_{digest}{suffix}"
+
+    @property
+    def ddl(self) -> str:
+        return f"CREATE INDEX {self.name} ON {self.table} ({', '.join(self.columns)})"
+
+    @property
+    def improvement(self) -> float:
+        return 1 - self.new_cost / self.base_cost if self.base_cost else 0.0
+
+
+# ============================================================================
+# WORKLOAD
+# ============================================================================
+
+def load_workload(path: Optional[str] = None) -> List[WorkloadQuery]:
+    """Distinct successful queries from the query log, most frequent first."""
+    counts: Counter = Counter()
+    tenants: Dict[str, Tuple[str, str]] = {}
+    for record in query_log.read(path):
+        if record.get("error") or not record.get("sql"):
+            continue
+        sql = normalize_sql(record["sql"])
+        counts[sql] += 1
+        tenants[sql] = (record["role"], record["fleet_id"])
+    return [
+        WorkloadQuery(sql, count, *tenants[sql]) for sql, count in counts.most_common()
+    ]
+
+
+def get_schema_columns() -> Dict[str, Dict[str, str]]:
+    """table -> column -> type for the application tables, as sqlglot schema input."""
+    with engine.connect() as con:
+        rows = con.execute(
+            text("""
+                SELECT table_name, column_name, data_type FROM information_schema.columns
+                WHERE table_schema = 'public' AND table_name = ANY(:tables)
+            """),
+            {"tables": list(ALL_TABLE_QUERIES)}
+        ).fetchall()
+    schema: Dict[str, Dict[str, str]] = {}
+    for table, column, data_type in rows:
+        schema.setdefault(table, {})[column] = data_type
+    return schema
+
+
+# ============================================================================
+# CANDIDATES
+# ============================================================================
+
+def column_table(column: exp.Column, sources: Dict) -> Optional[str]:
+    """Base table a qualified column reads from, or None for derived tables."""
+    source = sources.get(column.table)
+    return source.name if isinstance(source, exp.Table) else None
+
+
+def extract_candidates(sql: str, schema: Dict[str, Dict[str, str]]) -> Set[Tuple[str, Tuple[str, ...]]]:
+    """
+    Candidate (table, columns) indexes for one query: equality and join columns
+    first, then one range or ORDER BY column, following the usual
+    equality-then-range rule for composite B-tree indexes.
+    """
+    try:
+        tree = qualify(sqlglot.parse_one(sql, read="postgres"), schema=schema, dialect="postgres")
+    except SqlglotError:
+        return set()
+
+    candidates = set()
+    for scope in traverse_scope(tree):
+        equality: Dict[str, List[str]] = {}
+        ranges: Dict[str, List[str]] = {}
+
+        def add(bucket: Dict[str, List[str]], col: exp.Column) -> None:
+            table = column_table(col, scope.sources)
+            if table and col.name not in bucket.setdefault(table, []):
+                bucket[table].append(col.name)
+
+        conditions = [scope.expression.args.get("where")]
+        conditions += [join.args.get("on") for join in scope.expression.args.get("joins") or []]
+        for condition in filter(None, conditions):
+            for predicate in condition.find_all(exp.EQ, exp.In, *RANGE_PREDICATES):
+                columns = [c for c in predicate.find_all(exp.Column) if c.find_ancestor(exp.Select) is scope.expression]
+                if isinstance(predicate, (exp.EQ, exp.In)):
+                    # col = literal, col IN (...), or a join key a.col = b.col
+                    for col in columns:
+                        add(equality, col)
+                elif len(columns) == 1:
+                    add(ranges, columns[0])
+
+        order = scope.expression.args.get("order")
+        for ordered in (order.expressions if order else []):
+            if isinstance(ordered.this, exp.Column):
+                add(ranges, ordered.this)
+
+        for table in set(equality) | set(ranges):
+            eq_cols = sorted(equality.get(table, []))
+            range_cols = [c for c in ranges.get(table, []) if c not in eq_cols]
+            if eq_cols:
+                candidates.add((table, tuple(eq_cols[:MAX_INDEX_COLUMNS])))
+            if range_cols:
+                composite = (eq_cols[:MAX_INDEX_COLUMNS - 1] + range_cols[:1])
+                candidates.add((table, tuple(composite)))
+    return candidates
+
+
+def get_existing_indexes() -> Dict[str, List[Tuple[str, ...]]]:
+    """Key column lists of the existing B-tree indexes, per table."""
+    with engine.connect() as con:
+        rows = con.execute(
+            text("""
+                SELECT t.relname, array_agg(a.attname ORDER BY k.ord)
+                FROM pg_index i
+                JOIN pg_class t ON t.oid = i.indrelid
+                JOIN pg_class ix ON ix.oid = i.indexrelid
+                JOIN pg_am am ON am.oid = ix.relam AND am.amname = 'btree'
+                CROSS JOIN LATERAL unnest(i.indkey) WITH ORDINALITY AS k(attnum, ord)
+                JOIN pg_attribute a ON a.attrelid = t.oid AND a.attnum = k.attnum
+                WHERE t.relname = ANY(:tables)
+                GROUP BY t.relname, i.indexrelid
+            """),
+            {"tables": list(ALL_TABLE_QUERIES)}
+        ).fetchall()
+    indexes: Dict[str, List[Tuple[str, ...]]] = {}
+    for table, columns in rows:
+        indexes.setdefault(table, []).append(tuple(columns))
+    return indexes
+
+
+def is_covered(columns: Tuple[str, ...], indexes: Iterable[Tuple[str, ...]]) -> bool:
+    """Whether an index with these leading columns already exists."""
+    return any(index[:len(columns)] == columns for index in indexes)
+
+
+# ============================================================================
+# EVALUATION
+# ============================================================================
+
+def has_hypopg(con) -> bool:
+    try:
+        with con.begin_nested():
+            con.execute(text("CREATE EXTENSION IF NOT EXISTS hypopg"))
+        return True
+    except SQLAlchemyError:
+        return False
+
+
+def is_partitioned(con, table: str) -> bool:
+    return con.execute(
+        text("SELECT relkind = 'p' FROM pg_class WHERE oid = CAST(:table AS regclass)"), {"table": table}
+    ).scalar()
+
+
+@contextmanager
+def hypothetical_index(con, candidate: Optional[Candidate], use_hypopg: bool):
+    """
+    Make the candidate index visible to the planner for the enclosed EXPLAINs.
+    HypoPG creates it without building anything; otherwise (or for partitioned
+    tables, which HypoPG does not support) it is really built inside a savepoint
+    that is rolled back afterwards.
+    """
+    if candidate is None:
+        yield
+        return
+    if use_hypopg and not is_partitioned(con, candidate.table):
+        con.execute(text("SELECT * FROM hypopg_create_index(:ddl)"), {"ddl": candidate.ddl})
+        try:
+            yield
+        finally:
+            con.execute(text("SELECT hypopg_reset()"))
+        return
+    savepoint = con.begin_nested()
+    try:
+        con.execute(text(candidate.ddl))
+        yield
+    finally:
+        savepoint.rollback()
+
+
+def explain_cost(con, query: WorkloadQuery) -> Optional[float]:
+    """Planner total cost of a query as its tenant sees it (RLS applies)."""
+    savepoint = con.begin_nested()
+    try:
+        scope_to_tenant(con, query.role, query.fleet_id)
+        plan = con.execute(text(f"EXPLAIN (FORMAT JSON) {query.sql}")).scalar()
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return float(plan[0]["Plan"]["Total Cost"])
+    except (SQLAlchemyError, ValueError) as e:
+        print(f"Skipping query that cannot be explained: {e}")
+        return None
+    finally:
+        savepoint.rollback()
+
+
+def evaluate(workload: List[WorkloadQuery], candidates: List[Candidate]) -> None:
+    """Fill base and hypothetical costs (weighted by query frequency) for each candidate."""
+    # Everything happens in one transaction that is rolled back, extension included
+    with engine.connect() as con:
+        transaction = con.begin()
+        try:
+            use_hypopg = has_hypopg(con)
+            print(f"Testing {len(candidates)} candidates with "
+                  f"{'HypoPG' if use_hypopg else 'indexes built in rolled-back savepoints'}")
+
+            for query in workload:
+                query.base_cost = explain_cost(con, query) or 0.0
+
+            for candidate in candidates:
+                with hypothetical_index(con, candidate, use_hypopg):
+                    for query in candidate.queries:
+                        if not query.base_cost:
+                            continue
+                        cost = explain_cost(con, query)
+                        candidate.base_cost += query.count * query.base_cost
+                        candidate.new_cost += query.count * (cost if cost is not None else query.base_cost)
+        finally:
+            transaction.rollback()
+
+
+def select_winners(candidates: List[Candidate], min_improvement: float = MIN_IMPROVEMENT) -> List[Candidate]:
+    """Best candidates by absolute saving, skipping ones whose columns prefix an earlier winner."""
+    winners: List[Candidate] = []
+    ranked = sorted(candidates, key=lambda c: c.base_cost - c.new_cost, reverse=True)
+    for candidate in ranked:
+        if candidate.improvement < min_improvement:
+            continue
+        chosen = [w.columns for w in winners if w.table == candidate.table]
+        if is_covered(candidate.columns, chosen):
+            continue
+        winners.append(candidate)
+    return winners
+
+
+def apply_indexes(winners: List[Candidate]) -> None:
+    """Create the winning indexes; CONCURRENTLY where possible so reads are not blocked."""
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as con:
+        for candidate in winners:
+            concurrently = "" if is_partitioned(con, candidate.table) else " CONCURRENTLY"
+            ddl = candidate.ddl.replace("CREATE INDEX", f"CREATE INDEX{concurrently} IF NOT EXISTS", 1)
+            print(f"Applying: {ddl}")
+            con.execute(text(ddl))
+
+
+def advise(
+    log_path: Optional[str] = None,
+    min_improvement: float = MIN_IMPROVEMENT,
+    apply: bool = False
+) -> List[Candidate]:
+    """Propose, test and optionally apply indexes for the logged agent workload."""
+    workload = load_workload(log_path)
+    if not workload:
+        print("Query log is empty: nothing to advise on")
+        return []
+    print(f"Workload: {len(workload)} distinct queries, {sum(q.count for q in workload)} executions")
+
+    schema = get_schema_columns()
+    existing = get_existing_indexes()
+    candidates: Dict[Tuple[str, Tuple[str, ...]], Candidate] = {}
+    for query in workload:
+        for table, columns in extract_candidates(query.sql, schema):
+            query.tables.add(table)
+            if is_covered(columns, existing.get(table, [])):
+                continue
+            candidate = candidates.setdefault((table, columns), Candidate(table, columns))
+            candidate.queries.append(query)
+
+    evaluate(workload, list(candidates.values()))
+    winners = select_winners(list(candidates.values()), min_improvement)
+
+    print(f"\n{'candidate index':<60} {'queries':>8} {'cost before':>12} {'after':>12} {'gain':>7}")
+    for candidate in sorted(candidates.values(), key=lambda c: c.improvement, reverse=True):
+        marker = "*" if candidate in winners else " "
+        print(f"{marker} {candidate.table + '(' + ', '.join(candidate.columns) + ')':<58} "
+              f"{sum(q.count for q in candidate.queries):>8} {candidate.base_cost:12.1f} "
+              f"{candidate.new_cost:12.1f} {candidate.improvement:6.1%}")
+
+    if apply and winners:
+        apply_indexes(winners)
+    return winners
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Suggest indexes from the SQL the agent actually ran.")
+    parser.add_argument("--log", help="Query log path (defaults to QUERY_LOG_PATH)")
+    parser.add_argument("--min-improvement", type=float, default=MIN_IMPROVEMENT,
+                        help="Minimum estimated cost reduction for a candidate to win")
+    parser.add_argument("--apply", action="store_true", help="Create the winning indexes")
+    args = parser.parse_args()
+
+    advise(args.log, args.min_improvement, args.apply)
@@ -0,0 +1,135 @@
+import time
+import argparse
+import asyncio
+from contextlib import asynccontextmanager
+from typing import Dict, List
+from databases import Database
+
+from core.setup_database.schema import PARTITIONED_TABLES, ALL_TABLE_QUERIES, get_foreign_key_columns
+from core.db_con import database
+
+
+# Timestamp columns that grow with insertion order; BRIN indexes stay tiny and
+# still skip most blocks for range filters on them
+BRIN_COLUMNS = {
+    "raw_telemetry": "ts",
+    "processed_metrics": "ts",
+    "battery_cycles": "ts",
+    "alerts": "alert_ts",
+    "trips": "start_ts",
+    "charging_sessions": "start_ts",
+    "maintenance_logs": "start_ts",
+    "geofence_events": "enter_ts",
+}
+
+# Hot tables that can be physically ordered by (vehicle_id, ts) with CLUSTER
+CLUSTER_TABLES = PARTITIONED_TABLES
+
+
+@asynccontextmanager
+async def timed(step: str, timings: Dict[str, float]):
+    """Record and print how long a step took."""
+    start = time.perf_counter()
+    yield
+    timings[step] = time.perf_counter() - start
+    print(f"- {step:<48} {timings[step]:8.3f}s")
+
+
+async def create_brin_indexes(database: Database, timings: Dict[str, float]) -> None:
+    """BRIN indexes on append-ordered timestamp columns."""
+    for table, column in BRIN_COLUMNS.items():
+        async with timed(f"BRIN index {table}({column})", timings):
+            await database.execute(query=f"""
+                CREATE INDEX IF NOT EXISTS {table}_{column}_brin
+                ON {table} USING brin ({column})
+            """)
+
+
+async def create_foreign_key_indexes(database: Database, timings: Dict[str, float]) -> None:
+    """B-tree indexes on foreign key columns (vehicle_id, fleet_id, trip_id, driver_id)."""
+    for table, columns in get_foreign_key_columns().items():
+        for column in columns:
+            async with timed(f"B-tree index {table}({column})", timings):
+                await database.execute(
+                    query=f"CREATE INDEX IF NOT EXISTS {table}_{column}_idx ON {table} ({column})"
+                )
+
+    # Partitioned tables have no foreign keys; per-vehicle time lookups use this instead
+    for table in PARTITIONED_TABLES:
+        async with timed(f"B-tree index {table}(vehicle_id, ts)", timings):
+            await database.execute(
+                query=f"CREATE INDEX IF NOT EXISTS {table}_vehicle_id_ts_idx ON {table} (vehicle_id, ts)"
+            )
+
+
+async def cluster_tables(database: Database, timings: Dict[str, float]) -> None:
+    """
+    Rewrite hot tables in (vehicle_id, ts) order. Takes an exclusive lock for the
+    duration, so it is opt-in. Partitioned tables can be clustered directly from
+    PostgreSQL 15; older servers cluster each leaf partition.
+    """
+    version = await database.fetch_val(query="SELECT current_setting('server_version_num')::int")
+    for table in CLUSTER_TABLES:
+        async with timed(f"CLUSTER {table}", timings):
+            if version >= 150000:
+                await database.execute(query=f"CLUSTER {table} USING {table}_vehicle_id_ts_idx")
+                continue
+            leaves = await database.fetch_all(
+                query="""
+                    SELECT p.relid::regclass::text, i.indexrelid::regclass::text
+                    FROM pg_partition_tree(CAST(:table AS regclass)) p
+                    JOIN pg_index i ON i.indrelid = p.relid
+                    JOIN pg_partition_tree(CAST(:index AS regclass)) pi ON pi.relid = i.indexrelid
+                    WHERE p.isleaf
+                """,
+                values={"table": table, "index": f"{table}_vehicle_id_ts_idx"}
+            )
+            for leaf in leaves:
+                await database.execute(query=f"CLUSTER {leaf[0]} USING {leaf[1]}")
+
+
+async def analyze_tables(database: Database, timings: Dict[str, float], tables: List[str]) -> None:
+    """Refresh planner statistics (partitioned tables include their partitions)."""
+    for table in tables:
+        async with timed(f"ANALYZE {table}", timings):
+            await database.execute(query=f"ANALYZE {table}")
+
+
+async def optimize_database(database: Database, cluster: bool = False) -> Dict[str, float]:
+    """
+    Post-load stage: create indexes, optionally CLUSTER hot tables, then ANALYZE.
+    Index creation is idempotent, so this is cheap to re-run after every import.
+    Returns per-step timings in seconds.
+    """
+    timings: Dict[str, float] = {}
+    print("\nOptimizing database...")
+    try:
+        await create_brin_indexes(database, timings)
+        await create_foreign_key_indexes(database, timings)
+        if cluster:
+            await cluster_tables(database, timings)
+        # Statistics last, so they describe the final physical layout
+        await analyze_tables(database, timings, list(ALL_TABLE_QUERIES))
+    except Exception as e:
+        raise RuntimeError(f"Failed to optimize database: {e}")
+
+    print(f"Optimization complete: {sum(timings.values()):.3f}s")
+    return timings
+
+
+async def main(database: Database = database, cluster: bool = False) -> None:
+    """Run the post-load optimization stage."""
+    try:
+        await database.connect()
+        await optimize_database(database, cluster)
+    finally:
+        await database.disconnect()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Index, cluster and analyze tables after a data load.")
+    parser.add_argument("--cluster", action="store_true",
+                        help="CLUSTER hot tables by (vehicle_id, ts); locks them while rewriting")
+    args = parser.parse_args()
+
+    asyncio.run(main(cluster=args.cluster))
@@ -0,0 +1,250 @@
+import os
+import re
+import argparse
+import asyncio
+from datetime import date, datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+from databases import Database
+
+from core.setup_database.schema import PARTITIONED_TABLES
+from core.db_con import database
+
+
+# Width of each time-range partition: "daily" or "monthly"
+PARTITION_INTERVAL = os.getenv("PARTITION_INTERVAL", "monthly")
+
+# Each time-range partition is split into this many vehicle_id hash partitions,
+# so the partition count no longer grows with the number of vehicles
+PARTITION_HASH_MODULUS = int(os.getenv("PARTITION_HASH_MODULUS", "4"))
+
+# Future intervals to create ahead of incoming data
+PARTITION_PREMAKE = int(os.getenv("PARTITION_PREMAKE", "2"))
+
+# Intervals to keep, counting the current one; older partitions are detached (0 keeps everything)
+PARTITION_RETENTION = int(os.getenv("PARTITION_RETENTION", "0"))
+
+# What happens to expired partitions: "detach" leaves them as standalone tables
+# renamed with DETACHED_SUFFIX, "archive" moves them into ARCHIVE_SCHEMA instead
+# (either way their names are free again if the range is ever reloaded)
+PARTITION_RETENTION_ACTION = os.getenv("PARTITION_RETENTION_ACTION", "detach")
+ARCHIVE_SCHEMA = "archive"
+DETACHED_SUFFIX = "_detached"
+
+PARTITION_INTERVALS = ["daily", "monthly"]
+RETENTION_ACTIONS = ["detach", "archive"]
+
+BOUND_PATTERN = re.compile(r"FROM \('([^']+)'\) TO \('([^']+)'\)")
+
+
+# ============================================================================
+# TIME BUCKETS
+# ============================================================================
+
+def bucket_start(day: date, interval: str = PARTITION_INTERVAL) -> date:
+    """First day of the partition interval containing day."""
+    if interval == "daily":
+        return day
+    if interval == "monthly":
+        return day.replace(day=1)
+    raise ValueError(f"Unknown partition interval '{interval}', expected one of {PARTITION_INTERVALS}")
+
+
+def shift_bucket(start: date, count: int, interval: str = PARTITION_INTERVAL) -> date:
+    """Start of the bucket count intervals after (or before, if negative) start."""
+    if interval == "daily":
+        return date.fromordinal(start.toordinal() + count)
+    months = start.year * 12 + start.month - 1 + count
+    return date(months // 12, months % 12 + 1, 1)
+
+
+def partition_name(table: str, start: date, interval: str = PARTITION_INTERVAL) -> str:
+    """e.g. raw_telemetry_p202501 (monthly) or raw_telemetry_p20250101 (daily)."""
+    suffix = start.strftime("%Y%m%d" if interval == "daily" else "%Y%m")
+    return f"{table}_p{suffix}"
+
+
+def parse_day(value: str) -> date:
+    """Calendar day of an ISO timestamp string, e.g. '2025-01-01T00:00:00'."""
+    return date.fromisoformat(value[:10])
+
+
+# ============================================================================
+# PARTITION MANAGEMENT
+# ============================================================================
+
+async def list_partitions(database: Database, table: str) -> Dict[str, Tuple[date, date]]:
+    """Time-range partitions attached to a table: name -> [start, end)."""
+    rows = await database.fetch_all(
+        query="""
+            SELECT c.relname, pg_get_expr(c.relpartbound, c.oid) FROM pg_inherits i
+            JOIN pg_class c ON c.oid = i.inhrelid
+            WHERE i.inhparent = CAST(:table AS regclass)
+        """,
+        values={"table": table}
+    )
+    partitions = {}
+    for row in rows:
+        match = BOUND_PATTERN.search(row[1] or "")
+        if match:
+            start, end = (datetime.fromisoformat(v).date() for v in match.groups())
+            partitions[row[0]] = (start, end)
+    return partitions
+
+
+async def create_partition(
+    database: Database,
+    table: str,
+    start: date,
+    interval: str = PARTITION_INTERVAL,
+    modulus: int = PARTITION_HASH_MODULUS
+) -> str:
+    """
+    Create the time-range partition starting at start, sub-partitioned by
+    vehicle_id hash. Partitions are only reachable through the parent table:
+    row-level security without policies denies direct access to them.
+    """
+    name = partition_name(table, start, interval)
+    end = shift_bucket(start, 1, interval)
+    try:
+        await database.execute(query=f"""
+            CREATE TABLE IF NOT EXISTS {name} PARTITION OF {table}
+            FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')
+            PARTITION BY HASH (vehicle_id)
+        """)
+        leaves = [f"{name}_h{remainder}" for remainder in range(modulus)]
+        for remainder, leaf in enumerate(leaves):
+            await database.execute(query=f"""
+                CREATE TABLE IF NOT EXISTS {leaf} PARTITION OF {name}
+                FOR VALUES WITH (MODULUS {modulus}, REMAINDER {remainder})
+            """)
+        for partition in [name, *leaves]:
+            await database.execute(query=f"ALTER TABLE {partition} ENABLE ROW LEVEL SECURITY")
+            await database.execute(query=f"ALTER TABLE {partition} FORCE ROW LEVEL SECURITY")
+        return name
+    except Exception as e:
+        raise RuntimeError(f"Failed to create partition {name} of table {table}: {e}")
+
+
+async def ensure_partitions(
+    database: Database,
+    table: str,
+    days: Iterable[date],
+    interval: str = PARTITION_INTERVAL
+) -> List[str]:
+    """Create any missing partitions covering the given days. Returns the new partition names."""
+    existing = (await list_partitions(database, table)).values()
+    created = []
+    for start in sorted({bucket_start(day, interval) for day in days}):
+        if any(lo <= start < hi for lo, hi in existing):
+            continue
+        created.append(await create_partition(database, table, start, interval))
+    return created
+
+
+async def premake_partitions(
+    database: Database,
+    table: str,
+    ahead: int = PARTITION_PREMAKE,
+    interval: str = PARTITION_INTERVAL,
+    today: Optional[date] = None
+) -> List[str]:
+    """Create partitions for the current interval and the next ahead intervals."""
+    current = bucket_start(today or date.today(), interval)
+    days = [shift_bucket(current, i, interval) for i in range(ahead + 1)]
+    return await ensure_partitions(database, table, days, interval)
+
+
+async def apply_retention(
+    database: Database,
+    table: str,
+    keep: int = PARTITION_RETENTION,
+    action: str = PARTITION_RETENTION_ACTION,
+    interval: str = PARTITION_INTERVAL,
+    today: Optional[date] = None
+) -> List[str]:
+    """
+    Detach partitions that end before the oldest of the last keep intervals, then
+    rename them (and their hash partitions) or, with action "archive", move them
+    into ARCHIVE_SCHEMA. Returns the detached partition names.
+    """
+    if keep <= 0:
+        return []
+    if action not in RETENTION_ACTIONS:
+        raise ValueError(f"Unknown retention action '{action}', expected one of {RETENTION_ACTIONS}")
+
+    cutoff = shift_bucket(bucket_start(today or date.today(), interval), 1 - keep, interval)
+    expired = sorted(
+        name for name, (_, end) in (await list_partitions(database, table)).items() if end <= cutoff
+    )
+    if expired and action == "archive":
+        await database.execute(query=f"CREATE SCHEMA IF NOT EXISTS {ARCHIVE_SCHEMA}")
+
+    for name in expired:
+        try:
+            async with database.transaction():
+                await database.execute(query=f"ALTER TABLE {table} DETACH PARTITION {name}")
+                leaves = await database.fetch_all(
+                    query="""
+                        SELECT c.relname FROM pg_inherits i
+                        JOIN pg_class c ON c.oid = i.inhrelid
+                        WHERE i.inhparent = CAST(:name AS regclass)
+                    """,
+                    values={"name": name}
+                )
+                for partition in [*(leaf[0] for leaf in leaves), name]:
+                    if action == "archive":
+                        await database.execute(query=f"ALTER TABLE {partition} SET SCHEMA {ARCHIVE_SCHEMA}")
+                    else:
+                        await database.execute(
+                            query=f"ALTER TABLE {partition} RENAME TO {partition}{DETACHED_SUFFIX}"
+                        )
+        except Exception as e:
+            raise RuntimeError(f"Failed to {action} partition {name} of table {table}: {e}")
+    return expired
+
+
+async def maintain_partitions(
+    database: Database,
+    tables: List[str] = PARTITIONED_TABLES,
+    ahead: int = PARTITION_PREMAKE,
+    keep: int = PARTITION_RETENTION,
+    action: str = PARTITION_RETENTION_ACTION,
+    interval: str = PARTITION_INTERVAL
+) -> None:
+    """Create upcoming partitions and retire expired ones for every partitioned table."""
+    for table in tables:
+        created = await premake_partitions(database, table, ahead, interval)
+        retired = await apply_retention(database, table, keep, action, interval)
+        print(f"'{table}': created partitions {created}, retired ({action}) {retired}")
+
+
+async def main(
+    database: Database = database,
+    ahead: int = PARTITION_PREMAKE,
+    keep: int = PARTITION_RETENTION,
+    action: str = PARTITION_RETENTION_ACTION,
+    interval: str = PARTITION_INTERVAL
+) -> None:
+    """Run partition maintenance for the telemetry tables."""
+    try:
+        await database.connect()
+        await maintain_partitions(database, PARTITIONED_TABLES, ahead, keep, action, interval)
+    except Exception as e:
+        raise RuntimeError(f"Failed to maintain partitions: {e}")
+    finally:
+        await database.disconnect()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Create upcoming and retire expired telemetry partitions.")
+    parser.add_argument("--interval", choices=PARTITION_INTERVALS, default=PARTITION_INTERVAL,
+                        help="Width of each time-range partition")
+    parser.add_argument("--premake", type=int, default=PARTITION_PREMAKE,
+                        help="Number of future intervals to create ahead of time")
+    parser.add_argument("--retention", type=int, default=PARTITION_RETENTION,
+                        help="Number of intervals to keep, counting the current one (0 keeps everything)")
+    parser.add_argument("--action", choices=RETENTION_ACTIONS, default=PARTITION_RETENTION_ACTION,
+                        help="What to do with expired partitions")
+    args = parser.parse_args()
+
+    asyncio.run(main(ahead=args.premake, keep=args.retention, action=args.action, interval=args.interval))
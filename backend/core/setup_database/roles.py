@@ -2,6 +2,10 @@ from typing import Any, Protocol
 from databases import Database
 
 
+# Roles the application switches into per request
+APP_ROLES = ["superuser", "end_user"]
+
+
 class RoleStrategy(Protocol):
     """Protocol for role creation strategies."""
     async def create_role(self, db: Database, db_name: str, db_user: str) -> None:
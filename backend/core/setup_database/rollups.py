@@ -0,0 +1,160 @@
+import os
+import time
+import argparse
+import asyncio
+import threading
+from typing import Dict, Iterable, List, Optional, Set
+
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import SQLAlchemyError
+
+from core.db_con import engine
+from core.cache import notify_data_changed, on_data_change
+from core.setup_database.schema import ROLLUP_TABLE_QUERIES
+
+
+# Seconds between scheduled refreshes in the API process (0 disables the schedule)
+ROLLUP_REFRESH_INTERVAL_SEC = float(os.getenv("ROLLUP_REFRESH_INTERVAL_SEC", "3600"))
+
+# SELECT producing each rollup's rows, in table column order
+ROLLUP_QUERIES = {
+    "vehicle_daily_usage": """
+        SELECT
+            t.vehicle_id, v.fleet_id, t.start_ts::date,
+            COUNT(*),
+            SUM(t.distance_km),
+            SUM(EXTRACT(EPOCH FROM t.end_ts - t.start_ts)) / 3600.0,
+            SUM(t.idle_minutes),
+            SUM(t.energy_kwh)
+        FROM trips t
+        JOIN vehicles v ON v.vehicle_id = t.vehicle_id
+        WHERE t.start_ts IS NOT NULL
+        GROUP BY t.vehicle_id, v.fleet_id, t.start_ts::date
+    """,
+    # processed_metrics rows are 15-minute windows
+    "vehicle_daily_soc_band": """
+        SELECT
+            p.vehicle_id, v.fleet_id, p.ts::date, p.soc_band,
+            COUNT(*) * 0.25,
+            100.0 * COUNT(*) / SUM(COUNT(*)) OVER (PARTITION BY p.vehicle_id, p.ts::date)
+        FROM processed_metrics p
+        JOIN vehicles v ON v.vehicle_id = p.vehicle_id
+        WHERE p.soc_band IS NOT NULL
+        GROUP BY p.vehicle_id, v.fleet_id, p.ts::date, p.soc_band
+    """,
+    "vehicle_daily_battery_temp": """
+        SELECT
+            r.vehicle_id, v.fleet_id, r.ts::date,
+            MAX(r.batt_temp_c), AVG(r.batt_temp_c), MIN(r.soc_pct), MAX(r.soc_pct)
+        FROM raw_telemetry r
+        JOIN vehicles v ON v.vehicle_id = r.vehicle_id
+        GROUP BY r.vehicle_id, v.fleet_id, r.ts::date
+    """,
+}
+
+# Tables each rollup is derived from
+ROLLUP_SOURCES = {
+    "vehicle_daily_usage": ["trips", "vehicles"],
+    "vehicle_daily_soc_band": ["processed_metrics", "vehicles"],
+    "vehicle_daily_battery_temp": ["raw_telemetry", "vehicles"],
+}
+
+
+def rollups_for(tables: Optional[Iterable[str]] = None) -> List[str]:
+    """Rollups derived from any of the given tables (all rollups if None)."""
+    if tables is None:
+        return list(ROLLUP_TABLE_QUERIES)
+    changed = set(tables)
+    return [rollup for rollup, sources in ROLLUP_SOURCES.items() if changed & set(sources)]
+
+
+class ChangedTables:
+    """Tables written since the last scheduled refresh, as heard through on_data_change."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # None: unknown (e.g. at startup or after a missed notification), so everything
+        self._tables: Optional[Set[str]] = None
+
+    def add(self, tables: Optional[Iterable[str]]) -> None:
+        with self._lock:
+            if tables is None or self._tables is None:
+                self._tables = None
+            else:
+                self._tables.update(tables)
+
+    def take(self) -> Optional[Set[str]]:
+        """The changed tables so far (None for everything), starting a new empty set."""
+        with self._lock:
+            tables, self._tables = self._tables, set()
+            return tables
+
+
+# Fed by the tables' NOTIFY triggers, so writes from any process count
+changed_since_refresh = ChangedTables()
+on_data_change(changed_since_refresh.add)
+
+
+def refresh_rollup(engine: Engine, rollup: str) -> int:
+    """
+    Rebuild one rollup in a single transaction. Readers keep seeing the previous
+    contents until it commits, and are never blocked (no TRUNCATE lock).
+    Concurrent refreshes of the same rollup (other API workers, the importer)
+    wait for each other on an advisory lock. Returns the number of rows.
+    """
+    with engine.begin() as con:
+        con.execute(text("SELECT pg_advisory_xact_lock(hashtext(:rollup))"), {"rollup": rollup})
+        con.execute(text(f"DELETE FROM {rollup}"))
+        rows = con.execute(text(f"INSERT INTO {rollup} {ROLLUP_QUERIES[rollup]}")).rowcount
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as con:
+        con.execute(text(f"ANALYZE {rollup}"))
+    return rows
+
+
+def refresh_rollups(
+    changed_tables: Optional[Iterable[str]] = None, engine: Engine = engine
+) -> Dict[str, float]:
+    """
+    Refresh the rollups derived from changed_tables (all if None), then notify
+    in-process caches. Returns per-rollup refresh time in seconds.
+    """
+    timings: Dict[str, float] = {}
+    for rollup in rollups_for(changed_tables):
+        start = time.perf_counter()
+        try:
+            rows = refresh_rollup(engine, rollup)
+        except SQLAlchemyError as e:
+            raise RuntimeError(f"Failed to refresh rollup {rollup}: {e}")
+        timings[rollup] = time.perf_counter() - start
+        print(f"- {rollup:<28} {rows:>8} rows {timings[rollup]:8.3f}s")
+
+    if timings:
+        notify_data_changed(list(timings))
+    return timings
+
+
+async def refresh_rollups_periodically(interval_sec: float = ROLLUP_REFRESH_INTERVAL_SEC) -> None:
+    """
+    Background task for the API process: every interval_sec, refresh the rollups
+    whose source tables changed since the last refresh (all of them the first time).
+    """
+    while True:
+        await asyncio.sleep(interval_sec)
+        changed = changed_since_refresh.take()
+        if changed is not None and not rollups_for(changed):
+            continue
+        try:
+            print("Refreshing rollups...")
+            await asyncio.to_thread(refresh_rollups, changed)
+        except RuntimeError as e:
+            changed_since_refresh.add(changed)  # Retry on the next run
+            print(f"Scheduled rollup refresh failed: {e}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rebuild the pre-aggregated rollup tables.")
+    parser.add_argument("--tables", nargs="+", help="Only refresh rollups derived from these tables")
+    args = parser.parse_args()
+
+    refresh_rollups(args.tables)
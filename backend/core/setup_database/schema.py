@@ -1,14 +1,46 @@
+import os
+import re
 from databases import Database
 from sqlalchemy import text
 from typing import Dict, List
 
+from core.cache import DATA_CHANGE_CHANNEL
+
 
 # ============================================================================
 # TABLE DEFINITIONS
 # ============================================================================
 
+# Partitioned by ts range, each range sub-partitioned by vehicle_id hash (see partitions.py)
 PARTITIONED_TABLES = ["raw_telemetry", "processed_metrics"]
 
+# Tables that reach their fleet through vehicle_id
+VEHICLE_KEYED_TABLES = [
+    "alerts", "geofence_events", "maintenance_logs", "battery_cycles",
+    "raw_telemetry", "processed_metrics", "charging_sessions", "trips"
+]
+
+# Optional schema mode: carry a trigger-maintained, indexed fleet_id on tables that
+# otherwise reach it through a join, so RLS policies become plain equality checks
+DENORMALIZE_FLEET_ID = os.getenv("DENORMALIZE_FLEET_ID", "false").lower() in ("1", "true", "yes")
+
+# Table -> (table its fleet_id is copied from, key column shared with it)
+FLEET_ID_SOURCES = {
+    **{table: ("vehicles", "vehicle_id") for table in VEHICLE_KEYED_TABLES},
+    "driver_trip_map": ("trips", "trip_id"),
+}
+
+# Load-order dependencies without a foreign key: the partitioned telemetry tables
+# take their fleet_id (and vehicle_latest_state's) from vehicles as they are inserted
+LOGICAL_DEPENDENCIES = {table: ["vehicles"] for table in PARTITIONED_TABLES}
+
+# Append-only time-series tables without a primary key and their watermark column,
+# kept per vehicle_id, for incremental imports (keyed tables are upserted instead)
+APPEND_ONLY_TABLES = {
+    "raw_telemetry": "ts",
+    "processed_metrics": "ts",
+}
+
 # Order of table creation matters due to foreign key constraints
 CREATE_TABLE_QUERIES = {
     "fleets": """
@@ -87,7 +119,7 @@ CREATE_TABLE_QUERIES = {
             longitude DOUBLE PRECISION,
             speed_kph DOUBLE PRECISION,
             odo_km DOUBLE PRECISION
-        ) PARTITION BY LIST (vehicle_id);
+        ) PARTITION BY RANGE (ts);
     """,
     "processed_metrics": """
         CREATE TABLE IF NOT EXISTS processed_metrics (
@@ -98,7 +130,7 @@ CREATE_TABLE_QUERIES = {
             energy_kwh_15m DOUBLE PRECISION,
             battery_health_pct DOUBLE PRECISION,
             soc_band TEXT
-        ) PARTITION BY LIST (vehicle_id);
+        ) PARTITION BY RANGE (ts);
     """,
     "charging_sessions": """
         CREATE TABLE IF NOT EXISTS charging_sessions (
@@ -139,20 +171,340 @@ CREATE_TABLE_QUERIES = {
 );"""
 }
 
+# Last known state per vehicle, upserted by a trigger as raw_telemetry rows are
+# inserted, so "right now" questions are a primary key lookup
+LATEST_STATE_TABLE_QUERIES = {
+    "vehicle_latest_state": """
+        CREATE TABLE IF NOT EXISTS vehicle_latest_state (
+            vehicle_id TEXT PRIMARY KEY,
+            fleet_id TEXT,
+            ts TIMESTAMP,
+            soc_pct DOUBLE PRECISION,
+            batt_temp_c DOUBLE PRECISION,
+            speed_kph DOUBLE PRECISION,
+            odo_km DOUBLE PRECISION,
+            latitude DOUBLE PRECISION,
+            longitude DOUBLE PRECISION
+    );""",
+}
+
+# Pre-aggregated tables for common questions, rebuilt from the tables above
+# (see rollups.py). They carry fleet_id, so RLS is a plain equality check.
+ROLLUP_TABLE_QUERIES = {
+    "vehicle_daily_usage": """
+        CREATE TABLE IF NOT EXISTS vehicle_daily_usage (
+            vehicle_id TEXT,
+            fleet_id TEXT,
+            date DATE,
+            trip_count INTEGER,
+            distance_km DOUBLE PRECISION,
+            driving_hours DOUBLE PRECISION,
+            idle_minutes DOUBLE PRECISION,
+            energy_kwh DOUBLE PRECISION,
+            PRIMARY KEY (vehicle_id, date)
+    );""",
+    "vehicle_daily_soc_band": """
+        CREATE TABLE IF NOT EXISTS vehicle_daily_soc_band (
+            vehicle_id TEXT,
+            fleet_id TEXT,
+            date DATE,
+            soc_band TEXT,
+            hours DOUBLE PRECISION,
+            share_pct DOUBLE PRECISION,
+            PRIMARY KEY (vehicle_id, date, soc_band)
+    );""",
+    "vehicle_daily_battery_temp": """
+        CREATE TABLE IF NOT EXISTS vehicle_daily_battery_temp (
+            vehicle_id TEXT,
+            fleet_id TEXT,
+            date DATE,
+            max_batt_temp_c DOUBLE PRECISION,
+            avg_batt_temp_c DOUBLE PRECISION,
+            min_soc_pct DOUBLE PRECISION,
+            max_soc_pct DOUBLE PRECISION,
+            PRIMARY KEY (vehicle_id, date)
+    );""",
+}
+
+# Every table the agent can query
+ALL_TABLE_QUERIES = {**CREATE_TABLE_QUERIES, **LATEST_STATE_TABLE_QUERIES, **ROLLUP_TABLE_QUERIES}
+
+
+def get_table_dependencies() -> Dict[str, List[str]]:
+    """
+    Foreign-key dependency DAG derived from the table definitions:
+    table -> tables it REFERENCES (which must be loaded first),
+    plus the LOGICAL_DEPENDENCIES that have no foreign key.
+    """
+    dependencies = {}
+    for table, ddl in CREATE_TABLE_QUERIES.items():
+        refs = re.findall(r"REFERENCES\s+(\w+)", ddl, flags=re.IGNORECASE)
+        refs += LOGICAL_DEPENDENCIES.get(table, [])
+        dependencies[table] = sorted(set(refs) - {table})
+    return dependencies
+
+
+def get_foreign_key_columns() -> Dict[str, List[str]]:
+    """Foreign key columns per table, from the table definitions (tables without any are omitted)."""
+    foreign_keys = {}
+    for table, ddl in CREATE_TABLE_QUERIES.items():
+        columns = re.findall(r"^\s*(\w+)\s+\w+\s+REFERENCES", ddl, flags=re.IGNORECASE | re.MULTILINE)
+        if columns:
+            foreign_keys[table] = columns
+    return foreign_keys
+
+
+def get_primary_keys() -> Dict[str, List[str]]:
+    """Primary key columns per table, from the table definitions (tables without one are omitted)."""
+    primary_keys = {}
+    for table, ddl in CREATE_TABLE_QUERIES.items():
+        keys = re.findall(r"^\s*(\w+)\s+\w+\s+PRIMARY KEY", ddl, flags=re.IGNORECASE | re.MULTILINE)
+        if keys:
+            primary_keys[table] = keys
+    return primary_keys
+
+
+def get_table_columns() -> Dict[str, List[str]]:
+    """Column names per agent-visible table, from the table definitions."""
+    columns = {}
+    for table, ddl in ALL_TABLE_QUERIES.items():
+        body = ddl[ddl.index("(") + 1:]
+        columns[table] = [
+            c for c in re.findall(r"^\s*(\w+)\s+[A-Z]", body, flags=re.MULTILINE)
+            if c.upper() not in ("PRIMARY", "FOREIGN", "UNIQUE", "CONSTRAINT")
+        ]
+    return columns
+
 
 # ============================================================================
 # SCHEMA MANAGEMENT
 # ============================================================================
 
-async def enable_rls(database: Database, table: str) -> None:
-    """Enable row-level security on a table with fleet_id-based isolation."""
+async def add_denormalized_fleet_id(database: Database, table: str) -> None:
+    """
+    Add an indexed fleet_id column to a table, filled by a trigger from its source
+    table on every insert and update, so it always matches the joined value.
+    """
+    source, key = FLEET_ID_SOURCES[table]
+    try:
+        await database.execute(text(f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS fleet_id TEXT;"))
+        await database.execute(text(f"CREATE INDEX IF NOT EXISTS {table}_fleet_id_idx ON {table} (fleet_id);"))
+
+        await database.execute(text(f"""
+            CREATE OR REPLACE FUNCTION set_fleet_id_from_{source}()
+            RETURNS trigger
+            LANGUAGE plpgsql
+            SECURITY DEFINER
+            SET search_path = public
+            AS $$
+            BEGIN
+                SELECT fleet_id INTO NEW.fleet_id FROM {source} WHERE {key} = NEW.{key};
+                RETURN NEW;
+            END;
+            $$;
+        """))
+        await database.execute(text(f"DROP TRIGGER IF EXISTS {table}_set_fleet_id ON {table};"))
+        await database.execute(text(f"""
+            CREATE TRIGGER {table}_set_fleet_id
+            BEFORE INSERT OR UPDATE ON {table}
+            FOR EACH ROW
+            -- Bulk imports join fleet_id in set-wise and flag it for the transaction
+            WHEN (NEW.fleet_id IS NULL
+                  OR current_setting('app.fleet_id_prefilled', true) IS DISTINCT FROM 'on')
+            EXECUTE FUNCTION set_fleet_id_from_{source}();
+        """))
+
+        # Backfill rows loaded before the column existed
+        await database.execute(text(f"""
+            UPDATE {table} t SET fleet_id = s.fleet_id FROM {source} s
+            WHERE s.{key} = t.{key} AND t.fleet_id IS DISTINCT FROM s.fleet_id;
+        """))
+        print(f"Denormalized fleet_id added to table {table}")
+
+    except Exception as e:
+        raise RuntimeError(f"Failed to add denormalized fleet_id to table {table}: {e}")
+
+
+async def propagate_fleet_id_changes(database: Database) -> None:
+    """Push fleet_id changes on source tables (e.g. a vehicle moving fleet) to their dependents."""
+    for source in sorted({source for source, _ in FLEET_ID_SOURCES.values()}):
+        dependents = [(t, key) for t, (s, key) in FLEET_ID_SOURCES.items() if s == source]
+        updates = "\n".join(
+            f"UPDATE {t} SET fleet_id = NEW.fleet_id WHERE {key} = NEW.{key};"
+            for t, key in dependents
+        )
+        try:
+            await database.execute(text(f"""
+                CREATE OR REPLACE FUNCTION propagate_{source}_fleet_id()
+                RETURNS trigger
+                LANGUAGE plpgsql
+                SECURITY DEFINER
+                SET search_path = public
+                AS $$
+                BEGIN
+                    {updates}
+                    RETURN NULL;
+                END;
+                $$;
+            """))
+            await database.execute(text(f"DROP TRIGGER IF EXISTS {source}_propagate_fleet_id ON {source};"))
+            await database.execute(text(f"""
+                CREATE TRIGGER {source}_propagate_fleet_id
+                AFTER UPDATE OF fleet_id ON {source}
+                FOR EACH ROW WHEN (OLD.fleet_id IS DISTINCT FROM NEW.fleet_id)
+                EXECUTE FUNCTION propagate_{source}_fleet_id();
+            """))
+        except Exception as e:
+            raise RuntimeError(f"Failed to set up fleet_id propagation from table {source}: {e}")
+
+
+async def maintain_latest_state(database: Database) -> None:
+    """
+    Keep vehicle_latest_state in step with raw_telemetry: a statement-level trigger
+    upserts the newest row per vehicle from each insert batch (one sort of the
+    batch, not one upsert per row), and a TRUNCATE of raw_telemetry clears it.
+    """
+    columns = ["ts", "soc_pct", "batt_temp_c", "speed_kph", "odo_km", "latitude", "longitude"]
+    updates = ", ".join(f"{c} = EXCLUDED.{c}" for c in ["fleet_id", *columns])
+    try:
+        await database.execute(text(f"""
+            CREATE OR REPLACE FUNCTION upsert_vehicle_latest_state()
+            RETURNS trigger
+            LANGUAGE plpgsql
+            SECURITY DEFINER
+            SET search_path = public
+            AS $$
+            BEGIN
+                INSERT INTO vehicle_latest_state AS s (vehicle_id, fleet_id, {", ".join(columns)})
+                SELECT DISTINCT ON (n.vehicle_id)
+                    n.vehicle_id, v.fleet_id, {", ".join(f"n.{c}" for c in columns)}
+                FROM new_rows n
+                LEFT JOIN vehicles v ON v.vehicle_id = n.vehicle_id
+                ORDER BY n.vehicle_id, n.ts DESC
+                ON CONFLICT (vehicle_id) DO UPDATE SET {updates}
+                -- Late-arriving history never overwrites a newer state
+                WHERE s.ts IS NULL OR EXCLUDED.ts >= s.ts;
+                RETURN NULL;
+            END;
+            $$;
+        """))
+        await database.execute(text("""
+            CREATE OR REPLACE FUNCTION clear_vehicle_latest_state()
+            RETURNS trigger
+            LANGUAGE plpgsql
+            SECURITY DEFINER
+            SET search_path = public
+            AS $$
+            BEGIN
+                TRUNCATE vehicle_latest_state;
+                RETURN NULL;
+            END;
+            $$;
+        """))
+        await database.execute(text("DROP TRIGGER IF EXISTS raw_telemetry_latest_state ON raw_telemetry;"))
+        await database.execute(text("""
+            CREATE TRIGGER raw_telemetry_latest_state
+            AFTER INSERT ON raw_telemetry
+            REFERENCING NEW TABLE AS new_rows
+            FOR EACH STATEMENT
+            EXECUTE FUNCTION upsert_vehicle_latest_state();
+        """))
+        await database.execute(text("DROP TRIGGER IF EXISTS raw_telemetry_clear_latest_state ON raw_telemetry;"))
+        await database.execute(text("""
+            CREATE TRIGGER raw_telemetry_clear_latest_state
+            AFTER TRUNCATE ON raw_telemetry
+            FOR EACH STATEMENT
+            EXECUTE FUNCTION clear_vehicle_latest_state();
+        """))
+
+        # A vehicle moving fleet takes its latest state with it
+        await database.execute(text("""
+            CREATE OR REPLACE FUNCTION sync_vehicle_latest_state_fleet_id()
+            RETURNS trigger
+            LANGUAGE plpgsql
+            SECURITY DEFINER
+            SET search_path = public
+            AS $$
+            BEGIN
+                UPDATE vehicle_latest_state SET fleet_id = NEW.fleet_id WHERE vehicle_id = NEW.vehicle_id;
+                RETURN NULL;
+            END;
+            $$;
+        """))
+        await database.execute(text("DROP TRIGGER IF EXISTS vehicles_latest_state_fleet_id ON vehicles;"))
+        await database.execute(text("""
+            CREATE TRIGGER vehicles_latest_state_fleet_id
+            AFTER UPDATE OF fleet_id ON vehicles
+            FOR EACH ROW WHEN (OLD.fleet_id IS DISTINCT FROM NEW.fleet_id)
+            EXECUTE FUNCTION sync_vehicle_latest_state_fleet_id();
+        """))
+
+        # Backfill from telemetry loaded before the trigger existed: one
+        # (vehicle_id, ts) index probe per vehicle
+        await database.execute(text(f"""
+            INSERT INTO vehicle_latest_state (vehicle_id, fleet_id, {", ".join(columns)})
+            SELECT v.vehicle_id, v.fleet_id, {", ".join(f"r.{c}" for c in columns)}
+            FROM vehicles v
+            CROSS JOIN LATERAL (
+                SELECT * FROM raw_telemetry
+                WHERE vehicle_id = v.vehicle_id
+                ORDER BY ts DESC
+                LIMIT 1
+            ) r
+            ON CONFLICT (vehicle_id) DO UPDATE SET {updates};
+        """))
+        print("Latest state maintenance enabled for table vehicle_latest_state")
+
+    except Exception as e:
+        raise RuntimeError(f"Failed to set up vehicle_latest_state maintenance: {e}")
+
+
+async def announce_data_changes(database: Database) -> None:
+    """
+    NOTIFY DATA_CHANGE_CHANNEL with the table name after every statement that
+    writes a table, so API processes drop caches derived from it (see
+    listen_for_data_changes). Covers every writer, including import_data,
+    the rollups CLI and trigger-maintained vehicle_latest_state; Postgres
+    sends one notification per table per transaction, on commit.
+    """
+    try:
+        await database.execute(text(f"""
+            CREATE OR REPLACE FUNCTION notify_data_changed()
+            RETURNS trigger
+            LANGUAGE plpgsql
+            AS $$
+            BEGIN
+                PERFORM pg_notify('{DATA_CHANGE_CHANNEL}', TG_TABLE_NAME);
+                RETURN NULL;
+            END;
+            $$;
+        """))
+        for table in ALL_TABLE_QUERIES:
+            await database.execute(text(f"DROP TRIGGER IF EXISTS {table}_notify_data_changed ON {table};"))
+            await database.execute(text(f"""
+                CREATE TRIGGER {table}_notify_data_changed
+                AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON {table}
+                FOR EACH STATEMENT
+                EXECUTE FUNCTION notify_data_changed();
+            """))
+        print(f"Data change notifications enabled on channel {DATA_CHANGE_CHANNEL}")
+
+    except Exception as e:
+        raise RuntimeError(f"Failed to set up data change notifications: {e}")
+
+
+async def enable_rls(database: Database, table: str, denormalized: bool = False) -> None:
+    """
+    Enable row-level security on a table with fleet_id-based isolation.
+    With denormalized, tables carrying a copied fleet_id get an equality policy too.
+    """
     policy = f"fleet_isolation_{table}"
 
     try:
         await database.execute(text(f"DROP POLICY IF EXISTS {policy} ON {table};"))
         
         # Direct fleet_id filtering
-        if "fleet_id" in CREATE_TABLE_QUERIES[table]:
+        if "fleet_id" in ALL_TABLE_QUERIES[table] or (denormalized and table in FLEET_ID_SOURCES):
             policy_sql = f"""
             CREATE POLICY {policy} ON {table} FOR SELECT 
             USING (
@@ -160,8 +512,7 @@ async def enable_rls(database: Database, table: str) -> None:
             );
             """
         # Join-based filtering for tables without fleet_id
-        elif table in ["alerts", "geofence_events", "maintenance_logs", "battery_cycles", 
-                    "raw_telemetry", "processed_metrics", "charging_sessions", "trips"]:
+        elif table in VEHICLE_KEYED_TABLES:
             # Tables that reference vehicles
             policy_sql = f"""
             CREATE POLICY {policy} ON {table} FOR SELECT 
@@ -202,28 +553,71 @@ async def enable_rls(database: Database, table: str) -> None:
         raise RuntimeError(f"Failed to enable RLS on table {table}: {e}")
 
 
-async def create_table(database: Database, table: str, ddl: str, drop_existing: bool = False) -> None:
+async def has_legacy_partitioning(database: Database, table: str) -> bool:
+    """Whether a partitioned table still exists with the old per-vehicle LIST layout."""
+    if table not in PARTITIONED_TABLES:
+        return False
+    result = await database.fetch_one(
+        query="""
+            SELECT p.partstrat FROM pg_partitioned_table p
+            JOIN pg_class c ON c.oid = p.partrelid
+            WHERE c.relname = :table AND c.relnamespace = 'public'::regnamespace
+        """,
+        values={"table": table}
+    )
+    if result is not None and result[0] != "r":
+        print(f"Table '{table}' uses the old partition layout, recreating it")
+        return True
+    return False
+
+
+async def create_table(
+    database: Database,
+    table: str,
+    ddl: str,
+    drop_existing: bool = False,
+    denormalize_fleet_id: bool = DENORMALIZE_FLEET_ID
+) -> None:
     """Create a single table with optional RLS setup."""
     print(f"Creating table '{table}'...")
     try:
-        if drop_existing:
+        if drop_existing or await has_legacy_partitioning(database, table):
             await database.execute(text(f"DROP TABLE IF EXISTS {table} CASCADE"))
 
         # Create table
         await database.execute(text(ddl))
 
+        if denormalize_fleet_id and table in FLEET_ID_SOURCES:
+            await add_denormalized_fleet_id(database, table)
+
         # Enable RLS on ALL tables (not just those with fleet_id)
-        await enable_rls(database, table)
+        await enable_rls(database, table, denormalize_fleet_id)
 
     except Exception as e:
         raise RuntimeError(f"Failed to create table {table}: {e}")
 
 
-async def setup_database_schema_with_RLS(database: Database, drop_existing: bool = False) -> None:
+async def setup_database_schema_with_RLS(
+    database: Database,
+    drop_existing: bool = False,
+    denormalize_fleet_id: bool = DENORMALIZE_FLEET_ID
+) -> None:
     """Set up the complete database schema with tables and RLS policies."""
     print("\nSetting up database schema...")
 
     for table, ddl in CREATE_TABLE_QUERIES.items():
-        await create_table(database, table, ddl, drop_existing)
+        await create_table(database, table, ddl, drop_existing, denormalize_fleet_id)
+
+    if denormalize_fleet_id:
+        await propagate_fleet_id_changes(database)
+
+    for table, ddl in LATEST_STATE_TABLE_QUERIES.items():
+        await create_table(database, table, ddl, drop_existing, denormalize_fleet_id)
+    await maintain_latest_state(database)
+
+    for table, ddl in ROLLUP_TABLE_QUERIES.items():
+        await create_table(database, table, ddl, drop_existing, denormalize_fleet_id)
+
+    await announce_data_changes(database)
 
     print("✅ Database schema setup complete!")
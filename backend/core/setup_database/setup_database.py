@@ -4,15 +4,16 @@ from databases import Database
 from typing import Optional
 import os
 
-from core.setup_database.schema import setup_database_schema_with_RLS
-from core.setup_database.roles import RoleManager
+from core.setup_database.schema import setup_database_schema_with_RLS, DENORMALIZE_FLEET_ID
+from core.setup_database.roles import RoleManager, APP_ROLES
 from core.db_con import database
 
 
 async def main(
     drop_existing: bool = False,
     database: Optional[Database] = database,
-    database_name: Optional[str] = None
+    database_name: Optional[str] = None,
+    denormalize_fleet_id: bool = DENORMALIZE_FLEET_ID
 ) -> None:
     """Set up database schema and set up roles."""
     try:
@@ -31,11 +32,11 @@ async def main(
         await database.connect()
 
         await setup_database_schema_with_RLS(
-            database, drop_existing
+            database, drop_existing, denormalize_fleet_id
         )
 
         await RoleManager().setup_roles(
-            database, database_name, ["superuser", "end_user"]
+            database, database_name, APP_ROLES
         )
 
     except Exception as e:
@@ -48,9 +49,15 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Initialize database schema.")
     parser.add_argument("--drop-existing", action="store_true", help="Drop existing tables")
     parser.add_argument("--database-name", help="Database name to use")
+    parser.add_argument("--denormalize-fleet-id", action="store_true", default=DENORMALIZE_FLEET_ID,
+                        help="Carry an indexed fleet_id on vehicle-keyed tables for equality RLS policies")
     args = parser.parse_args()
 
-    asyncio.run(main(args.drop_existing, database_name=args.database_name))
+    asyncio.run(main(
+        args.drop_existing,
+        database_name=args.database_name,
+        denormalize_fleet_id=args.denormalize_fleet_id
+    ))
 
 
 
@@ -1,12 +1,39 @@
+import asyncio
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import RedirectResponse
 
 from routes.chat.chat import chat_router
 from routes.auth.auth import auth_router
+from core.cache import listen_for_data_changes
+from core.db_con import engine
+from core.llm_agent.schema_catalog import warm_schema_catalog
+from core.llm_agent.query_cache import query_cache, current_schema_version
+from core.setup_database.rollups import ROLLUP_REFRESH_INTERVAL_SEC, refresh_rollups_periodically
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Build the schema snapshot once, off the request path
+    await asyncio.to_thread(warm_schema_catalog)
+    # Cached SQL from an older schema can never hit again
+    purged = await asyncio.to_thread(lambda: query_cache.purge_stale(current_schema_version()))
+    print(f"Query cache: purged {purged} stale entries")
+    # Drop cached results when imports or other processes change the data
+    listener = asyncio.create_task(listen_for_data_changes(engine))
+    # Keep the rollup tables fresh between imports
+    refresher = None
+    if ROLLUP_REFRESH_INTERVAL_SEC > 0:
+        refresher = asyncio.create_task(refresh_rollups_periodically(ROLLUP_REFRESH_INTERVAL_SEC))
+    yield
+    listener.cancel()
+    if refresher:
+        refresher.cancel()
 
 
 app = FastAPI(
+    lifespan=lifespan,
     title="GenAI SQL Backend API",
     description="A FastAPI backend for GenAI SQL operations with chat, authentication, and database management",
     version="1.0.0",
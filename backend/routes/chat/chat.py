@@ -1,12 +1,21 @@
 from pydantic import BaseModel
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from langchain_core.messages import ToolMessage
 import asyncio
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 from datetime import datetime 
 
 from routes.utils import get_user_info
 from core.llm_agent.utils import get_model_config
-from core.llm_agent.agent_manager import get_or_create_agent_for_fleet
+from core.llm_agent.agent_manager import get_or_create_agent_for_fleet, get_agent_cache_stats
+from core.llm_agent.agent import AGENT_TOPOLOGIES
+from core.llm_agent.schema_catalog import schema_catalog
+from core.llm_agent.query_cache import query_cache
+from core.llm_agent.result_cache import result_cache
+from core.llm_agent.results import result_registry, RESULT_FORMATS
+from core.cache import notify_data_changed
+from routes.chat.events import stream_agent_events
 
 
 chat_router = APIRouter(prefix="/chat", tags=["Chat"])
@@ -14,6 +23,24 @@ chat_router = APIRouter(prefix="/chat", tags=["Chat"])
 class ChatRequest(BaseModel):
     messages: List[Dict[str, Any]] 
     query: str  # For frontend latest query
+    topology: Optional[str] = None  # "multi_step" or "single_shot"; None uses AGENT_TOPOLOGY
+
+
+class InvalidateRequest(BaseModel):
+    tables: Optional[List[str]] = None  # None invalidates everything
+
+
+def check_topology(req: ChatRequest) -> None:
+    if req.topology is not None and req.topology not in AGENT_TOPOLOGIES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown topology '{req.topology}', expected one of {AGENT_TOPOLOGIES}"
+        )
+
+
+def latest_messages(req: ChatRequest) -> List[Dict[str, Any]]:
+    """Only use the latest user message for the agent, to save time."""
+    return [req.messages[-1]] if req.messages else []
 
 
 @chat_router.post("/execute_user_query")
@@ -25,26 +52,22 @@ async def execute_user_query(req: ChatRequest, user_info: dict = Depends(get_use
     print(f"[TS] {datetime.now()} - Start execute_user_query" ) 
     user = user_info["user"]
     fleet_id = user_info["fleet_id"]
+    check_topology(req)
 
     try:
         # Get cached agent with fresh fleet context
         print(f"[TS] {datetime.now()} - Getting agent for fleet {fleet_id}, user {user}")
-        agent = await get_or_create_agent_for_fleet(fleet_id, user)
+        agent = await get_or_create_agent_for_fleet(fleet_id, user, topology=req.topology)
         print(f"[TS] {datetime.now()} - Agent obtained successfully")
 
-        # Only use the latest user message for the agent, to save time
-        if req.messages:
-            latest_message = req.messages[-1]
-            messages = [latest_message]
-        else:
-            messages = []
+        messages = latest_messages(req)
 
         # Run LLM agent with timeout
         steps = []
-        print(f"[TS] {datetime.now()} - Before agent.stream" )  # TIMESTAMPED LOG
+        print(f"[TS] {datetime.now()} - Before agent.astream" )  # TIMESTAMPED LOG
         async with asyncio.timeout(get_model_config()["timeout"]):
-            for step in agent.stream({"messages": messages}, stream_mode="values"):
-                print(f"[TS] {datetime.now()} - Step received from agent.stream" )  # TIMESTAMPED LOG
+            async for step in agent.astream({"messages": messages}, stream_mode="values"):
+                print(f"[TS] {datetime.now()} - Step received from agent.astream" )  # TIMESTAMPED LOG
                 step["messages"][-1].pretty_print()
                 steps.append(step)
                 print()
@@ -57,8 +80,13 @@ async def execute_user_query(req: ChatRequest, user_info: dict = Depends(get_use
 
         # Final LLM output (may include intermediate tool call messages)
         final_response = steps[-1]["messages"][-1].content
+        # Full query results are downloaded separately; the LLM only saw a sample
+        results = [
+            m.artifact for m in steps[-1]["messages"]
+            if isinstance(m, ToolMessage) and m.artifact
+        ]
         print(f"[TS] {datetime.now()} - Returning response to client" )  # TIMESTAMPED LOG
-        return {"response": final_response}
+        return {"response": final_response, "results": results}
 
     except asyncio.TimeoutError as e:
         print(f"[TS] {datetime.now()} - Timeout error: {e}")
@@ -74,12 +102,81 @@ async def execute_user_query(req: ChatRequest, user_info: dict = Depends(get_use
         raise HTTPException(
             status_code=500, detail=f"Failed to run LLM agent: {e}"
         )
-    
-
-
-
 
 
+@chat_router.post("/execute_user_query/stream")
+async def stream_user_query(req: ChatRequest, user_info: dict = Depends(get_user_info)):
+    """
+    Streaming variant of execute_user_query. Sends Server-Sent Events as the agent
+    progresses (tables, sql, rows), then the answer tokens and the final answer.
+    """
+    print(f"\n\n{'='*60} NEW STREAMED QUERY {'='*60}\n\n")
+    user = user_info["user"]
+    fleet_id = user_info["fleet_id"]
+    check_topology(req)
 
+    try:
+        agent = await get_or_create_agent_for_fleet(fleet_id, user, topology=req.topology)
+    except Exception as e:
+        raise HTTPException(
+            status_code=500, detail=f"Failed to create LLM agent: {e}"
+        )
 
-   
+    return StreamingResponse(
+        stream_agent_events(agent, latest_messages(req)),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@chat_router.get("/results/{result_id}")
+async def download_result(
+    result_id: str,
+    format: str = Query("csv", description="csv or jsonl"),
+    offset: int = Query(0, ge=0),
+    limit: Optional[int] = Query(None, ge=1, description="Rows per page; all rows if omitted"),
+    user_info: dict = Depends(get_user_info),
+):
+    """
+    Download a query result referenced from a chat response, as CSV or JSON lines.
+    The query is re-run for the requesting tenant and streamed from a server-side
+    cursor, one page at a time with offset/limit.
+    """
+    if format not in RESULT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unknown format '{format}', expected one of {list(RESULT_FORMATS)}")
+    result = result_registry.get(result_id)
+    # Results belong to the tenant that produced them
+    if result is None or (result.role, result.fleet_id) != (user_info["user"], str(user_info["fleet_id"])):
+        raise HTTPException(status_code=404, detail="Result not found or expired")
+
+    return StreamingResponse(
+        result_registry.iter_download(result, format, offset, limit),
+        media_type=RESULT_FORMATS[format],
+        headers={"Content-Disposition": f'attachment; filename="result_{result_id}.{format}"'},
+    )
+
+
+@chat_router.get("/cache_stats")
+async def cache_stats(user_info: dict = Depends(get_user_info)):
+    """Hit/miss/eviction counters for the in-process caches."""
+    if user_info["user"] != "superuser":
+        raise HTTPException(status_code=403, detail="Only superuser may read cache stats")
+    return {
+        "agents": get_agent_cache_stats(),
+        "schema_catalog": schema_catalog.stats(),
+        "query_cache": query_cache.stats(),
+        "result_cache": result_cache.stats(),
+        "result_links": result_registry.stats(),
+    }
+
+
+@chat_router.post("/invalidate_caches")
+async def invalidate_caches(req: InvalidateRequest, user_info: dict = Depends(get_user_info)):
+    """
+    Invalidation hook for out-of-process data changes (e.g. a CLI import):
+    drops cached schema and data derived from the given tables.
+    """
+    if user_info["user"] != "superuser":
+        raise HTTPException(status_code=403, detail="Only superuser may invalidate caches")
+    notify_data_changed(req.tables)
+    return {"invalidated": req.tables or "all"}
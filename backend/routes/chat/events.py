@@ -0,0 +1,93 @@
+import json
+import asyncio
+from datetime import datetime
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from langchain_core.messages import AIMessageChunk, ToolMessage
+
+from core.llm_agent.utils import get_model_config, count_result_rows, FINAL_ANSWER_TAG
+
+
+def format_sse(event: str, data: Dict[str, Any]) -> str:
+    """Format a single Server-Sent Event frame."""
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+def node_events(node: str, update: Optional[Dict[str, Any]]) -> List[tuple[str, Dict[str, Any]]]:
+    """Translate one node's state update into client-facing progress events."""
+    if not update or not update.get("messages"):
+        return []
+
+    last_message = update["messages"][-1]
+    tool_calls = getattr(last_message, "tool_calls", None) or []
+
+    if node == "call_get_schema" and tool_calls:
+        table_names = tool_calls[0]["args"].get("table_names", "")
+        if isinstance(table_names, str):
+            table_names = [t.strip() for t in table_names.split(",") if t.strip()]
+        return [("tables", {"tables": list(dict.fromkeys(table_names))})]
+
+    if node == "check_query" and tool_calls:
+        return [("sql", {"query": tool_calls[0]["args"].get("query", ""), "cached": False})]
+
+    if node == "fast_path" and last_message.additional_kwargs.get("template"):
+        return [
+            ("sql", {"query": last_message.additional_kwargs["query"], "cached": False,
+                     "template": last_message.additional_kwargs["template"]}),
+            ("answer", {"response": last_message.content}),
+        ]
+
+    if node == "lookup_cached_query" and tool_calls:
+        return [("sql", {"query": tool_calls[0]["args"].get("query", ""), "cached": True})]
+
+    if node == "generate_sql" and tool_calls:
+        return [
+            ("tables", {"tables": last_message.additional_kwargs.get("tables", [])}),
+            ("sql", {"query": tool_calls[0]["args"].get("query", ""), "cached": False}),
+        ]
+
+    if node == "run_query" and isinstance(last_message, ToolMessage):
+        # The artifact carries the full row count and download link; content may be a sample
+        result = last_message.artifact or {}
+        row_count = result.get("row_count", count_result_rows(last_message.content))
+        return [("rows", {"row_count": row_count, "result": result or None})]
+
+    if node in ("generate_query", "generate_sql", "answer") and not tool_calls:
+        return [("answer", {"response": last_message.content})]
+
+    return []
+
+
+async def stream_agent_events(agent, messages: List[Dict[str, Any]]) -> AsyncIterator[str]:
+    """
+    Run the agent and yield SSE frames as the graph progresses:
+    start -> tables -> sql -> rows -> token* -> answer -> done (or error).
+    """
+    yield format_sse("start", {"ts": datetime.now().isoformat()})
+
+    try:
+        async with asyncio.timeout(get_model_config()["timeout"]):
+            async for mode, payload in agent.astream(
+                {"messages": messages}, stream_mode=["updates", "messages"]
+            ):
+                if mode == "messages":
+                    chunk, metadata = payload
+                    if (
+                        isinstance(chunk, AIMessageChunk)
+                        and chunk.content
+                        and FINAL_ANSWER_TAG in metadata.get("tags", [])
+                    ):
+                        yield format_sse("token", {"text": chunk.content})
+                    continue
+
+                for node, update in payload.items():
+                    for event, data in node_events(node, update):
+                        yield format_sse(event, data)
+
+        yield format_sse("done", {"ts": datetime.now().isoformat()})
+
+    except asyncio.TimeoutError:
+        yield format_sse("error", {"detail": "Request timed out while waiting for LLM agent"})
+    except Exception as e:
+        print(f"[TS] {datetime.now()} - Exception in agent stream: {e}")
+        yield format_sse("error", {"detail": f"Failed to run LLM agent: {e}"})
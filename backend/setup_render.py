@@ -49,18 +49,30 @@ def check_database_setup():
 def main():
     print("Setting up database...")
 
-    # Setup tables, roles with RLS
+    # Setup tables, roles with RLS (existing tables and data are kept)
     run_command(
-        "python -m core.setup_database.setup_database --drop-existing --database-name genai_sql_2_postgres",
+        "python -m core.setup_database.setup_database --database-name genai_sql_2_postgres",
         "Database setup"
     )
 
-    # Seed data
+    # Seed data, loading only rows that are new or changed since the last boot
     run_command(
-        "python -m core.setup_database.import_data --csv-dir ./data",
+        "python -m core.setup_database.import_data --csv-dir ./data --mode incremental",
         "Database seeding"
     )
 
+    # Create upcoming telemetry partitions and retire expired ones
+    run_command(
+        "python -m core.setup_database.partitions",
+        "Partition maintenance"
+    )
+
+    # Indexes and fresh planner statistics for the loaded data
+    run_command(
+        "python -m core.setup_database.optimize",
+        "Post-load optimization"
+    )
+
     # Start server
     print("\n\nStarting Uvicorn server on 0.0.0.0:8000...")
     uvicorn.run("main:app", host="0.0.0.0", port=8000)
@@ -0,0 +1,7 @@
+import os
+import sys
+
+# Unit tests import backend modules directly. None of them connects on import,
+# but core.db_con needs a URL to build its (lazy) engine.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DATABASE_URL", "postgresql+psycopg2://localhost/unit_tests")
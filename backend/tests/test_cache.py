@@ -0,0 +1,107 @@
+import asyncio
+
+import pytest
+
+from core import cache as cache_module
+from core.cache import TTLCache
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(cache_module.time, "monotonic", clock)
+    return clock
+
+
+def test_lru_eviction():
+    cache = TTLCache("test", maxsize=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1  # a is now the most recently used
+    cache.set("c", 3)
+    assert "b" not in cache
+    assert cache.get("a") == 1 and cache.get("c") == 3
+    assert cache.evictions == 1
+
+
+def test_ttl_expiry(clock):
+    cache = TTLCache("test", ttl=10)
+    cache.set("a", 1)
+    cache.set("b", 2, ttl=100)
+    clock.now += 11
+    assert cache.get("a") is None
+    assert cache.get("b") == 2
+    assert cache.expirations == 1
+
+
+def test_weight_bound_evicts_oldest():
+    cache = TTLCache("test", maxsize=10, weigher=len, max_weight=10)
+    cache.set("a", "xxxx")
+    cache.set("b", "yyyy")
+    cache.set("c", "zzzz")
+    assert "a" not in cache
+    assert cache.weight == 8
+    cache.pop("b")
+    assert cache.weight == 4
+
+
+def test_oversized_value_is_kept_alone():
+    cache = TTLCache("test", weigher=len, max_weight=3)
+    cache.set("a", "xxxxxx")
+    assert cache.get("a") == "xxxxxx"
+
+
+def test_invalidate_predicate():
+    cache = TTLCache("test")
+    for key in ("fleet1:a", "fleet1:b", "fleet2:a"):
+        cache.set(key, key)
+    assert cache.invalidate(lambda key, _: key.startswith("fleet1")) == 2
+    assert cache.values() == ["fleet2:a"]
+
+
+def test_hit_rate_stats():
+    cache = TTLCache("test")
+    cache.set("a", 1)
+    cache.get("a")
+    cache.get("missing")
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["hit_rate"]) == (1, 1, 0.5)
+
+
+def test_get_or_create_coalesces_concurrent_builds():
+    cache = TTLCache("test")
+    builds = []
+
+    async def build():
+        builds.append(1)
+        await asyncio.sleep(0.01)
+        return "value"
+
+    async def main():
+        return await asyncio.gather(*(cache.get_or_create("k", build) for _ in range(5)))
+
+    assert asyncio.run(main()) == ["value"] * 5
+    assert len(builds) == 1
+    assert cache.coalesced == 4
+
+
+def test_get_or_create_failure_is_not_cached():
+    cache = TTLCache("test")
+
+    async def fail():
+        raise RuntimeError("boom")
+
+    async def succeed():
+        return "ok"
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(cache.get_or_create("k", fail))
+    assert asyncio.run(cache.get_or_create("k", succeed)) == "ok"
@@ -0,0 +1,117 @@
+import csv
+import gzip
+import io
+
+import pytest
+
+from core.setup_database.schema import APPEND_ONLY_TABLES, get_table_dependencies, get_primary_keys
+from core.setup_database.import_data import (
+    critical_path_seconds, encode_csv_chunks, find_csv_path, open_csv, collect_keys, parse_command_count,
+    build_merge_query, supports_incremental
+)
+
+
+def test_table_dependencies_follow_foreign_keys():
+    dependencies = get_table_dependencies()
+    assert dependencies["fleets"] == []
+    assert dependencies["vehicles"] == ["fleets"]
+    assert dependencies["driver_trip_map"] == ["drivers", "trips"]
+    # No foreign key, but their fleet_id is filled from vehicles on insert
+    assert dependencies["raw_telemetry"] == ["vehicles"]
+    assert dependencies["processed_metrics"] == ["vehicles"]
+
+
+def test_table_dependencies_are_acyclic():
+    dependencies = get_table_dependencies()
+    done = set()
+    while len(done) < len(dependencies):
+        ready = {t for t, deps in dependencies.items() if t not in done and set(deps) <= done}
+        assert ready, f"cycle among {set(dependencies) - done}"
+        done |= ready
+
+
+def test_critical_path_is_longest_dependent_chain():
+    timings = {"fleets": 1.0, "vehicles": 2.0, "trips": 3.0, "drivers": 1.0, "driver_trip_map": 0.5,
+               "raw_telemetry": 5.0}
+    # fleets -> vehicles -> raw_telemetry
+    assert critical_path_seconds(timings) == pytest.approx(8.0)
+
+
+def test_critical_path_ignores_tables_not_loaded():
+    assert critical_path_seconds({"vehicles": 2.0, "trips": 3.0}) == pytest.approx(5.0)
+    assert critical_path_seconds({}) == 0.0
+
+
+def test_csv_chunks_round_trip_and_stay_bounded():
+    rows = [[str(i), f"name, with comma {i}", 'quote "q"'] for i in range(1000)]
+    chunks = list(encode_csv_chunks(iter(rows), chunk_bytes=1024))
+    assert len(chunks) > 1
+    assert all(len(chunk) < 1024 + 100 for chunk in chunks)
+    assert list(csv.reader(io.StringIO(b"".join(chunks).decode()))) == rows
+
+
+def test_csv_chunks_of_nothing():
+    assert list(encode_csv_chunks(iter([]))) == []
+
+
+def test_find_and_open_gzip_csv(tmp_path):
+    with gzip.open(tmp_path / "vehicles.csv.gz", "wt", newline="") as f:
+        f.write("vehicle_id,model\n1,SRM T3\n")
+    csv_path = find_csv_path(str(tmp_path), "vehicles")
+    assert csv_path.endswith("vehicles.csv.gz")
+    with open_csv(csv_path) as f:
+        assert list(csv.reader(f)) == [["vehicle_id", "model"], ["1", "SRM T3"]]
+    assert find_csv_path(str(tmp_path), "trips") is None
+
+
+def test_collect_keys_passes_rows_through():
+    keys = set()
+    rows = [["2025-01-01T00:00:00", "1"], ["2025-02-03T10:00:00", "2"]]
+    assert list(collect_keys(iter(rows), 0, keys, key=lambda v: v[:7])) == rows
+    assert keys == {"2025-01", "2025-02"}
+
+
+def test_parse_command_count():
+    assert parse_command_count("COPY 1000") == 1000
+    assert parse_command_count("INSERT 0 42") == 42
+
+
+def test_primary_keys_from_table_definitions():
+    primary_keys = get_primary_keys()
+    assert primary_keys["vehicles"] == ["vehicle_id"]
+    assert primary_keys["trips"] == ["trip_id"]
+    assert "raw_telemetry" not in primary_keys
+
+
+def test_supports_incremental():
+    assert supports_incremental("raw_telemetry")  # Append-only, by ts watermark
+    assert supports_incremental("vehicles")  # Upsert on the primary key
+    assert not supports_incremental("driver_trip_map")
+
+
+def test_merge_append_only_table_takes_rows_past_each_vehicles_watermark():
+    assert build_merge_query("raw_telemetry", ["ts", "vehicle_id"], "staging AS s", watermark=True) == (
+        'INSERT INTO "raw_telemetry" AS t ("ts", "vehicle_id") SELECT "ts", "vehicle_id" FROM staging AS s '
+        'WHERE NOT EXISTS (SELECT 1 FROM "raw_telemetry" w WHERE w."vehicle_id" = s."vehicle_id" AND w."ts" >= s."ts")'
+    )
+
+
+def test_keyed_tables_are_upserted_rather_than_watermarked():
+    # A watermark would drop updates to older rows, e.g. an alert being resolved
+    assert not set(APPEND_ONLY_TABLES) & set(get_primary_keys())
+    assert supports_incremental("alerts")
+
+
+def test_merge_keyed_table_upserts_only_changed_rows():
+    assert build_merge_query("vehicles", ["vehicle_id", "model", "make"], "staging", watermark=False) == (
+        'INSERT INTO "vehicles" AS t ("vehicle_id", "model", "make") SELECT "vehicle_id", "model", "make" '
+        'FROM staging ON CONFLICT ("vehicle_id") DO UPDATE SET "model" = EXCLUDED."model", '
+        '"make" = EXCLUDED."make" WHERE ROW(t."model", t."make") IS DISTINCT FROM ROW(EXCLUDED."model", '
+        'EXCLUDED."make")'
+    )
+
+
+def test_merge_key_only_rows_are_skipped_on_conflict():
+    assert build_merge_query("fleets", ["fleet_id"], "staging", watermark=False) == (
+        'INSERT INTO "fleets" AS t ("fleet_id") SELECT "fleet_id" FROM staging ON CONFLICT ("fleet_id") DO NOTHING'
+    )
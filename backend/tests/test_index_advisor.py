@@ -0,0 +1,47 @@
+from core.setup_database.index_advisor import MAX_IDENTIFIER_LENGTH, Candidate, extract_candidates
+
+
+SCHEMA = {
+    "vehicles": {"vehicle_id": "TEXT", "fleet_id": "TEXT", "model": "TEXT", "registration_no": "TEXT"},
+    "trips": {"trip_id": "TEXT", "vehicle_id": "TEXT", "start_ts": "TIMESTAMP", "distance_km": "DOUBLE PRECISION"},
+}
+
+
+def test_equality_then_range_columns():
+    sql = "SELECT trip_id FROM trips WHERE vehicle_id = '1' AND start_ts > '2025-01-01' ORDER BY start_ts"
+    assert extract_candidates(sql, SCHEMA) == {
+        ("trips", ("vehicle_id",)),
+        ("trips", ("vehicle_id", "start_ts")),
+    }
+
+
+def test_join_keys_are_equality_columns():
+    sql = ("SELECT v.registration_no, SUM(t.distance_km) FROM trips t "
+           "JOIN vehicles v ON v.vehicle_id = t.vehicle_id WHERE v.model = 'SRM T3' GROUP BY 1")
+    assert extract_candidates(sql, SCHEMA) == {
+        ("trips", ("vehicle_id",)),
+        ("vehicles", ("model", "vehicle_id")),
+    }
+
+
+def test_unparseable_or_unknown_sql_gives_no_candidates():
+    assert extract_candidates("SELECT FROM WHERE", SCHEMA) == set()
+    assert extract_candidates("SELECT 1", SCHEMA) == set()
+
+
+def test_candidate_names_fit_postgres_identifiers():
+    short = Candidate("vehicles", ("fleet_id",))
+    assert short.name == "vehicles_fleet_id_advised_idx"
+
+    long_a = Candidate("vehicle_daily_battery_temp", ("vehicle_id", "date", "max_batt_temp_c"))
+    long_b = Candidate("vehicle_daily_battery_temp", ("vehicle_id", "date", "min_batt_temp_c"))
+    assert len(long_a.name) <= MAX_IDENTIFIER_LENGTH
+    assert long_a.name.endswith("_advised_idx")
+    assert long_a.name != long_b.name
+    assert long_a.name == Candidate("vehicle_daily_battery_temp", ("vehicle_id", "date", "max_batt_temp_c")).name
+
+
+def test_candidate_ddl():
+    assert Candidate("trips", ("vehicle_id", "start_ts")).ddl == (
+        "CREATE INDEX trips_vehicle_id_start_ts_advised_idx ON trips (vehicle_id, start_ts)"
+    )
@@ -0,0 +1,44 @@
+from datetime import date
+
+import pytest
+
+from core.setup_database.partitions import BOUND_PATTERN, bucket_start, parse_day, partition_name, shift_bucket
+
+
+@pytest.mark.parametrize("day, interval, expected", [
+    (date(2025, 5, 13), "monthly", date(2025, 5, 1)),
+    (date(2025, 5, 13), "daily", date(2025, 5, 13)),
+])
+def test_bucket_start(day, interval, expected):
+    assert bucket_start(day, interval) == expected
+
+
+def test_bucket_start_rejects_unknown_interval():
+    with pytest.raises(ValueError):
+        bucket_start(date(2025, 5, 13), "weekly")
+
+
+@pytest.mark.parametrize("start, count, interval, expected", [
+    (date(2025, 11, 1), 2, "monthly", date(2026, 1, 1)),
+    (date(2025, 1, 1), -1, "monthly", date(2024, 12, 1)),
+    (date(2025, 1, 1), -13, "monthly", date(2023, 12, 1)),
+    (date(2024, 2, 28), 2, "daily", date(2024, 3, 1)),
+    (date(2025, 1, 1), -1, "daily", date(2024, 12, 31)),
+])
+def test_shift_bucket(start, count, interval, expected):
+    assert shift_bucket(start, count, interval) == expected
+
+
+def test_partition_name():
+    assert partition_name("raw_telemetry", date(2025, 1, 1), "monthly") == "raw_telemetry_p202501"
+    assert partition_name("raw_telemetry", date(2025, 1, 1), "daily") == "raw_telemetry_p20250101"
+
+
+def test_parse_day():
+    assert parse_day("2025-01-31T23:59:59") == date(2025, 1, 31)
+    assert parse_day("2025-01-31 23:59:59+00") == date(2025, 1, 31)
+
+
+def test_bound_pattern_reads_partition_bounds():
+    bound = "FOR VALUES FROM ('2025-01-01 00:00:00') TO ('2025-02-01 00:00:00')"
+    assert BOUND_PATTERN.search(bound).groups() == ("2025-01-01 00:00:00", "2025-02-01 00:00:00")
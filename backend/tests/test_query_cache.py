@@ -0,0 +1,58 @@
+import pytest
+
+from core.llm_agent.query_cache import QueryCache, normalize_question
+
+
+@pytest.mark.parametrize("question, expected", [
+    ("How many vehicles are currently driving with SOC < 30 %?",
+     "how many vehicles are currently driving with soc<30%"),
+    ("  how many   vehicles are currently driving with soc<30% ", "how many vehicles are currently driving with soc<30%"),
+    ("Did any SRM T3 exceed 33 °C battery temperature in the last 24 h?",
+     "did any srm t3 exceed 33°c battery temperature in the last 24 h"),
+    ("What is the SOC of vehicle GBM6296G right now!", "what is the soc of vehicle gbm6296g right now"),
+    ("Ｆｕｌｌｗｉｄｔｈ question", "fullwidth question"),
+])
+def test_normalize_question(question, expected):
+    assert normalize_question(question) == expected
+
+
+@pytest.fixture
+def query_cache(tmp_path):
+    return QueryCache(path=str(tmp_path / "query_cache.sqlite3"), maxsize=2, ttl=3600)
+
+
+def test_hit_for_equivalent_question(query_cache):
+    query_cache.put("How many SRM T3 EVs are in my fleet?", "2", "v1", "SELECT 1")
+    assert query_cache.get("how many srm t3 evs are in my fleet", "2", "v1") == "SELECT 1"
+
+
+def test_miss_for_other_fleet_or_schema_version(query_cache):
+    query_cache.put("How many SRM T3 EVs are in my fleet?", "2", "v1", "SELECT 1")
+    assert query_cache.get("How many SRM T3 EVs are in my fleet?", "1", "v1") is None
+    assert query_cache.get("How many SRM T3 EVs are in my fleet?", "2", "v2") is None
+
+
+def test_entries_survive_a_restart(tmp_path):
+    path = str(tmp_path / "query_cache.sqlite3")
+    QueryCache(path=path).put("q", "2", "v1", "SELECT 1")
+    assert QueryCache(path=path).get("q", "2", "v1") == "SELECT 1"
+
+
+def test_purge_stale_invalidation_and_clear(query_cache):
+    query_cache.put("a", "2", "v1", "SELECT 1")
+    query_cache.put("b", "2", "v2", "SELECT 2")
+    assert query_cache.purge_stale("v2") == 1
+    assert query_cache.get("a", "2", "v1") is None
+
+    query_cache.invalidate(["vehicles"])  # Data changes keep SQL valid
+    assert query_cache.get("b", "2", "v2") == "SELECT 2"
+    query_cache.invalidate()  # Only the in-memory layer; persisted SQL survives
+    assert query_cache.get("b", "2", "v2") == "SELECT 2"
+    query_cache.clear()
+    assert query_cache.get("b", "2", "v2") is None
+
+
+def test_persisted_entries_are_bounded(query_cache):
+    for i in range(3):
+        query_cache.put(f"q{i}", "2", "v1", f"SELECT {i}")
+    assert query_cache.stats()["persisted"] == 2
@@ -0,0 +1,76 @@
+import pytest
+
+from core.llm_agent.query_guard import apply_row_limit, check_plan, relations
+
+
+@pytest.mark.parametrize("sql, expected", [
+    ("SELECT vehicle_id FROM vehicles", "SELECT vehicle_id FROM vehicles LIMIT 100"),
+    ("SELECT vehicle_id FROM vehicles LIMIT 500", "SELECT vehicle_id FROM vehicles LIMIT 100"),
+    ("SELECT vehicle_id FROM vehicles ORDER BY vehicle_id",
+     "SELECT vehicle_id FROM vehicles ORDER BY vehicle_id LIMIT 100"),
+    ("SELECT vehicle_id FROM vehicles UNION ALL SELECT vehicle_id FROM trips",
+     "SELECT vehicle_id FROM vehicles UNION ALL SELECT vehicle_id FROM trips LIMIT 100"),
+    ("WITH v AS (SELECT vehicle_id FROM vehicles) SELECT vehicle_id FROM v",
+     "WITH v AS (SELECT vehicle_id FROM vehicles) SELECT vehicle_id FROM v LIMIT 100"),
+])
+def test_apply_row_limit_caps(sql, expected):
+    assert apply_row_limit(sql, 100) == (expected, True)
+
+
+@pytest.mark.parametrize("sql", [
+    "SELECT vehicle_id FROM vehicles LIMIT 10",
+    "SELECT vehicle_id FROM vehicles FETCH FIRST 10 ROWS ONLY",
+    "SELECT vehicle_id FROM (SELECT vehicle_id FROM vehicles) AS v LIMIT 100",
+    "not sql at all (",
+])
+def test_apply_row_limit_keeps(sql):
+    assert apply_row_limit(sql, 100) == (sql, False)
+
+
+def test_apply_row_limit_only_touches_outer_query():
+    sql, limited = apply_row_limit(
+        "SELECT vehicle_id FROM (SELECT vehicle_id FROM vehicles LIMIT 5000) AS v", 100
+    )
+    assert limited
+    assert sql == "SELECT vehicle_id FROM (SELECT vehicle_id FROM vehicles LIMIT 5000) AS v LIMIT 100"
+
+
+def scan(table, rows, cost):
+    return {"Node Type": "Seq Scan", "Relation Name": table, "Plan Rows": rows, "Total Cost": cost}
+
+
+def test_check_plan_accepts_cheap_plan():
+    assert check_plan(scan("vehicles", 50, 10.0), max_cost=1e6, max_rows=1e6) is None
+
+
+def test_check_plan_rejects_cross_join():
+    plan = {
+        "Node Type": "Nested Loop", "Plan Rows": 2e8, "Total Cost": 7e6,
+        "Plans": [scan("raw_telemetry_p202501_h0", 1e6, 2e4), scan("vehicles", 200, 5.0)],
+    }
+    rejection = check_plan(plan, max_cost=5e6, max_rows=5e7)
+    assert rejection.startswith("Query rejected before execution")
+    assert "estimated cost 7,000,000 exceeds the limit of 5,000,000" in rejection
+    assert "~200,000,000 rows" in rejection
+    assert "missing join condition" in rejection
+    assert "vehicle_latest_state" in rejection
+
+
+def test_check_plan_limits_can_be_disabled():
+    assert check_plan(scan("raw_telemetry", 1e9, 1e9), max_cost=0, max_rows=0) is None
+
+
+def test_check_plan_reports_largest_step_only_over_rows():
+    plan = {"Node Type": "Hash Join", "Plan Rows": 10, "Total Cost": 100.0, "Join Filter": "x",
+            "Plans": [scan("trips", 1e8, 90.0)]}
+    rejection = check_plan(plan, max_cost=1e6, max_rows=5e7)
+    assert "estimated cost" not in rejection
+    assert "Largest step: Seq Scan over trips" in rejection
+
+
+def test_relations_names_partitions_by_parent():
+    plan = {"Node Type": "Append", "Plans": [
+        scan("raw_telemetry_p202501_h0", 1, 1), scan("raw_telemetry_p202502_h3", 1, 1),
+        scan("vehicle_daily_usage", 1, 1), scan("vehicles", 1, 1),
+    ]}
+    assert relations(plan) == ["raw_telemetry", "vehicle_daily_usage", "vehicles"]
@@ -0,0 +1,37 @@
+from core.llm_agent.result_cache import ResultCache, normalize_sql, referenced_tables
+
+
+TABLES = ["vehicles", "raw_telemetry", "vehicle_latest_state", "trips"]
+
+
+def test_normalize_sql_collapses_whitespace_and_terminator():
+    assert normalize_sql("SELECT  *\n  FROM vehicles ;") == "SELECT * FROM vehicles"
+
+
+def test_normalize_sql_keeps_string_literals():
+    assert normalize_sql("SELECT *  FROM vehicles WHERE model = 'SRM   T3'") == \
+        "SELECT * FROM vehicles WHERE model = 'SRM   T3'"
+    assert normalize_sql("SELECT 'it''s  ok'  FROM trips") == "SELECT 'it''s  ok' FROM trips"
+
+
+def test_referenced_tables_match_whole_words():
+    sql = "SELECT v.registration_no FROM vehicles v JOIN vehicle_latest_state s USING (vehicle_id)"
+    assert referenced_tables(sql, TABLES) == {"vehicles", "vehicle_latest_state"}
+    assert referenced_tables("SELECT trip_id FROM driver_trip_map", TABLES) == frozenset()
+
+
+def test_invalidation_drops_only_entries_reading_changed_tables():
+    cache = ResultCache()
+    cache.put("SELECT * FROM vehicles", "superuser", "2", "[(1,)]", TABLES)
+    cache.put("SELECT * FROM trips", "superuser", "2", "[(2,)]", TABLES)
+    assert cache.invalidate(["vehicles"]) == 1
+    assert cache.get("SELECT * FROM vehicles", "superuser", "2") is None
+    assert cache.get("SELECT  * FROM trips;", "superuser", "2") == "[(2,)]"
+    assert cache.invalidate() == 1
+
+
+def test_entries_are_per_tenant():
+    cache = ResultCache()
+    cache.put("SELECT * FROM vehicles", "superuser", "2", "[(1,)]", TABLES)
+    assert cache.get("SELECT * FROM vehicles", "superuser", "1") is None
+    assert cache.get("SELECT * FROM vehicles", "end_user", "2") is None
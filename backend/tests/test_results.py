@@ -0,0 +1,48 @@
+from core.llm_agent.results import QueryResult, make_result_id, render_row, sample_note, sample_rows
+
+
+def test_small_result_is_rendered_whole():
+    content, shown, total = sample_rows(iter([("a", 1), ("b", 2)]))
+    assert content == "[('a', 1), ('b', 2)]"
+    assert (shown, total) == (2, 2)
+
+
+def test_empty_result():
+    assert sample_rows(iter([])) == ("", 0, 0)
+
+
+def test_sample_stops_at_the_token_budget_but_counts_every_row():
+    rows = (("x" * 30, i) for i in range(10000))
+    content, shown, total = sample_rows(rows, token_budget=100)
+    assert total == 10000
+    assert 0 < shown < 20
+    assert len(content) <= 100 * 4 + 50
+
+
+def test_first_row_is_shown_even_over_budget():
+    content, shown, total = sample_rows(iter([("x" * 1000,), ("y",)]), token_budget=10)
+    assert (shown, total) == (1, 2)
+    assert content.startswith("[('xxx")
+
+
+def test_long_strings_are_truncated():
+    assert len(render_row(("x" * 1000,))) < 400
+
+
+def test_sample_note_states_the_total():
+    note = sample_note(5, 120, ["vehicle_id", "soc_pct"])
+    assert "first 5 of 120 rows" in note
+    assert "vehicle_id, soc_pct" in note
+
+
+def test_result_id_is_stable_per_query_and_tenant():
+    assert make_result_id("SELECT 1", "superuser", "2") == make_result_id("SELECT  1;", "superuser", "2")
+    assert make_result_id("SELECT 1", "superuser", "2") != make_result_id("SELECT 1", "superuser", "1")
+
+
+def test_public_result_hides_sql_and_tenant():
+    result = QueryResult("abc", "SELECT 1", "superuser", "2", ["n"], 5000, 40, truncated=True)
+    assert result.public() == {
+        "result_id": "abc", "columns": ["n"], "row_count": 5000, "sample_rows": 40, "truncated": True,
+        "download_url": "/api/chat/results/abc",
+    }
@@ -0,0 +1,22 @@
+from core.setup_database.rollups import ChangedTables, rollups_for
+
+
+def test_rollups_for_changed_sources():
+    assert rollups_for(["trips"]) == ["vehicle_daily_usage"]
+    assert len(rollups_for(["vehicles"])) == 3
+    assert rollups_for(["drivers", "vehicle_daily_usage"]) == []
+    assert len(rollups_for(None)) == 3
+
+
+def test_changed_tables_start_unknown_then_accumulate():
+    changed = ChangedTables()
+    assert changed.take() is None  # Nothing known at startup: refresh everything
+    assert changed.take() == set()
+
+    changed.add(["trips"])
+    changed.add(["raw_telemetry"])
+    assert changed.take() == {"trips", "raw_telemetry"}
+
+    changed.add(["trips"])
+    changed.add(None)  # A full invalidation, e.g. after a listener reconnect
+    assert changed.take() is None
@@ -0,0 +1,65 @@
+import os
+import time
+
+import pytest
+
+from core.llm_agent.prompts import PromptRegistry
+from core.llm_agent.schema_retriever import MAX_TABLES, SchemaRetriever, is_identifier, tokenize
+
+
+@pytest.fixture(scope="module")
+def retriever():
+    return SchemaRetriever()
+
+
+def test_tokenize_applies_stop_words_stems_and_synonyms():
+    assert tokenize("What is the battery temperature of my EVs?") == ["batt", "temp", "vehicle"]
+    assert tokenize("raw_telemetry trips") == ["raw", "telemetry", "trip"]
+
+
+@pytest.mark.parametrize("token, expected", [("gbm6296g", True), ("1abc", True), ("soc", False), ("30", False)])
+def test_is_identifier(token, expected):
+    assert is_identifier(token) == expected
+
+
+@pytest.mark.parametrize("question, expected", [
+    ("What is the SOC of vehicle GBM6296G right now?", {"vehicles", "vehicle_latest_state"}),
+    ("How many SRM T3 EVs are in my fleet?", {"vehicles"}),
+    ("What is the fleet-wide average SOC comfort zone?", {"fleet_daily_summary"}),
+    ("Which vehicles spent > 20 % time in the 90-100 % SOC band this week?", {"vehicle_daily_soc_band", "vehicles"}),
+    ("What is the total km and driving hours by my fleet over the past 7 days, "
+     "and which are the most-used & least-used vehicles?", {"vehicle_daily_usage", "vehicles"}),
+])
+def test_retrieves_the_tables_a_question_needs(retriever, question, expected):
+    retrieval = retriever.retrieve(question)
+    assert expected <= set(retrieval.tables)
+    assert retrieval.confidence > 0
+
+
+def test_identifier_pulls_in_the_table_that_names_it(retriever):
+    assert "vehicles" in retriever.retrieve("Latest battery temp for GBM6296G").tables
+
+
+def test_unrelated_question_has_no_confidence(retriever):
+    retrieval = retriever.retrieve("Tell me a joke")
+    assert retrieval.tables == [] and retrieval.confidence == 0.0
+
+
+def test_selection_is_bounded(retriever):
+    question = "vehicles trips drivers alerts charging sessions geofence events maintenance battery cycles"
+    # At most MAX_TABLES ranked tables, plus their join partners
+    assert len(retriever.retrieve(question).tables) <= MAX_TABLES * 2
+
+
+def test_semantic_map_edits_are_picked_up(tmp_path):
+    semantic_map = tmp_path / "semantic_map.yaml"
+    semantic_map.write_text("odometer:\n  columns: [raw_telemetry.odo_km]\n  description: Distance driven\n")
+    retriever = SchemaRetriever(PromptRegistry(str(semantic_map)))
+    assert "geofence_events" not in retriever.retrieve("Which depots were visited?").tables
+
+    semantic_map.write_text(
+        "odometer:\n  columns: [raw_telemetry.odo_km]\n  description: Distance driven\n"
+        "depot:\n  columns: [geofence_events.geofence_name]\n  description: Named site a vehicle enters\n"
+    )
+    os.utime(semantic_map, ns=(time.time_ns() + 10**9,) * 2)
+    assert retriever.retrieve("Which depots were visited?").tables[0] == "geofence_events"
@@ -0,0 +1,144 @@
+import pytest
+
+from core.llm_agent.sql_validator import SQLValidator, check_read_only
+
+
+SCHEMA = {
+    "vehicles": {"vehicle_id": "TEXT", "fleet_id": "TEXT", "model": "TEXT", "registration_no": "TEXT"},
+    "raw_telemetry": {"ts": "TIMESTAMP", "vehicle_id": "TEXT", "soc_pct": "DOUBLE PRECISION",
+                      "batt_temp_c": "DOUBLE PRECISION", "speed_kph": "DOUBLE PRECISION"},
+    "alerts": {"alert_id": "INTEGER", "vehicle_id": "TEXT", "resolved": "BOOLEAN"},
+}
+
+
+class Catalog:
+    """The two SchemaCatalog methods the validator reads."""
+
+    def table_names(self):
+        return list(SCHEMA)
+
+    def columns(self, table):
+        return SCHEMA[table]
+
+
+@pytest.fixture
+def validator():
+    return SQLValidator(Catalog())
+
+
+def assert_fixed(result, expected_sql):
+    assert result.ok, result.problems
+    assert result.fixes
+    assert result.sql == expected_sql
+
+
+def test_valid_query_is_unchanged(validator):
+    sql = "SELECT registration_no FROM vehicles WHERE model = 'SRM T3'"
+    result = validator.validate(sql)
+    assert result.ok and not result.fixes
+    assert result.sql == sql
+
+
+def test_null_comparisons(validator):
+    assert_fixed(validator.validate("SELECT vehicle_id FROM vehicles WHERE model = NULL"),
+                 "SELECT vehicle_id FROM vehicles WHERE model IS NULL")
+    assert_fixed(validator.validate("SELECT vehicle_id FROM vehicles WHERE model <> NULL"),
+                 "SELECT vehicle_id FROM vehicles WHERE NOT model IS NULL")
+
+
+def test_not_in_list_drops_null(validator):
+    assert_fixed(validator.validate("SELECT vehicle_id FROM vehicles WHERE model NOT IN ('a', NULL)"),
+                 "SELECT vehicle_id FROM vehicles WHERE NOT model IN ('a')")
+
+
+def test_not_in_plain_subquery_filters_nulls(validator):
+    assert_fixed(
+        validator.validate(
+            "SELECT registration_no FROM vehicles WHERE vehicle_id NOT IN "
+            "(SELECT vehicle_id FROM raw_telemetry WHERE speed_kph > 0)"
+        ),
+        "SELECT registration_no FROM vehicles WHERE NOT vehicle_id IN "
+        "(SELECT vehicle_id FROM raw_telemetry WHERE speed_kph > 0 AND NOT vehicle_id IS NULL)",
+    )
+
+
+@pytest.mark.parametrize("subquery", [
+    "SELECT MAX(vehicle_id) FROM raw_telemetry GROUP BY ts",
+    "SELECT MAX(vehicle_id) FROM raw_telemetry",
+    "SELECT vehicle_id FROM raw_telemetry GROUP BY vehicle_id",
+    "SELECT DISTINCT vehicle_id FROM raw_telemetry",
+    "SELECT vehicle_id FROM raw_telemetry ORDER BY ts LIMIT 5",
+    "SELECT FIRST_VALUE(vehicle_id) OVER (ORDER BY ts) FROM raw_telemetry",
+    "SELECT * FROM (SELECT vehicle_id FROM raw_telemetry) AS t",
+    "SELECT vehicle_id FROM raw_telemetry UNION SELECT vehicle_id FROM alerts",
+])
+def test_not_in_other_subqueries_are_reported_not_rewritten(validator, subquery):
+    sql = f"SELECT registration_no FROM vehicles WHERE vehicle_id NOT IN ({subquery})"
+    result = validator.validate(sql)
+    assert not result.ok
+    assert any("NOT EXISTS" in problem for problem in result.problems)
+    assert not any("NOT IN subquery" in fix for fix in result.fixes)
+
+
+def test_between_reversed_bounds(validator):
+    assert_fixed(validator.validate("SELECT vehicle_id FROM raw_telemetry WHERE soc_pct BETWEEN 80 AND 20"),
+                 "SELECT vehicle_id FROM raw_telemetry WHERE soc_pct BETWEEN 20 AND 80")
+
+
+def test_timestamp_between_dates_becomes_half_open(validator):
+    assert_fixed(
+        validator.validate(
+            "SELECT vehicle_id FROM raw_telemetry WHERE ts BETWEEN '2025-01-01' AND '2025-01-07'"
+        ),
+        "SELECT vehicle_id FROM raw_telemetry WHERE (ts >= '2025-01-01' AND ts < '2025-01-08')",
+    )
+
+
+def test_timestamp_between_with_time_bound_is_kept(validator):
+    sql = "SELECT vehicle_id FROM raw_telemetry WHERE ts BETWEEN '2025-01-01' AND '2025-01-07 12:00'"
+    result = validator.validate(sql)
+    assert result.ok and not result.fixes
+
+
+def test_literal_types(validator):
+    assert_fixed(validator.validate("SELECT vehicle_id FROM raw_telemetry WHERE soc_pct > '30'"),
+                 "SELECT vehicle_id FROM raw_telemetry WHERE soc_pct > 30")
+    assert_fixed(validator.validate("SELECT vehicle_id FROM vehicles WHERE registration_no = 123"),
+                 "SELECT vehicle_id FROM vehicles WHERE registration_no = '123'")
+    assert_fixed(validator.validate("SELECT alert_id FROM alerts WHERE resolved = 1"),
+                 "SELECT alert_id FROM alerts WHERE resolved = TRUE")
+
+
+@pytest.mark.parametrize("sql, problem", [
+    ("SELECT vehicle_id FROM raw_telemetry WHERE soc_pct > 'high'", "Type mismatch"),
+    ("SELECT vehicle_id FROM raw_telemetry WHERE ts > 20250101", "Type mismatch"),
+    ("SELECT vehicle_id FROM raw_telemetry WHERE ts > 'yesterday-ish'", "not a valid date/time"),
+    ("SELECT vehicle_id FROM telemetry", "does not exist"),
+    ("SELECT soc FROM raw_telemetry", "Columns of the tables used"),
+    ("SELECT vehicle_id FROM", "Syntax error"),
+])
+def test_problems_are_reported(validator, sql, problem):
+    result = validator.validate(sql)
+    assert not result.ok
+    assert any(problem in p for p in result.problems), result.problems
+
+
+def test_lock_clause_dropped(validator):
+    assert_fixed(validator.validate("SELECT vehicle_id FROM vehicles FOR UPDATE"),
+                 "SELECT vehicle_id FROM vehicles")
+
+
+@pytest.mark.parametrize("sql", [
+    "DELETE FROM vehicles",
+    "SELECT 1; DROP TABLE vehicles",
+    "SELECT * INTO copy FROM vehicles",
+    "SELECT pg_sleep(10)",
+    "SELECT set_config('app.fleet_id', '1', false)",
+    "WITH d AS (DELETE FROM vehicles RETURNING *) SELECT * FROM d",
+])
+def test_check_read_only_refuses(sql):
+    assert check_read_only(sql) is not None
+
+
+def test_check_read_only_allows_select():
+    assert check_read_only("SELECT COUNT(*) FROM vehicles") is None
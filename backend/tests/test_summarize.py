@@ -0,0 +1,87 @@
+from datetime import datetime
+from decimal import Decimal
+
+import pytest
+
+from core.llm_agent.summarize import ColumnCollector, ResultDigest, column_kind, fmt_number, summarize_result
+
+
+def digest_of(columns, rows):
+    return ResultDigest(columns, [list(col) for col in zip(*rows)])
+
+
+@pytest.mark.parametrize("value, expected", [
+    (1234.5, "1,234.5"),
+    (2.0, "2"),
+    (0.004, "0.004"),
+    (3.55e-15, "0"),
+    (float("nan"), "null"),
+])
+def test_fmt_number(value, expected):
+    assert fmt_number(value) == expected
+
+
+@pytest.mark.parametrize("values, kind", [
+    ([None, 3], "numeric"),
+    ([Decimal("1.5")], "numeric"),
+    ([True, False], "boolean"),
+    ([datetime(2025, 1, 1)], "temporal"),
+    (["a"], "text"),
+    ([None, None], "empty"),
+])
+def test_column_kind(values, kind):
+    assert column_kind(values) == kind
+
+
+def test_collector_keeps_nothing_for_small_results():
+    collector = ColumnCollector(["a", "b"], min_rows=3)
+    rows = [(1, "x"), (2, "y"), (3, "z")]
+    assert list(collector.collect(iter(rows))) == rows
+    assert collector.values is None
+
+
+def test_collector_keeps_every_row_past_min_rows():
+    collector = ColumnCollector(["a", "b"], min_rows=3)
+    rows = [(i, str(i)) for i in range(10)]
+    assert list(collector.collect(iter(rows))) == rows
+    assert collector.values == [list(range(10)), [str(i) for i in range(10)]]
+
+
+def test_column_stats_are_exact_over_all_rows():
+    digest = digest_of(["registration_no", "km"], [(f"V{i}", float(i)) for i in range(1, 101)] + [("V0", None)])
+    rendered = digest.render()
+    assert rendered.startswith("Exact summary over all 101 rows x 2 columns")
+    assert "- km (numeric): sum 5,050, mean 50.5, min 1, median 50.5, max 100, std 28.87, 1 nulls" in rendered
+    assert "- registration_no (text): 101 distinct" in rendered
+
+
+def test_rankings_name_rows_by_label_column():
+    digest = digest_of(["registration_no", "km"], [("A", 5), ("B", 50), ("C", 20), ("D", 1), ("E", None)])
+    assert digest.rankings() == ["- km: highest B (50), C (20), A (5); lowest D (1), A (5), C (20)"]
+
+
+def test_no_rankings_when_labels_repeat():
+    digest = digest_of(["registration_no", "km"], [("A", 5), ("A", 50), ("B", 20)])
+    assert digest.rankings() == []
+
+
+def test_group_totals():
+    rows = [("SRM T3", 10.0), ("SRM T3", 30.0), ("Yutong E12", 5.0), ("Yutong E12", None)]
+    digest = digest_of(["model", "km"], rows)
+    assert digest.group_totals() == [
+        "By model:",
+        "- SRM T3: 2 rows, km sum 40 mean 20",
+        "- Yutong E12: 2 rows, km sum 5 mean 5",
+    ]
+
+
+def test_temporal_and_empty_columns():
+    rows = [(datetime(2025, 1, 2), None), (datetime(2025, 1, 1), None)]
+    stats = digest_of(["ts", "note"], rows).column_stats()
+    assert stats == ["- ts (date/time): from 2025-01-01 00:00:00 to 2025-01-02 00:00:00", "- note: all null"]
+
+
+def test_summarize_result_renders_without_rows():
+    rendered = summarize_result(["vehicle_id", "soc_pct"], [["1", "2"], [40, 60]])
+    assert "soc_pct (numeric): sum 100, mean 50" in rendered
+    assert "'1'" not in rendered  # Rows come from the sample, not the digest
@@ -0,0 +1,93 @@
+from datetime import timedelta
+
+import pytest
+
+from core.llm_agent import templates
+from core.llm_agent.templates import (
+    TEMPLATES, match_template, parse_window, model_count_answer, current_soc_answer, render_sql
+)
+
+
+@pytest.fixture(autouse=True)
+def models(monkeypatch):
+    monkeypatch.setattr(templates, "known_models", lambda: frozenset({"srm t3", "yutong e12"}))
+
+
+@pytest.mark.parametrize("phrase, expected", [
+    ("last 24 h", timedelta(hours=24)),
+    ("the past 3 days", timedelta(days=3)),
+    ("last 2 wk", timedelta(weeks=2)),
+    ("this week", timedelta(weeks=1)),
+    ("today", timedelta(days=1)),
+    ("last 3 fortnights", None),
+])
+def test_parse_window(phrase, expected):
+    assert parse_window(phrase) == expected
+
+
+def test_model_count_matches_known_model():
+    template, params = match_template("How many SRM T3 EVs are in my fleet?")
+    assert template.name == "model_count"
+    assert params == {"model": "srm t3"}
+
+
+@pytest.mark.parametrize("question", [
+    "How many active vehicles are in my fleet?",
+    "How many electric vans are in my fleet?",
+    "How many broken vehicles are in my fleet?",
+    "Did any vehicles exceed 40 C battery temp in the last 3 days?",
+    "Did any electric buses exceed 40 C battery temp in the last 3 days?",
+])
+def test_unknown_model_falls_through_to_the_agent(question):
+    assert match_template(question) is None
+
+
+def test_battery_temp_threshold_params():
+    template, params = match_template("Did any SRM T3 exceed 33 °C battery temperature in the last 24 h?")
+    assert template.name == "battery_temp_threshold"
+    assert params["model"] == "srm t3"
+    assert params["threshold"] == 33.0
+    assert params["window"] == timedelta(hours=24)
+    assert params["window_phrase"] == "in the last 24 h"
+
+
+def test_templates_anchor_windows_on_latest_telemetry():
+    for question in [
+        "Did any SRM T3 exceed 33 °C battery temperature in the last 24 h?",
+        "Which vehicles spent > 20 % time in the 90-100 % SOC band this week?",
+    ]:
+        template, _ = match_template(question)
+        assert templates.LATEST_TS in template.sql
+        assert "now()" not in template.sql.lower()
+
+
+@pytest.mark.parametrize("question", [
+    "What is the SOC of vehicle GBM6296G right now?",
+    "How many vehicles are currently driving with SOC < 30 %?",
+    "What is the fleet-wide average SOC comfort zone?",
+])
+def test_templates_without_model_match(question):
+    assert match_template(question) is not None
+
+
+def test_unrelated_question_does_not_match():
+    assert match_template("Which driver drove the most km last month?") is None
+
+
+def test_model_count_answer():
+    assert model_count_answer({"model": "srm t3"}, [(1,)]) == "There is 1 SRM T3 vehicle in your fleet."
+    assert model_count_answer({"model": "srm t3"}, [(4,)]) == "There are 4 SRM T3 vehicles in your fleet."
+
+
+def test_current_soc_without_such_vehicle_falls_through_to_the_agent():
+    template, params = match_template("What is the SOC of vehicles?")
+    assert template.name == "current_soc"
+    assert current_soc_answer(params, []) is None
+
+
+def test_logged_template_sql_has_its_binds_inlined():
+    template = next(t for t in TEMPLATES if t.name == "battery_temp_threshold")
+    sql = render_sql(template.sql, {"model": "srm t3", "window": timedelta(hours=24), "threshold": 33.0})
+    assert ":model" not in sql and ":window" not in sql and ":threshold" not in sql
+    assert "LOWER(v.model) = 'srm t3'" in sql
+    assert "make_interval(secs=>86400.0)" in sql
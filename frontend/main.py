@@ -11,7 +11,8 @@ from utils import (
     SAMPLE_ANSWERS,
     append_message,
     truncate_text,
-    make_api_call,
+    stream_api_call,
+    fetch_api_text,
     generate_token,
     load_css
 )
@@ -82,21 +83,78 @@ def render_sidebar():
 # ============================================================================
 # CHAT PROCESSING
 # ============================================================================
+def render_download(result: dict, key: str):
+    """Offer the full query result as CSV; it is only fetched from the backend once asked for."""
+    # The answer was written from a sample of the rows; offer all of them
+    if not (result.get("truncated") or result["row_count"] > result["sample_rows"]):
+        return
+    label = "the full result" if result.get("truncated") else f"all {result['row_count']} rows"
+
+    if key not in st.session_state:
+        if not st.button(f"Prepare {label} for download", key=f"{key}_prepare"):
+            return
+        try:
+            st.session_state[key] = fetch_api_text(
+                result["download_url"].lstrip("/"), st.session_state.current_token
+            )
+        except Exception as e:
+            st.error(f"Download failed: {e}")
+            return
+
+    st.download_button(
+        f"Download {label} (CSV)",
+        data=st.session_state[key],
+        file_name=f"result_{result['result_id']}.csv",
+        mime="text/csv",
+        key=f"{key}_button",
+        # Drop the rows from the session once they are downloaded
+        on_click=st.session_state.pop,
+        args=(key, None),
+    )
+
 def process_chat_query(query: str):
-    """Process a chat query and get AI response."""
+    """Process a chat query and render the AI response as it streams in."""
     append_message("human", query)
-    
-    try:
-        with st.spinner("Thinking..."):
+    with st.chat_message("user"):
+        st.markdown(query)
+
+    with st.chat_message("assistant"):
+        status = st.status("Thinking...", expanded=False)
+        answer_box = st.empty()
+        tokens, reply, result = [], None, None
+
+        try:
             token = st.session_state.current_token
-            chat_response = make_api_call("api/chat/execute_user_query", {
+            events = stream_api_call("api/chat/execute_user_query/stream", {
                 "messages": st.session_state.messages,
                 "query": query
             }, token)
-            reply = chat_response["response"]
-            append_message("ai", reply)
-    except Exception as e:
-        st.error(str(e))
+
+            for event, data in events:
+                if event == "tables":
+                    status.write(f"Tables: {', '.join(data['tables'])}")
+                elif event == "sql":
+                    status.code(data["query"], language="sql")
+                elif event == "rows":
+                    status.write(f"Rows returned: {data['row_count']}")
+                    result = data.get("result")
+                elif event == "token":
+                    tokens.append(data["text"])
+                    answer_box.markdown("".join(tokens))
+                elif event == "answer":
+                    reply = data["response"]
+                    answer_box.markdown(reply)
+                elif event == "error":
+                    raise Exception(data["detail"])
+
+            status.update(label="Done", state="complete")
+            reply = reply if reply is not None else "".join(tokens)
+            append_message("ai", reply, result)
+            if result:
+                render_download(result, f"download_{len(st.session_state.messages) - 1}")
+        except Exception as e:
+            status.update(label="Failed", state="error")
+            st.error(str(e))
 
 def handle_pending_question():
     """Handle any pending question from the sidebar."""
@@ -115,18 +173,20 @@ def main():
     
     _ = render_sidebar()
     
+    # Render chat history; new exchanges stream in below it
+    for i, message in enumerate(st.session_state.messages):
+        if message["type"] == "system":
+            continue
+        with st.chat_message("user" if message["type"] == "human" else "assistant"):
+            st.markdown(message["content"])
+            if message.get("result"):
+                render_download(message["result"], f"download_{i}")
+    
     handle_pending_question()
     
     query = st.chat_input("Type your message here...")
     if query:
         process_chat_query(query)
-    
-    # Render chat history
-    for message in st.session_state.messages:
-        if message["type"] == "system":
-            continue
-        with st.chat_message("user" if message["type"] == "human" else "assistant"):
-            st.markdown(message["content"])
 
 if __name__ == "__main__":
     main()
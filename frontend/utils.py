@@ -1,5 +1,6 @@
 import streamlit as st
 import requests
+import json
 import os
 
 # --- Configuration ---
@@ -29,9 +30,12 @@ SAMPLE_ANSWERS = [
 ]
 
 # --- Helpers ---
-def append_message(role, content):
-    """Append a message to the session state messages."""
-    st.session_state.messages.append({"type": role, "content": content})
+def append_message(role, content, result=None):
+    """Append a message to the session state messages, with the query result it was answered from."""
+    message = {"type": role, "content": content}
+    if result:
+        message["result"] = result
+    st.session_state.messages.append(message)
 
 def truncate_text(text, max_length=42):
     """Truncate text to max_length with ellipsis if longer."""
@@ -59,6 +63,54 @@ def make_api_call(endpoint, body=None, token=None, timeout=60):
     except requests.exceptions.RequestException as e:
         raise Exception(f"Request failed: {str(e)}")
 
+def fetch_api_text(endpoint, token=None, timeout=60):
+    """GET a text download (e.g. a CSV query result) from the backend."""
+    headers = {"Authorization": f"Bearer {token}"} if token else {}
+    try:
+        res = requests.get(f"{BASE_URL}/{endpoint}", headers=headers, timeout=timeout)
+        if not res.ok:
+            raise Exception(res.text)
+        return res.text
+    except requests.exceptions.Timeout:
+        raise Exception(f"Request to {endpoint} timed out after {timeout} seconds")
+    except requests.exceptions.RequestException as e:
+        raise Exception(f"Request failed: {str(e)}")
+
+def stream_api_call(endpoint, body=None, token=None, timeout=60):
+    """POST to a Server-Sent-Events endpoint and yield (event, data) pairs as they arrive."""
+    headers = {"Content-Type": "application/json", "Accept": "text/event-stream"}
+    if token:
+        headers["Authorization"] = f"Bearer {token}"
+
+    try:
+        with requests.post(
+            f"{BASE_URL}/{endpoint}",
+            json=body,
+            headers=headers,
+            timeout=timeout,
+            stream=True
+        ) as res:
+            if not res.ok:
+                raise Exception(res.text)
+
+            event, data_lines = "message", []
+            for line in res.iter_lines(decode_unicode=True):
+                if line is None:
+                    continue
+                if line == "":
+                    # Blank line terminates an event
+                    if data_lines:
+                        yield event, json.loads("\n".join(data_lines))
+                    event, data_lines = "message", []
+                elif line.startswith("event:"):
+                    event = line[len("event:"):].strip()
+                elif line.startswith("data:"):
+                    data_lines.append(line[len("data:"):].strip())
+    except requests.exceptions.Timeout:
+        raise Exception(f"Request to {endpoint} timed out after {timeout} seconds")
+    except requests.exceptions.RequestException as e:
+        raise Exception(f"Request failed: {str(e)}")
+
 def generate_token(fleet_id):
     """Generate a new token for the given fleet_id."""
     import time